@@ -1,39 +1,122 @@
-import requests
-import re
 import json
-from typing import Generator, Dict
+import os
+from typing import Generator, Dict, List, Union
+import requests
+from think_parser import ThinkTagParser, split_thinking
+from ollama_session import OllamaSession, get_default_session
+from scheduler import BACKGROUND, Scheduler
+from backend_pool import BackendPool, OllamaBackend
+
+DEFAULT_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434/api")
+
+
+def keep_alive_value(value):
+    """
+    A keep_alive setting as Ollama expects it: a duration string ("30m") stays a string,
+    a number of seconds ("-1", "300") becomes a number, which Ollama does not parse from a string.
+    """
+    if value is None or not str(value).strip():
+        return None
+    value = str(value).strip()
+    for number in (int, float):
+        try:
+            return number(value)
+        except ValueError:
+            pass
+    return value
+
+
+# How long Ollama keeps a model loaded after a call (e.g. "30m", -1 for always); Ollama's default when unset
+OLLAMA_KEEP_ALIVE = keep_alive_value(os.environ.get("OLLAMA_KEEP_ALIVE"))
+
+# Preamble that makes deepseek-r1 wrap its reasoning in <think> tags
+STREAM_PROMPT_PREFIX = "First show your thinking process surrounded by <think> tags, then provide your final answer.\n\nQuestion: "
+
+# Timing fields of Ollama's final stream line, passed on in the "done" chunk
+GENERATION_STATS = ("eval_count", "eval_duration", "prompt_eval_count", "prompt_eval_duration", "total_duration", "load_duration")
+
+
+def generation_stats(data: dict) -> dict:
+    return {key: data[key] for key in GENERATION_STATS if key in data}
+
+
+def with_keep_alive(request: dict) -> dict:
+    """An Ollama request body with OLLAMA_KEEP_ALIVE applied, when it is set"""
+    if OLLAMA_KEEP_ALIVE is not None:
+        request["keep_alive"] = OLLAMA_KEEP_ALIVE
+    return request
+
+
+def session_request(request: dict, context: List[int] = None, keep_alive: Union[str, float] = None) -> dict:
+    """A generate request body continuing a conversation from its Ollama context"""
+    if context:
+        request["context"] = context
+    if keep_alive is not None:
+        request["keep_alive"] = keep_alive
+    return request
+
 
 class OllamaLLM:
-    def __init__(self, model_name="deepseek-r1:7b"):
-        self.base_url = "http://localhost:11434/api"
+    def __init__(self, model_name="deepseek-r1:7b", session: OllamaSession = None, base_url: str = DEFAULT_BASE_URL,
+                 scheduler: Scheduler = None, pool: BackendPool = None):
+        self.base_url = base_url
         self.model_name = model_name
+        # With a backend pool, generate calls are routed across its hosts instead of base_url
+        self.pool = pool
+        # Pooled keep-alive client shared by all Ollama calls unless one is passed in
+        self.session = session or (pool.session if pool else get_default_session())
+        # With a scheduler, generate_response waits for a model slot; streams are scheduled by the caller
+        self.scheduler = scheduler
+
+    def _post_generate(self, request: dict, stream: bool = False, tried: List[OllamaBackend] = None,
+                       prefer: str = None):
+        """
+        POST /generate and return (response, backend). With a pool, connection errors, 5xx
+        and "model not found" responses fail over to the next backend; the caller releases
+        the returned backend once it is done with the response.
+        """
+        if self.pool is None:
+            return self.session.post(f"{self.base_url}/generate", json=request, stream=stream), None
+
+        tried = [] if tried is None else tried
+        while True:
+            backend = self.pool.acquire(self.model_name, exclude=tried, prefer=prefer)
+            tried.append(backend)
+            try:
+                response = self.session.post(f"{backend.base_url}/generate", json=request, stream=stream)
+            except requests.RequestException as e:
+                print(f"Ollama backend {backend.base_url} failed, trying the next one: {str(e)}")
+                self.pool.release(backend, failed=True)
+                continue
+            if response.status_code == 404:
+                self.pool.model_missing(backend, self.model_name)
+            elif response.status_code < 500:
+                return response, backend
+            response.close()
+            self.pool.release(backend, failed=response.status_code >= 500)
 
-    def generate_response(self, prompt: str) -> dict:
+    def generate_response(self, prompt: str, priority: int = BACKGROUND) -> dict:
         """
         Generate a response using the local Ollama model and parse thinking and answer
         """
-        response = requests.post(
-            f"{self.base_url}/generate",
-            json={
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
+        request = with_keep_alive({
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": False
+        })
+        if self.scheduler is None:
+            response, backend = self._post_generate(request)
+        else:
+            with self.scheduler.slot(self.model_name, priority):
+                response, backend = self._post_generate(request)
+        if backend is not None:
+            self.pool.release(backend)
         
         if response.status_code == 200:
             raw_response = response.json()["response"]
             
-            # Parse thinking and answer
-            thinking = ""
-            answer = raw_response
-            
-            # Extract content between <think> tags
-            think_match = re.search(r'<think>(.*?)</think>', raw_response, re.DOTALL)
-            if think_match:
-                thinking = think_match.group(1).strip()
-                # Get everything after </think> tag as the answer
-                answer = raw_response.split('</think>')[-1].strip()
+            # Parse thinking (between <think> tags) and answer (after </think>)
+            thinking, answer = split_thinking(raw_response)
             
             return {
                 "thinking": thinking,
@@ -42,138 +125,89 @@ class OllamaLLM:
         else:
             raise Exception(f"Error generating response: {response.text}")
 
-    def generate_stream(self, prompt: str) -> Generator[Dict, None, None]:
+    def generate_stream(self, prompt: str, context: List[int] = None, keep_alive: Union[str, float] = None,
+                        prefer: str = None) -> Generator[Dict, None, None]:
         """
-        Stream both thinking and answer parts word by word for a smooth live experience
-        """
-        response = requests.post(
-            f"{self.base_url}/generate",
-            json={
-                "model": self.model_name,
-                "prompt": "First show your thinking process surrounded by <think> tags, then provide your final answer.\n\nQuestion: " + prompt,
-                "stream": True
-            },
-            stream=True
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Error generating response: {response.text}")
+        Stream both thinking and answer parts word by word for a smooth live experience.
 
-        accumulated_buffer = ""
-        thinking_complete = False
-        answer_text = ""
-        
-        try:
-            for line in response.iter_lines():
-                if not line:
-                    continue
+        Partial thinking chunks carry only the newly added text in "delta", answer chunks
+        carry the newly added text in "content"; the completed thinking chunk and the
+        final "done" chunk carry the full text. The "done" chunk also carries Ollama's
+        token counts and timings (eval_count, eval_duration, ... in nanoseconds).
+
+        With a context the prompt continues that conversation. The "done" chunk always
+        carries the new "context" and the "base_url" of the backend that holds it, so
+        any answer can start a conversation; prefer routes to that backend again (see sessions).
+        """
+        request = session_request(with_keep_alive({
+            "model": self.model_name,
+            "prompt": STREAM_PROMPT_PREFIX + prompt,
+            "stream": True
+        }), context, keep_alive)
+        tried = []
+        while True:
+            response, backend = self._post_generate(request, stream=True, tried=tried, prefer=prefer)
+            failed = False
+            try:
+                if response.status_code != 200:
+                    raise Exception(f"Error generating response: {response.text}")
 
+                parser = ThinkTagParser()
+                started = False
+                stats = {}
                 try:
-                    data = json.loads(line.decode('utf-8'))
-                except json.JSONDecodeError:
-                    continue
-
-                if "response" not in data:
-                    continue
-
-                token = data["response"]
-                accumulated_buffer += token
-                
-                # Check if this token completes a thinking section
-                if not thinking_complete and "</think>" in accumulated_buffer:
-                    # Fixed regex pattern
-                    think_match = re.search(r'<think>(.*?)</think>', accumulated_buffer, re.DOTALL)
-                    if think_match:
-                        thinking = think_match.group(1).strip()
-                        remaining = accumulated_buffer.split('</think>', 1)[-1].strip()
-                        thinking_complete = True
-                        
-                        yield {
-                            "type": "thinking",
-                            "content": thinking,
-                            "is_complete": True
-                        }
-                        
-                        # If there's any remaining content after the thinking section,
-                        # immediately yield it as the start of the answer
-                        if remaining:
-                            answer_text = remaining
-                            yield {
-                                "type": "answer",
-                                "content": token, # Just send the latest token
-                                "full_answer": answer_text # Include full answer for reference
-                            }
-                        accumulated_buffer = ""
-                
-                # If we're in the thinking section but not complete yet
-                elif not thinking_complete and "<think>" in accumulated_buffer:
-                    # Stream partial thinking updates
-                    if accumulated_buffer.startswith("<think>"):
-                        thinking_content = accumulated_buffer[7:]  # Remove "<think>" prefix
-                    else:
-                        parts = accumulated_buffer.split("<think>", 1)
-                        thinking_content = parts[1] if len(parts) > 1 else ""
-                    
-                    yield {
-                        "type": "thinking",
-                        "content": thinking_content,
-                        "is_complete": False
-                    }
-                
-                # If thinking is complete, stream each token as it comes for answer
-                elif thinking_complete:
-                    answer_text += token  # Add new token to answer
-                    # Send individual token updates for smoother streaming
-                    yield {
-                        "type": "answer",
-                        "content": token,  # Send just the latest token
-                        "full_answer": answer_text  # Include full answer for reference
-                    }
-                
-                # If no thinking tags yet and we've accumulated enough text
-                elif len(accumulated_buffer) > 15 and "<think>" not in accumulated_buffer:
-                    answer_text = accumulated_buffer  # Set this as the answer
-                    yield {
-                        "type": "answer",
-                        "content": token,  # Send just the latest token
-                        "full_answer": answer_text  # Include full answer for reference
-                    }
-                    accumulated_buffer = ""
-            
-            # Final check for any remaining content
-            if accumulated_buffer and not thinking_complete:
-                if "<think>" in accumulated_buffer:
-                    # Fixed regex here too - use safe string splitting instead
-                    parts = accumulated_buffer.split("<think>", 1)
-                    thinking_content = parts[1] if len(parts) > 1 else ""
-                    yield {
-                        "type": "thinking",
-                        "content": thinking_content,
-                        "is_complete": False
-                    }
-                else:
-                    final_token = accumulated_buffer
-                    answer_text += final_token
-                    yield {
-                        "type": "answer",
-                        "content": final_token,  # Send just the latest token
-                        "full_answer": answer_text  # Include full answer for reference
-                    }
-            
-            # Send a final chunk to indicate completion
-            yield {
-                "type": "done",
-                "content": answer_text,  # Include the final answer here as well
-                "is_complete": True
-            }
-        
-        except Exception as e:
-            print(f"Stream error: {str(e)}")
-            raise Exception(f"Error in stream processing: {str(e)}")
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+
+                        try:
+                            data = json.loads(line.decode('utf-8'))
+                        except json.JSONDecodeError:
+                            continue
+
+                        if data.get("done"):
+                            # Every answer can start a session, even one served to a request without one
+                            stats = dict(generation_stats(data), context=data.get("context"),
+                                         base_url=backend.base_url if backend else self.base_url)
+
+                        if "response" not in data:
+                            continue
+
+                        # The parser handles tags split across tokens and only looks at the new token
+                        for chunk in parser.feed(data["response"]):
+                            started = True
+                            yield chunk
+
+                    # Flush anything still buffered and send a final chunk to indicate completion
+                    for chunk in parser.finish():
+                        if chunk["type"] == "done":
+                            chunk.update(stats)
+                        yield chunk
+                    return
+
+                except requests.RequestException as e:
+                    # Nothing has reached the client yet, so another backend can start over
+                    if backend is not None and not started:
+                        print(f"Ollama backend {backend.base_url} failed before the first token, trying the next one: {str(e)}")
+                        failed = True
+                        continue
+                    print(f"Stream error: {str(e)}")
+                    raise Exception(f"Error in stream processing: {str(e)}")
+                except Exception as e:
+                    print(f"Stream error: {str(e)}")
+                    raise Exception(f"Error in stream processing: {str(e)}")
+            finally:
+                # Hand the connection back to the pool even if the consumer stops early
+                response.close()
+                if backend is not None:
+                    self.pool.release(backend, failed=failed)
 
     def list_available_models(self) -> list:
         """Get a list of available models"""
-        response = requests.get(f"{self.base_url}/tags")
+        if self.pool is not None:
+            self.pool.check_health()
+            return self.pool.available_models()
+        response = self.session.get(f"{self.base_url}/tags")
         if response.status_code == 200:
             return [model["name"] for model in response.json()["models"]]
         else:
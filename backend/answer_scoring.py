@@ -0,0 +1,124 @@
+"""
+Cheap lexical scoring of a streaming answer against the reference contexts.
+
+With VALIDATION_MODE=incremental each completed answer paragraph is scored as it
+streams: the share of its content words that appear in the retrieved reference
+passages. Running scores go out as provisional "score" events, and the DSPy judge only
+refines the final score, for at most VALIDATION_REFINE_DEADLINE seconds after the
+answer ends. VALIDATION_MODE=lexical skips the judge entirely; the default, judge,
+keeps the judge-only behaviour.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Set
+
+from retrieval import tokenize
+
+JUDGE = "judge"
+INCREMENTAL = "incremental"
+LEXICAL = "lexical"
+
+VALIDATION_MODE = os.environ.get("VALIDATION_MODE", JUDGE).strip().lower()
+VALIDATION_REFINE_DEADLINE = float(os.environ.get("VALIDATION_REFINE_DEADLINE", "5"))
+
+PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+SUFFIXES = ("ing", "ed", "es", "ly", "s")
+MIN_TERM_LENGTH = 3
+
+
+def _stem(term: str) -> str:
+    if term.endswith("ss"):
+        return term
+    for suffix in SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= MIN_TERM_LENGTH:
+            return term[:-len(suffix)]
+    return term
+
+
+def content_terms(text: str) -> Set[str]:
+    return {_stem(term) for term in tokenize(text) if len(term) >= MIN_TERM_LENGTH and not term.isdigit()}
+
+
+def lexical_score(terms: Set[str], context_terms: Set[str]) -> float:
+    """Share of a paragraph's content terms found in the reference contexts, 0..1"""
+    if not terms:
+        return 0.0
+    return len(terms & context_terms) / len(terms)
+
+
+class IncrementalScorer:
+    """
+    Scores answer paragraphs as they complete. feed() takes answer tokens and returns
+    a new provisional score whenever a paragraph finished and the contexts are known;
+    only the unfinished paragraph is buffered, and each token is only searched together
+    with the whitespace it follows, so a paragraph costs time linear in its length.
+    """
+
+    def __init__(self):
+        self.context_terms: Optional[Set[str]] = None
+        self._parts: List[str] = []       # the unfinished paragraph
+        self._tail = ""                    # its trailing whitespace, where a break may have started
+        self._waiting: List[str] = []      # completed before the contexts arrived
+        self._weighted = 0.0
+        self._terms = 0
+        self.paragraphs = 0
+
+    def set_contexts(self, contexts: List[str]) -> Optional[Dict]:
+        if self.context_terms is not None or not contexts:
+            return None
+        self.context_terms = content_terms("\n".join(contexts))
+        waiting, self._waiting = self._waiting, []
+        return self._score(waiting)
+
+    def feed(self, token: str) -> Optional[Dict]:
+        window = self._tail + token
+        if not PARAGRAPH_BREAK_RE.search(window):
+            self._parts.append(token)
+            self._tail = window[len(window.rstrip()):]
+            return None
+        *complete, rest = PARAGRAPH_BREAK_RE.split("".join(self._parts) + token)
+        self._parts = [rest] if rest else []
+        self._tail = rest[len(rest.rstrip()):]
+        return self._score(complete)
+
+    def finish(self) -> Optional[Dict]:
+        """Score the last paragraph; the result is the lexical score of the whole answer"""
+        rest = "".join(self._parts)
+        self._parts, self._tail = [], ""
+        return self._score([rest])
+
+    def _score(self, paragraphs: List[str]) -> Optional[Dict]:
+        paragraphs = [paragraph for paragraph in paragraphs if paragraph.strip()]
+        if self.context_terms is None:
+            self._waiting.extend(paragraphs)
+            return None
+        scored = False
+        for paragraph in paragraphs:
+            terms = content_terms(paragraph)
+            if not terms:
+                continue
+            self._weighted += lexical_score(terms, self.context_terms) * len(terms)
+            self._terms += len(terms)
+            self.paragraphs += 1
+            scored = True
+        return self.result() if scored else None
+
+    def result(self) -> Optional[Dict]:
+        if not self._terms:
+            return None
+        return {
+            "accuracy_score": round(100 * self._weighted / self._terms),
+            "paragraphs": self.paragraphs,
+            "method": LEXICAL,
+        }
+
+
+def lexical_validation(score: Optional[Dict]) -> Optional[Dict]:
+    """A validation result from the lexical score, for when the judge is skipped or too slow"""
+    if not score:
+        return None
+    return {
+        "accuracy_score": score["accuracy_score"],
+        "validation": f"Lexical overlap with the reference contexts across {score['paragraphs']} "
+                      f"paragraph(s); not checked by the judge"
+    }
@@ -1,17 +1,232 @@
+# First, so the cold-start timings cover every other import
+from warmup import WarmStart, warmup_targets
 from flask import Flask, jsonify, request, Response
 import json
 from flask_cors import CORS
 from Ollama import OllamaLLM
 from validation_utils import ResponseValidator
+from stream_protocol import PROTOCOL_HEADER, NullStreamEncoder, make_encoder, negotiate_protocol
+from tactics_stream import (
+    KEYWORD_DEADLINE, KEYWORD_WORKERS, PENDING_KEYWORDS, PENDING_VALIDATION, TacticsStream,
+    lookup_references, validate_safely
+)
+from response_cache import (
+    CACHE_HEADER, RESPONSE_CACHE_REPLAY_DELAY, ResponseCache, replay_lines, wants_bypass
+)
+from single_flight import (
+    CHUNK, ERROR, KEYWORDS, QUEUED, SCORE, VALIDATION, FlightGroup, ThreadedFlight, encode_event, flight_key
+)
+from answer_scoring import (
+    JUDGE, LEXICAL, VALIDATION_MODE, VALIDATION_REFINE_DEADLINE, IncrementalScorer, lexical_validation
+)
+from backend_pool import BackendPool
+from sessions import SessionStore, session_id_of
+from cancellation import (
+    DISCONNECT, REQUEST_ID_HEADER, ActiveRequests, GenerationBudget, GenerationLengths, capped_chunks, request_id_of
+)
+from corpus_library import CorpusLibrary
+from batch_tactics import BATCH_CONCURRENCY, parse_prompts, run_batch, summarize
+from scheduler import INTERACTIVE, Overloaded, get_default_scheduler
+from metrics import METRICS_CONTENT_TYPE, REGISTRY, REQUESTS, Trace, observe_chunk, stats_lines
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import math
+import threading
 import traceback
 import time
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=[PROTOCOL_HEADER, CACHE_HEADER, REQUEST_ID_HEADER])
+
+# Bounds concurrent Ollama calls per model; token streams go ahead of keyword and validation jobs
+scheduler = get_default_scheduler()
 
 # Initialize LLM and validator
-llm = OllamaLLM(model_name="deepseek-r1:7b")
-validator = ResponseValidator("./data/data.txt")
+# Spread generations across OLLAMA_BASE_URLS when several Ollama hosts are configured
+backend_pool = BackendPool.from_env()
+if backend_pool is not None:
+    backend_pool.start_health_checks()
+
+llm = OllamaLLM(model_name="deepseek-r1:7b", scheduler=scheduler, pool=backend_pool)
+validator = ResponseValidator(
+    "./data/data.txt",
+    "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json",
+    snapshot_path="./data/corpus.snapshot",
+    scheduler=scheduler
+)
+# Retrieval over a library of documents (CORPUS_LIBRARY_DIR) instead of the single parsed PDF
+library = CorpusLibrary.from_env()
+if library is not None:
+    print(f"Corpus library: {library.refresh(validator)}")
+# Readiness and cold-start timings; with OLLAMA_WARMUP=1 both models are preloaded at startup
+warm_start = WarmStart(warmup_targets(llm, validator), preload=validator.load_judge)
+# Keyword extraction and context retrieval overlap with answer streaming here
+keyword_executor = ThreadPoolExecutor(max_workers=KEYWORD_WORKERS, thread_name_prefix="keywords")
+# Finished responses, replayed for repeated (normalized) prompts
+response_cache = ResponseCache()
+# Identical prompts in flight at the same time share one generation
+flights = FlightGroup(ThreadedFlight)
+# Ollama context of each conversation, for follow-up questions
+sessions = SessionStore()
+# Tactics requests in flight, so they can be cancelled by ID or superseded by a re-ask
+active_requests = ActiveRequests()
+# How long generations run when nobody stops them, to estimate the tokens cancelling saves
+generation_lengths = GenerationLengths()
+# judge, incremental (provisional lexical scores, judge refines in time) or lexical
+validation_mode = VALIDATION_MODE
+
+
+def collect_stats():
+    """Point-in-time values for /api/metrics"""
+    lines = stats_lines("tactics_response_cache", response_cache.stats())
+    lines += stats_lines("tactics_flights", flights.stats())
+    lines += stats_lines("tactics_validation_cache", validator.validation_cache.stats())
+    lines += stats_lines("tactics_sessions", sessions.stats())
+    lines += stats_lines("tactics_requests", active_requests.stats())
+    scheduler_stats = scheduler.stats()
+    for model, model_stats in scheduler_stats.pop("models").items():
+        lines += stats_lines("ollama_scheduler_model", model_stats, model=model)
+    lines += stats_lines("ollama_scheduler", scheduler_stats)
+    for backend in backend_pool.stats() if backend_pool is not None else []:
+        lines += stats_lines("ollama_backend", backend, base_url=backend["base_url"])
+    return lines
+
+
+REGISTRY.add_collector(collect_stats)
+REGISTRY.add_collector(warm_start.collect_stats)
+
+
+def publish_score(flight, score):
+    if score is not None:
+        flight.publish(SCORE, score)
+
+
+def refine_validation(answer, contexts, lexical, trace):
+    """Final validation when answers are scored incrementally: the judge, if it answers in time"""
+    if validation_mode == LEXICAL or not contexts:
+        return lexical_validation(lexical)
+    judged = keyword_executor.submit(validate_safely, validator, answer, contexts, trace)
+    # A missed deadline is caught inside the stage, so it is not counted as an error
+    with trace.stage("judge_wait"):
+        try:
+            result = judged.result(timeout=VALIDATION_REFINE_DEADLINE)
+        except FutureTimeoutError:
+            # It keeps running, and its result lands in the validation cache
+            print("Validation judge missed its deadline, keeping the lexical score")
+            trace.timed_out("judge")
+            result = None
+    return result or lexical_validation(lexical)
+
+
+def run_generation(flight, prompt, options, session_id=None):
+    """
+    Producer for a coalesced flight: runs one generation and publishes it to every follower.
+    options are the leader's sessions.stream_options; each follower keeps the context itself.
+    """
+    stream = TacticsStream(NullStreamEncoder())
+    budget = GenerationBudget()
+    chunks = capped_chunks(llm.generate_stream(prompt, **options), budget)
+    # Upstream stage timings, logged once however many requests share the generation
+    trace = Trace("generation", prompt=flight_key(prompt), model=llm.model_name, session=session_id,
+                  context_reused=len(options.get("context") or ()))
+    scorer = IncrementalScorer() if validation_mode != JUDGE else None
+    status = "ok"
+    lookup = None
+    deadline = None
+    slot = None
+    context = None
+
+    try:
+        slot = scheduler.request(llm.model_name, INTERACTIVE)
+        if not slot.granted:
+            flight.publish(QUEUED, slot.position())
+            with trace.stage("queue_wait"):
+                slot.wait()
+        if flight.cancelled:
+            return
+
+        for chunk in chunks:
+            if flight.cancelled:
+                break
+            observe_chunk(trace, llm.model_name, chunk)
+            warm_start.mark("first_token")
+            if chunk["type"] == "done":
+                context = chunk.get("context")
+                if chunk.get("truncated"):
+                    trace.stopped_early(chunk["truncated"], budget.tokens, generation_lengths.avoided(budget.tokens))
+                else:
+                    generation_lengths.observe(budget.tokens)
+            stream.feed(chunk)
+            flight.publish(CHUNK, chunk)
+            # Score answer paragraphs as they complete
+            if scorer is not None and chunk["type"] == "answer":
+                publish_score(flight, scorer.feed(chunk["content"]))
+
+            # Start keyword extraction when thinking is complete, without holding up the answer
+            if stream.pending == PENDING_KEYWORDS:
+                lookup = keyword_executor.submit(lookup_references, validator, llm, stream.state.thinking, trace)
+                deadline = time.monotonic() + KEYWORD_DEADLINE
+                stream.keywords_started()
+
+            # When we get the done signal, run validation once and send final update
+            elif stream.pending == PENDING_VALIDATION:
+                # Generation is over, so the model slot can go to the next stream
+                slot.release()
+                if lookup is not None:
+                    references = None
+                    # A missed deadline is caught inside the stage, so it is not counted as an error
+                    with trace.stage("keyword_wait"):
+                        try:
+                            references = lookup.result(timeout=max(0, deadline - time.monotonic()))
+                        except FutureTimeoutError:
+                            pass
+                    if references is None:
+                        print("Keyword extraction missed its deadline, skipping validation")
+                        trace.timed_out("keyword")
+                    else:
+                        stream.keywords_ready(*references)
+                        flight.publish(KEYWORDS, references)
+                    lookup = None
+                answer, contexts = stream.validation_inputs(validator)
+                if scorer is None:
+                    result = validate_safely(validator, answer, contexts, trace)
+                else:
+                    publish_score(flight, scorer.set_contexts(contexts))
+                    publish_score(flight, scorer.finish())
+                    result = refine_validation(answer, contexts, scorer.result(), trace)
+                stream.validation_ready(result)
+                flight.publish(VALIDATION, result)
+                # A follow-up depends on more than the prompt, a capped answer is incomplete
+                if not options.get("context") and not stream.state.truncated:
+                    # The context lets a session that gets the cached answer continue from it
+                    response_cache.store(prompt, dict(stream.state.snapshot(), context=context or []))
+
+            # Merge the keywords into the stream as soon as they are ready
+            elif lookup is not None and lookup.done():
+                keywords, contexts = lookup.result()
+                stream.keywords_ready(keywords, contexts)
+                flight.publish(KEYWORDS, (keywords, contexts))
+                if scorer is not None and contexts:
+                    publish_score(flight, scorer.set_contexts(contexts))
+                lookup = None
+
+    except Exception as e:
+        print(f"Error in generate stream: {str(e)}")
+        print(traceback.format_exc())
+        trace.error("generation", e)
+        status = "error"
+        flight.publish(ERROR, str(e))
+    finally:
+        if lookup is not None:
+            lookup.cancel()
+        # Closes the upstream Ollama response so an abandoned generation stops
+        chunks.close()
+        if slot is not None:
+            slot.release()
+        flights.complete(flight)
+        if flight.cancelled:
+            trace.stopped_early(flight.cancel_reason or DISCONNECT, budget.tokens,
+                                generation_lengths.avoided(budget.tokens))
+        trace.finish(status="cancelled" if flight.cancelled else status)
 
 @app.route('/api/test', methods=['GET'])
 def test_route():
@@ -20,111 +235,113 @@ def test_route():
         "message": "Soccer Tactics Advisor API is running"
     })
 
+@app.route('/api/ready', methods=['GET'])
+def ready_route():
+    """503 until the warm-up (if any) is over and Ollama serves both models; /api/test only checks liveness"""
+    ready, report = warm_start.status()
+    return jsonify(report), 200 if ready else 503
+
 @app.route('/api/tactics', methods=['POST'])
 def get_tactics():
     try:
         data = request.get_json()
         prompt = data.get('prompt')
+        # Old clients send nothing and keep getting full snapshots on every line
+        encoder = make_encoder(negotiate_protocol(request.headers, data))
+        session_id = session_id_of(request.headers, data)
+        request_id = request_id_of(request.headers)
+        options = sessions.stream_options(session_id)
+        # Only a follow-up needs an answer of its own; a session's first question is like any other
+        conversation = session_id if options.get("context") else None
+        # A bypass request also gets a generation of its own instead of joining one in flight
+        fresh = wants_bypass(request.headers)
+        bypass = conversation is not None or fresh
+        cached = None if bypass else response_cache.lookup(prompt)
+        cache_status = "HIT" if cached else ("BYPASS" if bypass else "MISS")
+        trace = Trace("request", prompt=flight_key(prompt), protocol=encoder.version, cache=cache_status,
+                      session=session_id, request_id=request_id)
+        status = "ok"
+        # Fail fast when a new generation could not even be queued
+        if not cached and (fresh or not flights.in_flight(flight_key(prompt, conversation))):
+            scheduler.check(llm.model_name)
+        # A re-ask in the same conversation stops the request it replaces
+        active = active_requests.start(request_id, session_id)
+
+        def replay():
+            nonlocal status
+            sessions.update(session_id, cached)
+            batches = replay_lines(cached, encoder)
+            while True:
+                if active.cancelled:
+                    status = "cancelled"
+                    return
+                with trace.stage("serialize"):
+                    lines = next(batches, None)
+                if lines is None:
+                    return
+                trace.first("first_byte")
+                yield from lines
+                if RESPONSE_CACHE_REPLAY_DELAY:
+                    time.sleep(RESPONSE_CACHE_REPLAY_DELAY)
 
         def generate():
-            thinking = ""
-            answer = ""
-            keywords = []
-            validation_result = {
-                "accuracy_score": 0,
-                "validation": "No matching context found in reference data"
-            }
-            thinking_just_completed = False  # Flag to track when thinking just completed
-            
+            nonlocal status
+            if active.cancelled:
+                status = "cancelled"
+                return
+            stream = TacticsStream(encoder)
+            flight, leader = flights.join(flight_key(prompt, conversation), share=not fresh)
+            if leader:
+                threading.Thread(target=run_generation, args=(flight, prompt, options, session_id),
+                                 daemon=True).start()
+            # Cancelling the request wakes its follower, which then stops waiting for events
+            active.on_cancel = flight.interrupt
+            try:
+                for event in flight.follow(stop=lambda: active.cancelled):
+                    with trace.stage("serialize"):
+                        lines = encode_event(stream, event)
+                    if lines:
+                        trace.first("first_byte")
+                    if event[0] == ERROR:
+                        status = "error"
+                    elif event[0] == CHUNK and event[1]["type"] == "done":
+                        sessions.update(session_id, event[1])
+                    yield from lines
+                if active.cancelled:
+                    status = "cancelled"
+            finally:
+                # The last follower to leave cancels the upstream generation
+                flights.leave(flight, active.reason)
+
+        def traced(lines):
+            nonlocal status
             try:
-                for chunk in llm.generate_stream(prompt):
-                    if chunk["type"] == "thinking":
-                        thinking = chunk["content"]
-                        # Only extract keywords when thinking is complete
-                        if chunk.get("is_complete", False):
-                            thinking_just_completed = True  # Mark that thinking just completed
-                            try:
-                                keywords = validator.extract_keywords(llm, thinking)
-                            except Exception as e:
-                                print(f"Error extracting keywords: {str(e)}")
-                        
-                        # Stream the thinking update immediately
-                        yield json.dumps({
-                            "status": "success",
-                            "data": {
-                                "thinking": thinking,
-                                "answer": answer,
-                                "accuracy_score": validation_result["accuracy_score"],
-                                "validation_details": validation_result["validation"],
-                                "keywords": keywords,
-                                "update_type": "thinking",
-                                "thinking_complete": chunk.get("is_complete", False)  # Signal completion
-                            }
-                        }) + '\n'
-                    
-                    # Process answer chunks
-                    elif chunk["type"] == "answer":
-                        # Use the current token as the delta
-                        token = chunk["content"]
-                        # Use the full_answer field for the complete answer so far
-                        if "full_answer" in chunk:
-                            answer = chunk["full_answer"]
-                        else:
-                            answer += token  # Fallback if full_answer not provided
-                        
-                        # Stream answer token updates
-                        yield json.dumps({
-                            "status": "success", 
-                            "data": {
-                                "thinking": thinking,
-                                "answer": answer,
-                                "token": token,  # Include the individual token
-                                "accuracy_score": validation_result["accuracy_score"],
-                                "validation_details": validation_result["validation"],
-                                "keywords": keywords,
-                                "update_type": "answer",
-                                "prioritize_render": thinking_just_completed,  # Signal to prioritize rendering this update
-                                "thinking_complete": thinking_just_completed  # Also signal that thinking just completed
-                            }
-                        }) + '\n'
-                        
-                        thinking_just_completed = False  # Reset the flag
-                    
-                    # When we get the done signal, run validation once and send final update
-                    elif chunk["type"] == "done":
-                        if keywords and answer:
-                            contexts = [
-                                ctx for keyword in keywords 
-                                if (ctx := validator.get_context_window(keyword))
-                            ]
-                            if contexts:
-                                try:
-                                    validation_result = validator.validate_response(answer, contexts)
-                                except Exception as e:
-                                    print(f"Error validating response: {str(e)}")
-                        
-                        # Send final update with validation results
-                        yield json.dumps({
-                            "status": "success", 
-                            "data": {
-                                "thinking": thinking,
-                                "answer": answer or chunk.get("content", ""),  # Use content from done chunk if available
-                                "accuracy_score": validation_result["accuracy_score"],
-                                "validation_details": validation_result["validation"],
-                                "keywords": keywords,
-                                "update_type": "final"
-                            }
-                        }) + '\n'
-
-            except Exception as e:
-                print(f"Error in generate stream: {str(e)}")
-                print(traceback.format_exc())
-                yield json.dumps({
-                    "status": "error",
-                    "message": str(e)
-                }) + '\n'
-
-        return Response(generate(), mimetype='application/json')
+                yield from lines
+            except GeneratorExit:
+                # The client went away before the end of the response; WSGI only notices on a write
+                status = "cancelled"
+                active.cancel(DISCONNECT)
+                raise
+            finally:
+                active_requests.finish(active)
+                REQUESTS.inc(cache=cache_status, status=status)
+                trace.finish(status=status, cancelled=active.reason)
+
+        return Response(
+            traced(replay() if cached else generate()),
+            mimetype='application/json',
+            headers={
+                PROTOCOL_HEADER: str(encoder.version),
+                CACHE_HEADER: cache_status,
+                REQUEST_ID_HEADER: request_id
+            }
+        )
+
+    except Overloaded as e:
+        REQUESTS.inc(cache="MISS", status="rejected")
+        response = jsonify(e.to_dict())
+        response.headers["Retry-After"] = str(math.ceil(e.retry_after))
+        return response, 429
 
     except Exception as e:
         print(f"Error in /api/tactics: {str(e)}")
@@ -134,6 +351,57 @@ def get_tactics():
             "message": str(e)
         }), 500
 
+@app.route('/api/tactics/<request_id>/cancel', methods=['POST'])
+def cancel_tactics(request_id):
+    """Stop a streaming tactics request; its generation stops too unless another request shares it"""
+    if not active_requests.cancel(request_id):
+        return jsonify({"status": "error", "message": "No such request in flight"}), 404
+    return jsonify({"status": "success", "request_id": request_id})
+
+@app.route('/api/tactics/batch', methods=['POST'])
+def batch_tactics():
+    """
+    Run many prompts, sent as JSONL (one {"id", "prompt"} per line) or as {"prompts": [...]},
+    and stream one JSON result per line as each finishes, then a {"summary": ...} line
+    """
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            prompts = data.get("prompts", [])
+            if not isinstance(prompts, list):
+                raise ValueError("prompts must be a list")
+            items = parse_prompts(json.dumps(item) for item in prompts)
+            concurrency = data.get("concurrency", BATCH_CONCURRENCY)
+        else:
+            items = parse_prompts(request.get_data(as_text=True).splitlines())
+            concurrency = request.args.get("concurrency", BATCH_CONCURRENCY, type=int)
+        if not items:
+            return jsonify({"status": "error", "message": "No prompts given"}), 400
+        concurrency = max(1, min(int(concurrency), BATCH_CONCURRENCY))
+
+        def generate():
+            results = []
+            for result in run_batch(llm, validator, items, concurrency):
+                results.append(result)
+                yield json.dumps(result) + '\n'
+            yield json.dumps({"summary": summarize(results)}) + '\n'
+
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    except (ValueError, TypeError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@app.route('/api/library/sync', methods=['POST'])
+def sync_library():
+    """Ingest documents added to or changed in the library since the last sync, and drop deleted ones"""
+    if library is None:
+        return jsonify({"status": "error", "message": "CORPUS_LIBRARY_DIR is not set"}), 404
+    return jsonify({"status": "success", **library.refresh(validator)})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype=METRICS_CONTENT_TYPE)
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -141,5 +409,8 @@ def not_found(error):
         "message": "Resource not found"
     }), 404
 
+warm_start.mark("import")
+warm_start.start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,525 @@
+"""
+asyncio (ASGI) serving path for the Soccer Tactics Advisor API.
+
+Runs side by side with the Flask app and serves the same /api/test and /api/tactics
+contract, but each in-flight tactics stream is a coroutine instead of a pinned thread:
+
+    uvicorn asgi_app:app --port 5001
+"""
+# First, so the cold-start timings cover every other import
+from warmup import WarmStart, warmup_targets
+
+import asyncio
+import json
+import math
+import os
+import traceback
+
+from async_ollama import AsyncOllamaLLM
+from validation_utils import ResponseValidator
+from backend_pool import BackendPool
+from sessions import SESSION_HEADER, SessionStore, session_id_of
+from cancellation import (
+    DISCONNECT, REQUEST_ID_HEADER, ActiveRequests, GenerationBudget, GenerationLengths, capped_chunks_async,
+    request_id_of
+)
+from corpus_library import CorpusLibrary
+from scheduler import INTERACTIVE, Overloaded, get_default_scheduler
+from metrics import METRICS_CONTENT_TYPE, REGISTRY, REQUESTS, Trace, observe_chunk, stats_lines
+from single_flight import (
+    CHUNK, ERROR, KEYWORDS, QUEUED, SCORE, VALIDATION, AsyncFlight, FlightGroup, encode_event, flight_key
+)
+from answer_scoring import (
+    JUDGE, LEXICAL, VALIDATION_MODE, VALIDATION_REFINE_DEADLINE, IncrementalScorer, lexical_validation
+)
+from stream_protocol import PROTOCOL_HEADER, NullStreamEncoder, make_encoder, negotiate_protocol
+from response_cache import (
+    BYPASS_HEADER, CACHE_HEADER, RESPONSE_CACHE_REPLAY_DELAY, ResponseCache, replay_lines, wants_bypass
+)
+from tactics_stream import (
+    KEYWORD_DEADLINE, PENDING_KEYWORDS, PENDING_VALIDATION, TacticsStream, validate_safely
+)
+
+# A client that does not drain its socket for this long is treated as disconnected
+SEND_TIMEOUT = float(os.environ.get("ASGI_SEND_TIMEOUT", "30"))
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", ", ".join(
+        ["content-type", PROTOCOL_HEADER, BYPASS_HEADER, REQUEST_ID_HEADER, SESSION_HEADER]).lower().encode()),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-expose-headers", ", ".join([PROTOCOL_HEADER, CACHE_HEADER, REQUEST_ID_HEADER]).lower().encode()),
+]
+
+# Bounds concurrent Ollama calls per model; token streams go ahead of keyword and validation jobs
+scheduler = get_default_scheduler()
+
+# Initialize LLM and validator
+# Spread generations across OLLAMA_BASE_URLS when several Ollama hosts are configured
+backend_pool = BackendPool.from_env()
+if backend_pool is not None:
+    backend_pool.start_health_checks()
+
+llm = AsyncOllamaLLM(model_name="deepseek-r1:7b", scheduler=scheduler, pool=backend_pool)
+validator = ResponseValidator(
+    "./data/data.txt",
+    "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json",
+    snapshot_path="./data/corpus.snapshot",
+    scheduler=scheduler
+)
+# Retrieval over a library of documents (CORPUS_LIBRARY_DIR) instead of the single parsed PDF
+library = CorpusLibrary.from_env()
+if library is not None:
+    print(f"Corpus library: {library.refresh(validator)}")
+# Readiness and cold-start timings; with OLLAMA_WARMUP=1 both models are preloaded at startup
+warm_start = WarmStart(warmup_targets(llm, validator), preload=validator.load_judge)
+# Ollama context of each conversation, for follow-up questions
+sessions = SessionStore()
+# Tactics requests in flight, so they can be cancelled by ID or superseded by a re-ask
+active_requests = ActiveRequests()
+# How long generations run when nobody stops them, to estimate the tokens cancelling saves
+generation_lengths = GenerationLengths()
+# Finished responses, replayed for repeated (normalized) prompts
+response_cache = ResponseCache()
+# Identical prompts in flight at the same time share one generation
+flights = FlightGroup(AsyncFlight)
+# judge, incremental (provisional lexical scores, judge refines in time) or lexical
+validation_mode = VALIDATION_MODE
+
+
+def collect_stats():
+    """Point-in-time values for /api/metrics"""
+    lines = stats_lines("tactics_response_cache", response_cache.stats())
+    lines += stats_lines("tactics_flights", flights.stats())
+    lines += stats_lines("tactics_validation_cache", validator.validation_cache.stats())
+    lines += stats_lines("tactics_sessions", sessions.stats())
+    lines += stats_lines("tactics_requests", active_requests.stats())
+    scheduler_stats = scheduler.stats()
+    for model, model_stats in scheduler_stats.pop("models").items():
+        lines += stats_lines("ollama_scheduler_model", model_stats, model=model)
+    lines += stats_lines("ollama_scheduler", scheduler_stats)
+    for backend in backend_pool.stats() if backend_pool is not None else []:
+        lines += stats_lines("ollama_backend", backend, base_url=backend["base_url"])
+    return lines
+
+
+REGISTRY.add_collector(collect_stats)
+REGISTRY.add_collector(warm_start.collect_stats)
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def response_sender(send):
+    """
+    send for one streamed response. The body is ended at most once: a cancel can land
+    while the producer sends its final message, and the handler then ends it too. A send
+    that fails (a disconnect error, or a message the server no longer accepts) raises
+    ClientDisconnected.
+    """
+    finished = False
+
+    async def send_once(message):
+        nonlocal finished
+        if finished:
+            return
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            # Set before awaiting, so a cancellation during this send cannot end the body again
+            finished = True
+        try:
+            await send(message)
+        except (OSError, RuntimeError) as e:
+            raise ClientDisconnected() from e
+
+    return send_once
+
+
+async def send_json(send, payload: dict, status: int = 200, extra_headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                   + CORS_HEADERS + (extra_headers or [])
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def write_lines(send, lines):
+    if not lines:
+        return
+    # Awaiting send applies the server's flow control: while a slow client's buffer is full
+    # its follower waits here, and a client that stops reading is dropped after SEND_TIMEOUT
+    try:
+        await asyncio.wait_for(
+            send({"type": "http.response.body", "body": "".join(lines).encode("utf-8"), "more_body": True}),
+            SEND_TIMEOUT
+        )
+    except (asyncio.TimeoutError, OSError) as e:
+        raise ClientDisconnected() from e
+
+
+async def lookup_references(thinking: str, trace: Trace):
+    """Async counterpart of tactics_stream.lookup_references"""
+    try:
+        with trace.stage("extract_keywords"):
+            keywords = await validator.extract_keywords_async(llm, thinking)
+    except Exception as e:
+        print(f"Error extracting keywords: {str(e)}")
+        return [], None
+    try:
+        with trace.stage("context_lookup"):
+            pack = await asyncio.to_thread(validator.pack_contexts, keywords)
+        trace.context_stats(pack)
+        return keywords, pack["contexts"]
+    except Exception as e:
+        print(f"Error retrieving contexts: {str(e)}")
+        return keywords, None
+
+
+def publish_score(flight, score):
+    if score is not None:
+        flight.publish(SCORE, score)
+
+
+async def refine_validation(answer, contexts, lexical, trace):
+    """Final validation when answers are scored incrementally: the judge, if it answers in time"""
+    if validation_mode == LEXICAL or not contexts:
+        return lexical_validation(lexical)
+    # A missed deadline is caught inside the stage, so it is not counted as an error
+    with trace.stage("judge_wait"):
+        try:
+            result = await asyncio.wait_for(
+                asyncio.to_thread(validate_safely, validator, answer, contexts, trace), VALIDATION_REFINE_DEADLINE
+            )
+        except asyncio.TimeoutError:
+            # The worker thread keeps going, and its result lands in the validation cache
+            print("Validation judge missed its deadline, keeping the lexical score")
+            trace.timed_out("judge")
+            result = None
+    return result or lexical_validation(lexical)
+
+
+async def run_generation(flight, prompt: str, options: dict, session_id: str = None):
+    """
+    Producer for a coalesced flight: runs one generation and publishes it to every follower.
+    options are the leader's sessions.stream_options; each follower keeps the context itself.
+    """
+    stream = TacticsStream(NullStreamEncoder())
+    budget = GenerationBudget()
+    chunks = capped_chunks_async(llm.generate_stream(prompt, **options), budget)
+    # Upstream stage timings, logged once however many requests share the generation
+    trace = Trace("generation", prompt=flight_key(prompt), model=llm.model_name, session=session_id,
+                  context_reused=len(options.get("context") or ()))
+    scorer = IncrementalScorer() if validation_mode != JUDGE else None
+    status = "ok"
+    lookup = None
+    deadline = None
+    slot = None
+    context = None
+    try:
+        slot = scheduler.request(llm.model_name, INTERACTIVE)
+        if not slot.granted:
+            flight.publish(QUEUED, slot.position())
+            with trace.stage("queue_wait"):
+                await slot.wait_async()
+
+        async for chunk in chunks:
+            observe_chunk(trace, llm.model_name, chunk)
+            warm_start.mark("first_token")
+            if chunk["type"] == "done":
+                context = chunk.get("context")
+                if chunk.get("truncated"):
+                    trace.stopped_early(chunk["truncated"], budget.tokens, generation_lengths.avoided(budget.tokens))
+                else:
+                    generation_lengths.observe(budget.tokens)
+            stream.feed(chunk)
+            flight.publish(CHUNK, chunk)
+            # Score answer paragraphs as they complete
+            if scorer is not None and chunk["type"] == "answer":
+                publish_score(flight, scorer.feed(chunk["content"]))
+
+            # Start keyword extraction when thinking is complete, without holding up the answer
+            if stream.pending == PENDING_KEYWORDS:
+                lookup = asyncio.create_task(lookup_references(stream.state.thinking, trace))
+                deadline = asyncio.get_running_loop().time() + KEYWORD_DEADLINE
+                stream.keywords_started()
+
+            # When we get the done signal, run validation once and send final update
+            elif stream.pending == PENDING_VALIDATION:
+                # Generation is over, so the model slot can go to the next stream
+                slot.release()
+                if lookup is not None:
+                    references = None
+                    # A missed deadline is caught inside the stage, so it is not counted as an error
+                    with trace.stage("keyword_wait"):
+                        try:
+                            references = await asyncio.wait_for(
+                                lookup, max(0, deadline - asyncio.get_running_loop().time())
+                            )
+                        except asyncio.TimeoutError:
+                            pass
+                    if references is None:
+                        print("Keyword extraction missed its deadline, skipping validation")
+                        trace.timed_out("keyword")
+                    else:
+                        stream.keywords_ready(*references)
+                        flight.publish(KEYWORDS, references)
+                    lookup = None
+                answer, contexts = stream.validation_inputs(validator)
+                if scorer is None:
+                    # DSPy is synchronous, so the judge call runs on a worker thread
+                    result = await asyncio.to_thread(validate_safely, validator, answer, contexts, trace)
+                else:
+                    publish_score(flight, scorer.set_contexts(contexts))
+                    publish_score(flight, scorer.finish())
+                    result = await refine_validation(answer, contexts, scorer.result(), trace)
+                stream.validation_ready(result)
+                flight.publish(VALIDATION, result)
+                # A follow-up depends on more than the prompt, a capped answer is incomplete
+                if not options.get("context") and not stream.state.truncated:
+                    # The context lets a session that gets the cached answer continue from it
+                    response_cache.store(prompt, dict(stream.state.snapshot(), context=context or []))
+
+            # Merge the keywords into the stream as soon as they are ready
+            elif lookup is not None and lookup.done():
+                keywords, contexts = lookup.result()
+                stream.keywords_ready(keywords, contexts)
+                flight.publish(KEYWORDS, (keywords, contexts))
+                if scorer is not None and contexts:
+                    publish_score(flight, scorer.set_contexts(contexts))
+                lookup = None
+
+    except asyncio.CancelledError:
+        status = "cancelled"
+        trace.stopped_early(flight.cancel_reason or DISCONNECT, budget.tokens, generation_lengths.avoided(budget.tokens))
+    except Exception as e:
+        print(f"Error in generate stream: {str(e)}")
+        print(traceback.format_exc())
+        trace.error("generation", e)
+        status = "error"
+        flight.publish(ERROR, str(e))
+    finally:
+        if lookup is not None:
+            lookup.cancel()
+        # Closes the upstream Ollama response so an abandoned generation stops
+        await chunks.aclose()
+        if slot is not None:
+            slot.release()
+        flights.complete(flight)
+        trace.finish(status=status)
+
+
+async def stream_tactics(prompt: str, encoder, send, trace: Trace, session_id: str = None, active=None,
+                         share: bool = True, options: dict = None) -> str:
+    """
+    Follow the prompt's flight to the end and return the request status. A request with
+    a conversation to continue (context in its session options) follows one of its own.
+    """
+    stream = TacticsStream(encoder)
+    status = "ok"
+    options = options if options is not None else sessions.stream_options(session_id)
+    conversation = session_id if options.get("context") else None
+    flight, leader = flights.join(flight_key(prompt, conversation), share)
+    if leader:
+        flight.task = asyncio.create_task(run_generation(flight, prompt, options, session_id))
+    try:
+        async for event in flight.follow():
+            with trace.stage("serialize"):
+                lines = encode_event(stream, event)
+            if lines:
+                trace.first("first_byte")
+            if event[0] == ERROR:
+                status = "error"
+            elif event[0] == CHUNK and event[1]["type"] == "done":
+                sessions.update(session_id, event[1])
+            await write_lines(send, lines)
+            # wait_for in write_lines can swallow a cancellation that lands as the send completes
+            if active is not None and active.cancelled:
+                raise asyncio.CancelledError()
+    finally:
+        # The last follower to leave cancels the upstream generation
+        flights.leave(flight, active.reason if active is not None else None)
+
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return status
+
+
+async def replay_tactics(snapshot: dict, encoder, send, trace: Trace, active=None, session_id: str = None) -> str:
+    sessions.update(session_id, snapshot)
+    batches = replay_lines(snapshot, encoder)
+    while True:
+        if active is not None and active.cancelled:
+            raise asyncio.CancelledError()
+        with trace.stage("serialize"):
+            lines = next(batches, None)
+        if lines is None:
+            break
+        trace.first("first_byte")
+        await write_lines(send, lines)
+        if RESPONSE_CACHE_REPLAY_DELAY:
+            await asyncio.sleep(RESPONSE_CACHE_REPLAY_DELAY)
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return "ok"
+
+
+async def watch_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def get_tactics(scope, receive, send):
+    try:
+        data = json.loads(await read_body(receive) or b"{}")
+        prompt = data.get('prompt')
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        # Old clients send nothing and keep getting full snapshots on every line
+        encoder = make_encoder(negotiate_protocol(headers, data))
+        session_id = session_id_of(headers, data)
+        request_id = request_id_of(headers)
+        options = sessions.stream_options(session_id)
+        # Only a follow-up needs an answer of its own; a session's first question is like any other
+        conversation = session_id if options.get("context") else None
+        # A bypass request also gets a generation of its own instead of joining one in flight
+        fresh = wants_bypass(headers)
+        bypass = conversation is not None or fresh
+        cached = None if bypass else response_cache.lookup(prompt)
+        cache_status = "HIT" if cached else ("BYPASS" if bypass else "MISS")
+        trace = Trace("request", prompt=flight_key(prompt), protocol=encoder.version, cache=cache_status,
+                      session=session_id, request_id=request_id)
+        # Fail fast when a new generation could not even be queued
+        if not cached and (fresh or not flights.in_flight(flight_key(prompt, conversation))):
+            scheduler.check(llm.model_name)
+    except ClientDisconnected:
+        return
+    except Overloaded as e:
+        REQUESTS.inc(cache="MISS", status="rejected")
+        await send_json(send, e.to_dict(), status=429,
+                        extra_headers=[(b"retry-after", str(math.ceil(e.retry_after)).encode())])
+        return
+    except Exception as e:
+        print(f"Error in /api/tactics: {str(e)}")
+        print(traceback.format_exc())
+        await send_json(send, {"status": "error", "message": str(e)}, status=500)
+        return
+
+    send = response_sender(send)
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (PROTOCOL_HEADER.lower().encode(), str(encoder.version).encode()),
+                (CACHE_HEADER.lower().encode(), cache_status.encode()),
+                (REQUEST_ID_HEADER.lower().encode(), request_id.encode()),
+            ] + CORS_HEADERS
+        })
+    except ClientDisconnected:
+        REQUESTS.inc(cache=cache_status, status="cancelled")
+        trace.finish(status="cancelled")
+        return
+
+    # A re-ask in the same conversation stops the request it replaces
+    active = active_requests.start(request_id, session_id)
+    if cached:
+        producer = asyncio.create_task(replay_tactics(cached, encoder, send, trace, active, session_id))
+    else:
+        producer = asyncio.create_task(stream_tactics(prompt, encoder, send, trace, session_id, active,
+                                                      share=not fresh, options=options))
+    active.on_cancel = producer.cancel
+    watcher = asyncio.create_task(watch_disconnect(receive))
+    done, _ = await asyncio.wait({producer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+
+    if producer in done:
+        watcher.cancel()
+    elif active.cancel(DISCONNECT):
+        print("Client disconnected, cancelling upstream generation")
+    try:
+        status = await producer
+    except (asyncio.CancelledError, ClientDisconnected):
+        status = "cancelled"
+    finally:
+        active_requests.finish(active)
+    if active.cancelled and active.reason != DISCONNECT:
+        # Cancelled by ID or superseded while the client still listens: end the response
+        watcher.cancel()
+        try:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except ClientDisconnected:
+            pass
+    REQUESTS.inc(cache=cache_status, status=status)
+    trace.finish(status=status, cancelled=active.reason)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Warms up in the background; /api/ready reports when it is done
+            warm_start.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await llm.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+    elif path == "/api/test" and method == "GET":
+        await send_json(send, {
+            "status": "success",
+            "message": "Soccer Tactics Advisor API is running"
+        })
+    elif path == "/api/ready" and method == "GET":
+        ready, report = await asyncio.to_thread(warm_start.status)
+        await send_json(send, report, status=200 if ready else 503)
+    elif path == "/api/tactics" and method == "POST":
+        await get_tactics(scope, receive, send)
+    elif path.startswith("/api/tactics/") and path.endswith("/cancel") and method == "POST":
+        request_id = path[len("/api/tactics/"):-len("/cancel")]
+        if active_requests.cancel(request_id):
+            await send_json(send, {"status": "success", "request_id": request_id})
+        else:
+            await send_json(send, {"status": "error", "message": "No such request in flight"}, status=404)
+    elif path == "/api/library/sync" and method == "POST":
+        if library is None:
+            await send_json(send, {"status": "error", "message": "CORPUS_LIBRARY_DIR is not set"}, status=404)
+        else:
+            await send_json(send, {"status": "success", **await asyncio.to_thread(library.refresh, validator)})
+    elif path == "/api/metrics" and method == "GET":
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", METRICS_CONTENT_TYPE.encode())] + CORS_HEADERS
+        })
+        await send({"type": "http.response.body", "body": REGISTRY.render().encode("utf-8")})
+    else:
+        await send_json(send, {"status": "error", "message": "Resource not found"}, status=404)
+
+
+warm_start.mark("import")
@@ -0,0 +1,166 @@
+import asyncio
+import json
+from typing import AsyncGenerator, Dict, List, Union
+
+import httpx
+
+from Ollama import DEFAULT_BASE_URL, STREAM_PROMPT_PREFIX, generation_stats, session_request, with_keep_alive
+from ollama_session import (
+    DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT
+)
+from backend_pool import BackendPool, OllamaBackend
+from scheduler import BACKGROUND, Scheduler
+from think_parser import ThinkTagParser, split_thinking
+
+
+class AsyncOllamaLLM:
+    """
+    asyncio counterpart of OllamaLLM for the ASGI server.
+
+    Yields the same chunks as OllamaLLM.generate_stream. Closing or cancelling the
+    generator closes the upstream HTTP response, which makes Ollama stop generating.
+    """
+
+    def __init__(self, model_name="deepseek-r1:7b", base_url: str = DEFAULT_BASE_URL,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 scheduler: Scheduler = None,
+                 pool: BackendPool = None):
+        self.base_url = base_url
+        self.model_name = model_name
+        self.scheduler = scheduler
+        # With a backend pool, generate calls are routed across its hosts instead of base_url
+        self.pool = pool
+        # Every in-flight stream holds one upstream connection, so only idle ones are capped.
+        # Like OllamaSession, only connection failures are retried.
+        transport = httpx.AsyncHTTPTransport(
+            retries=max_retries,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=pool_size)
+        )
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=transport
+        )
+
+    async def _post_generate(self, request: dict, stream: bool = False, tried: List[OllamaBackend] = None,
+                             prefer: str = None):
+        """Async counterpart of OllamaLLM._post_generate"""
+        if self.pool is None:
+            return await self._client.send(
+                self._client.build_request("POST", f"{self.base_url}/generate", json=request), stream=stream
+            ), None
+
+        tried = [] if tried is None else tried
+        while True:
+            backend = self.pool.acquire(self.model_name, exclude=tried, prefer=prefer)
+            tried.append(backend)
+            try:
+                response = await self._client.send(
+                    self._client.build_request("POST", f"{backend.base_url}/generate", json=request), stream=stream
+                )
+            except httpx.TransportError as e:
+                print(f"Ollama backend {backend.base_url} failed, trying the next one: {str(e)}")
+                self.pool.release(backend, failed=True)
+                continue
+            if response.status_code == 404:
+                self.pool.model_missing(backend, self.model_name)
+            elif response.status_code < 500:
+                return response, backend
+            await response.aclose()
+            self.pool.release(backend, failed=response.status_code >= 500)
+
+    async def generate_response(self, prompt: str, priority: int = BACKGROUND) -> dict:
+        """Generate a complete response and parse thinking and answer"""
+        request = with_keep_alive({
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": False
+        })
+        if self.scheduler is None:
+            response, backend = await self._post_generate(request)
+        else:
+            async with self.scheduler.slot_async(self.model_name, priority):
+                response, backend = await self._post_generate(request)
+        if backend is not None:
+            self.pool.release(backend)
+        if response.status_code != 200:
+            raise Exception(f"Error generating response: {response.text}")
+
+        thinking, answer = split_thinking(response.json()["response"])
+        return {
+            "thinking": thinking,
+            "answer": answer
+        }
+
+    async def generate_stream(self, prompt: str, context: List[int] = None, keep_alive: Union[str, float] = None,
+                              prefer: str = None) -> AsyncGenerator[Dict, None]:
+        """Stream thinking and answer chunks, see OllamaLLM.generate_stream"""
+        request = session_request(with_keep_alive({
+            "model": self.model_name,
+            "prompt": STREAM_PROMPT_PREFIX + prompt,
+            "stream": True
+        }), context, keep_alive)
+        tried = []
+        while True:
+            response, backend = await self._post_generate(request, stream=True, tried=tried, prefer=prefer)
+            failed = False
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise Exception(f"Error generating response: {response.text}")
+
+                parser = ThinkTagParser()
+                started = False
+                stats = {}
+                try:
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+
+                        try:
+                            data = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+
+                        if data.get("done"):
+                            # Every answer can start a session, even one served to a request without one
+                            stats = dict(generation_stats(data), context=data.get("context"),
+                                         base_url=backend.base_url if backend else self.base_url)
+
+                        if "response" not in data:
+                            continue
+
+                        for chunk in parser.feed(data["response"]):
+                            started = True
+                            yield chunk
+
+                    for chunk in parser.finish():
+                        if chunk["type"] == "done":
+                            chunk.update(stats)
+                        yield chunk
+                    return
+                except httpx.TransportError as e:
+                    # Nothing has reached the client yet, so another backend can start over
+                    if backend is None or started:
+                        raise
+                    print(f"Ollama backend {backend.base_url} failed before the first token, trying the next one: {str(e)}")
+                    failed = True
+            finally:
+                await response.aclose()
+                if backend is not None:
+                    self.pool.release(backend, failed=failed)
+
+    async def list_available_models(self) -> list:
+        """Get a list of available models"""
+        if self.pool is not None:
+            await asyncio.to_thread(self.pool.check_health)
+            return self.pool.available_models()
+        response = await self._client.get(f"{self.base_url}/tags")
+        if response.status_code == 200:
+            return [model["name"] for model in response.json()["models"]]
+        raise Exception(f"Error listing models: {response.text}")
+
+    async def aclose(self):
+        await self._client.aclose()
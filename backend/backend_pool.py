@@ -0,0 +1,158 @@
+"""
+Routing and load balancing across several Ollama hosts.
+
+    OLLAMA_BASE_URLS=http://gpu1:11434/api,http://gpu2:11434/api python app.py
+
+Each call goes to the healthy backend with the fewest requests in flight (ties go round
+robin) among those that serve the requested model. Backends are probed through
+/api/tags, which reports both liveness and the models a host has pulled. A backend that
+refuses a connection or fails with a 5xx is marked down and skipped until the next
+probe; callers then fail over to the next backend, which is safe up to the moment the
+first token reaches the client.
+"""
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import requests
+
+from ollama_session import OllamaSession
+
+HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "10"))
+HEALTH_TIMEOUT = (1.0, 2.0)
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class OllamaBackend:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.healthy = True
+        self.models: Optional[Set[str]] = None  # None until the first probe
+        self.missing: Set[str] = set()          # models it answered 404 for since the last probe
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.down_since: Optional[float] = None
+
+    def serves(self, model: str) -> bool:
+        return model not in self.missing and (self.models is None or model in self.models)
+
+
+class BackendPool:
+    def __init__(self, base_urls: Iterable[str], session: OllamaSession = None,
+                 health_interval: float = HEALTH_INTERVAL):
+        self.backends = [OllamaBackend(url) for url in base_urls]
+        if not self.backends:
+            raise ValueError("BackendPool needs at least one base URL")
+        # Failing over to another host beats retrying a dead one, so connections are not retried
+        self.session = session or OllamaSession(max_retries=0)
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> Optional["BackendPool"]:
+        """A pool over OLLAMA_BASE_URLS (comma separated), or None when it is not set"""
+        urls = [url.strip() for url in os.environ.get("OLLAMA_BASE_URLS", "").split(",") if url.strip()]
+        return cls(urls) if urls else None
+
+    def _available(self, backend: OllamaBackend, now: float) -> bool:
+        # A backend marked down gets another chance once a probe interval has passed
+        return backend.healthy or (backend.down_since is not None and now - backend.down_since >= self.health_interval)
+
+    def acquire(self, model: str, exclude: Iterable[OllamaBackend] = (), prefer: str = None) -> OllamaBackend:
+        """
+        Pick the least loaded backend for model and count a request against it. A backend
+        whose base_url is prefer wins while it is available (a session's cached context lives there).
+        """
+        excluded = set(map(id, exclude))
+        now = time.monotonic()
+        turn = next(self._turn)
+        with self._lock:
+            candidates = [
+                backend for backend in self.backends
+                if id(backend) not in excluded and self._available(backend, now) and backend.serves(model)
+            ]
+            if not candidates:
+                raise NoBackendAvailable(f"No healthy Ollama backend serves {model}")
+            count = len(self.backends)
+            preferred = [backend for backend in candidates if backend.base_url == prefer]
+            backend = preferred[0] if preferred else min(
+                candidates, key=lambda b: (b.outstanding, (self.backends.index(b) - turn) % count)
+            )
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: OllamaBackend, failed: bool = False):
+        with self._lock:
+            backend.outstanding -= 1
+            if failed:
+                backend.failures += 1
+                backend.healthy = False
+                backend.down_since = time.monotonic()
+
+    def model_missing(self, backend: OllamaBackend, model: str):
+        """The backend answered 404 for model: stop routing it there until the next probe"""
+        with self._lock:
+            backend.missing.add(model)
+
+    def check_health(self):
+        """Probe every backend's /api/tags and record its liveness and models"""
+        for backend in self.backends:
+            try:
+                response = self.session.get(f"{backend.base_url}/tags", timeout=HEALTH_TIMEOUT)
+                healthy = response.status_code == 200
+                models = {model["name"] for model in response.json()["models"]} if healthy else None
+            except (requests.RequestException, ValueError, KeyError):
+                healthy, models = False, None
+            with self._lock:
+                if healthy:
+                    backend.healthy, backend.down_since, backend.models = True, None, models
+                    backend.missing.clear()
+                elif backend.healthy:
+                    backend.healthy, backend.down_since = False, time.monotonic()
+
+    def start_health_checks(self):
+        if self._health_thread is not None:
+            return
+        self.check_health()
+
+        def run():
+            while not self._stop.wait(self.health_interval):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=run, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def available_models(self) -> List[str]:
+        """Models served by at least one healthy backend, as of the last probe"""
+        with self._lock:
+            return sorted({
+                model for backend in self.backends if backend.healthy and backend.models
+                for model in backend.models
+            })
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    "base_url": backend.base_url,
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "models": sorted(backend.models) if backend.models is not None else None,
+                }
+                for backend in self.backends
+            ]
@@ -0,0 +1,223 @@
+"""
+Batch tactics runs for offline evaluation.
+
+    python batch_tactics.py prompts.jsonl --out results.jsonl --concurrency 4
+
+Each input line is a JSON object with a "prompt" and an optional "id" (the line number
+otherwise); any other fields are copied into the result. Prompts go through the same
+pipeline as /api/tactics (generation, keyword lookup, validation) with at most
+`concurrency` in flight. Every result is appended to the output file as soon as it
+finishes, so a run that is interrupted picks up where it stopped: ids that already have
+a successful result are skipped, failed ones are retried.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from retrieval import estimate_tokens
+from scheduler import BACKGROUND
+from tactics_stream import lookup_references, validate_safely
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+
+
+def parse_prompts(lines: Iterable[str]) -> List[Dict]:
+    """
+    Prompt items from JSONL lines; blank lines are skipped. Raises ValueError for a line
+    that is not an object with a string prompt, or that repeats an earlier id (results
+    are resumed by id, so duplicates would collapse into one).
+    """
+    items = []
+    ids = set()
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if not isinstance(item, dict):
+            raise ValueError(f"Line {number} is not a JSON object")
+        if not isinstance(item.get("prompt"), str) or not item["prompt"].strip():
+            raise ValueError(f"Line {number} has no prompt")
+        item["id"] = str(item.get("id", number))
+        if item["id"] in ids:
+            raise ValueError(f"Line {number} repeats id {item['id']}")
+        ids.add(item["id"])
+        items.append(item)
+    return items
+
+
+def load_prompts(path: str) -> List[Dict]:
+    with open(path, "r") as f:
+        return parse_prompts(f)
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids with a successful result in an existing checkpoint file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short when the last run was killed
+            if "error" not in result:
+                done.add(result["id"])
+    return done
+
+
+def _ends_mid_line(path: str) -> bool:
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def accuracy_value(validation: Optional[Dict]) -> Optional[float]:
+    """The judge's accuracy_score as a number; DSPy returns it as text"""
+    if not validation:
+        return None
+    try:
+        return float(str(validation.get("accuracy_score")).strip().rstrip("%"))
+    except ValueError:
+        return None
+
+
+def run_prompt(llm, validator, item: Dict) -> Dict:
+    """Run one prompt through generation, keyword lookup and validation and time each part"""
+    result = dict(item)
+    start = time.perf_counter()
+    first_token = None
+    done = {}
+    thinking = ""
+    try:
+        if llm.scheduler is None:
+            chunks = list(_generate(llm, item["prompt"]))
+        else:
+            # Batch runs yield to interactive /api/tactics streams
+            with llm.scheduler.slot(llm.model_name, BACKGROUND):
+                chunks = list(_generate(llm, item["prompt"]))
+        for elapsed, chunk in chunks:
+            if first_token is None and chunk["type"] in ("thinking", "answer"):
+                first_token = elapsed
+            # The done chunk carries only the answer; the thinking comes complete in its own chunk
+            if chunk["type"] == "thinking" and chunk.get("is_complete"):
+                thinking = chunk["content"]
+            elif chunk["type"] == "done":
+                done = chunk
+        generation = time.perf_counter() - start
+
+        answer = done.get("content", "")
+        keywords, contexts = lookup_references(validator, llm, thinking)
+        validation = validate_safely(validator, answer, contexts or []) if answer else None
+    except Exception as e:
+        print(f"Error in batch prompt {item['id']}: {str(e)}")
+        result.update(error=str(e), latency_s=round(time.perf_counter() - start, 3))
+        return result
+
+    # Ollama reports generated tokens and decode time; estimate them when it does not
+    tokens = done.get("eval_count") or estimate_tokens(thinking + answer)
+    decode_seconds = done["eval_duration"] / 1e9 if done.get("eval_duration") else generation
+    result.update(
+        latency_s=round(time.perf_counter() - start, 3),
+        generation_s=round(generation, 3),
+        first_token_s=round(first_token, 3) if first_token is not None else None,
+        tokens=tokens,
+        tokens_per_sec=round(tokens / decode_seconds, 2) if decode_seconds else None,
+        accuracy_score=accuracy_value(validation),
+        keywords=keywords,
+        thinking=thinking,
+        answer=answer,
+        validation=validation,
+    )
+    return result
+
+
+def _generate(llm, prompt: str):
+    start = time.perf_counter()
+    for chunk in llm.generate_stream(prompt):
+        yield time.perf_counter() - start, chunk
+
+
+def run_batch(llm, validator, items: List[Dict], concurrency: int = BATCH_CONCURRENCY) -> Iterator[Dict]:
+    """Results in completion order, with at most `concurrency` prompts in flight"""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as executor:
+        futures = [executor.submit(run_prompt, llm, validator, item) for item in items]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # The consumer went away: drop prompts that have not started yet
+            for future in futures:
+                future.cancel()
+
+
+def summarize(results: List[Dict]) -> Dict:
+    ok = [result for result in results if "error" not in result]
+    latencies = sorted(result["latency_s"] for result in ok)
+    rates = [result["tokens_per_sec"] for result in ok if result.get("tokens_per_sec")]
+    scores = [result["accuracy_score"] for result in ok if result.get("accuracy_score") is not None]
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+    return {
+        "prompts": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "latency_p50_s": percentile(0.5),
+        "latency_p95_s": percentile(0.95),
+        "mean_tokens_per_sec": round(sum(rates) / len(rates), 2) if rates else None,
+        "mean_accuracy_score": round(sum(scores) / len(scores), 2) if scores else None,
+    }
+
+
+def run_file(llm, validator, input_path: str, output_path: str, concurrency: int = BATCH_CONCURRENCY) -> Dict:
+    """Run every prompt in input_path that has no result in output_path yet, appending as they finish"""
+    items = load_prompts(input_path)
+    done = completed_ids(output_path)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} prompts, {len(items) - len(pending)} already done, running {len(pending)}")
+
+    results = []
+    partial = _ends_mid_line(output_path)
+    with open(output_path, "a") as out:
+        if partial:
+            # The last run was killed halfway through a line: start a fresh one
+            out.write("\n")
+        for result in run_batch(llm, validator, pending, concurrency):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            results.append(result)
+            status = result.get("error") or f"{result['latency_s']}s, {result['tokens_per_sec']} tok/s, score {result['accuracy_score']}"
+            print(f"[{len(results)}/{len(pending)}] {result['id']}: {status}")
+    return summarize(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the tactics advisor")
+    parser.add_argument("input", help="JSONL file with one {\"id\", \"prompt\"} object per line")
+    parser.add_argument("--out", default="results.jsonl", help="JSONL results file, also the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--model", default="deepseek-r1:7b")
+    args = parser.parse_args()
+
+    from backend_pool import BackendPool
+    from Ollama import OllamaLLM
+    from validation_utils import ResponseValidator
+
+    llm = OllamaLLM(model_name=args.model, pool=BackendPool.from_env())
+    validator = ResponseValidator(
+        "./data/data.txt",
+        "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json",
+        snapshot_path="./data/corpus.snapshot"
+    )
+    print(json.dumps(run_file(llm, validator, args.input, args.out, args.concurrency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
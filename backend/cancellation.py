@@ -0,0 +1,204 @@
+"""
+Cancellation and early termination of /api/tactics generations.
+
+Every tactics request gets a request ID (the client's X-Request-Id, or a generated one),
+returned in the X-Request-Id response header. A request ends early when:
+
+- its client disconnects ("disconnect"),
+- POST /api/tactics/<request_id>/cancel names it ("client"),
+- a newer request in the same session arrives, because the user re-asked ("superseded").
+
+The request then leaves its flight; when it was the last follower, the flight is
+cancelled and the producer closes the upstream Ollama response, which makes Ollama stop
+generating. Independently, THINKING_MAX_TOKENS and ANSWER_MAX_TOKENS (0 = no cap) end a
+generation that runs too long ("thinking_cap", "answer_cap"): the upstream response is
+closed and the stream finishes with what it has, flagged "truncated".
+
+Tokens are counted as streamed pieces (about one per token). The tokens a cancelled or
+capped generation did not generate are estimated from the mean length of the
+generations that ran to the end.
+"""
+import os
+import re
+import threading
+import uuid
+from typing import Callable, Dict, Optional
+
+REQUEST_ID_HEADER = "X-Request-Id"
+THINKING_MAX_TOKENS = int(os.environ.get("THINKING_MAX_TOKENS", "0"))
+ANSWER_MAX_TOKENS = int(os.environ.get("ANSWER_MAX_TOKENS", "0"))
+
+# Why a request or generation ended early
+DISCONNECT = "disconnect"
+CLIENT = "client"
+SUPERSEDED = "superseded"
+THINKING_CAP = "thinking_cap"
+ANSWER_CAP = "answer_cap"
+
+REQUEST_ID_RE = re.compile(r'^[\w.:-]{1,128}$')
+
+
+def request_id_of(headers) -> str:
+    """The client's request ID if it sent a valid one, a new one otherwise"""
+    # Flask headers are case-insensitive, raw ASGI headers arrive lower-cased
+    request_id = headers.get(REQUEST_ID_HEADER) or headers.get(REQUEST_ID_HEADER.lower())
+    if isinstance(request_id, str) and REQUEST_ID_RE.match(request_id):
+        return request_id
+    return uuid.uuid4().hex
+
+
+class ActiveRequest:
+    """Cancel handle of one in-flight tactics request"""
+
+    def __init__(self, request_id: str, session_id: Optional[str] = None):
+        self.request_id = request_id
+        self.session_id = session_id
+        self.reason: Optional[str] = None
+        # Set by the server once there is something to interrupt (a flight, a task)
+        self.on_cancel: Optional[Callable[[], None]] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str) -> bool:
+        """Stop following the generation; False if the request was already cancelled"""
+        if self.reason is not None:
+            return False
+        self.reason = reason
+        if self.on_cancel is not None:
+            self.on_cancel()
+        return True
+
+
+class ActiveRequests:
+    """In-flight tactics requests by request ID, and the latest one of each session"""
+
+    def __init__(self):
+        self._requests: Dict[str, ActiveRequest] = {}
+        self._sessions: Dict[str, ActiveRequest] = {}
+        self._lock = threading.Lock()
+
+    def start(self, request_id: str, session_id: Optional[str] = None) -> ActiveRequest:
+        """Register a request; an older request of the same session is superseded"""
+        active = ActiveRequest(request_id, session_id)
+        with self._lock:
+            previous = self._requests.get(request_id)
+            self._requests[request_id] = active
+            superseded = self._sessions.get(session_id) if session_id else None
+            if session_id:
+                self._sessions[session_id] = active
+        if previous is not None:
+            # The same ID sent again: the retry wins
+            previous.cancel(SUPERSEDED)
+        if superseded is not None and superseded is not previous:
+            superseded.cancel(SUPERSEDED)
+        return active
+
+    def cancel(self, request_id: str, reason: str = CLIENT) -> bool:
+        with self._lock:
+            active = self._requests.get(request_id)
+        return active is not None and active.cancel(reason)
+
+    def finish(self, active: ActiveRequest):
+        with self._lock:
+            if self._requests.get(active.request_id) is active:
+                del self._requests[active.request_id]
+            if active.session_id and self._sessions.get(active.session_id) is active:
+                del self._sessions[active.session_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"active": len(self._requests)}
+
+
+class GenerationBudget:
+    """
+    Token counts of one generation against the optional thinking and answer caps.
+
+    Feed it every chunk of OllamaLLM.generate_stream; feed() returns THINKING_CAP or
+    ANSWER_CAP once a section goes past its cap.
+    """
+
+    def __init__(self, max_thinking: int = None, max_answer: int = None):
+        self.max_thinking = THINKING_MAX_TOKENS if max_thinking is None else max_thinking
+        self.max_answer = ANSWER_MAX_TOKENS if max_answer is None else max_answer
+        self.thinking_tokens = 0
+        self.answer_tokens = 0
+        self._thinking_parts = []
+
+    @property
+    def tokens(self) -> int:
+        return self.thinking_tokens + self.answer_tokens
+
+    def feed(self, chunk: Dict) -> Optional[str]:
+        if chunk["type"] == "thinking" and not chunk.get("is_complete"):
+            self.thinking_tokens += 1
+            self._thinking_parts.append(chunk.get("delta", ""))
+            if self.max_thinking and self.thinking_tokens > self.max_thinking:
+                return THINKING_CAP
+        elif chunk["type"] == "answer":
+            self.answer_tokens += 1
+            if self.max_answer and self.answer_tokens > self.max_answer:
+                return ANSWER_CAP
+        return None
+
+    def truncated_chunks(self, reason: str):
+        """Chunks that end a capped generation in place of the rest of the stream"""
+        if reason == THINKING_CAP:
+            # Thinking is handed on as complete, so keyword extraction still runs on it
+            yield {"type": "thinking", "content": "".join(self._thinking_parts).strip(), "is_complete": True}
+        yield {"type": "done", "content": "", "truncated": reason}
+
+
+def capped_chunks(chunks, budget: GenerationBudget):
+    """generate_stream chunks up to the budget's caps; closing this closes the upstream stream"""
+    try:
+        for chunk in chunks:
+            reason = budget.feed(chunk)
+            if reason is not None:
+                # Stop Ollama before finishing the stream with what there is
+                chunks.close()
+                yield from budget.truncated_chunks(reason)
+                return
+            yield chunk
+    finally:
+        chunks.close()
+
+
+async def capped_chunks_async(chunks, budget: GenerationBudget):
+    """Async counterpart of capped_chunks"""
+    try:
+        async for chunk in chunks:
+            reason = budget.feed(chunk)
+            if reason is not None:
+                await chunks.aclose()
+                for end in budget.truncated_chunks(reason):
+                    yield end
+                return
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+
+class GenerationLengths:
+    """Mean token count of generations that ran to the end, to estimate what cancelling saved"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observe(self, tokens: int):
+        if tokens:
+            with self._lock:
+                self.count += 1
+                self.total += tokens
+
+    def avoided(self, generated: int) -> int:
+        """Tokens a generation stopped after `generated` tokens would probably still have generated"""
+        with self._lock:
+            if not self.count:
+                return 0
+            mean = self.total / self.count
+        return max(0, round(mean - generated))
@@ -0,0 +1,94 @@
+"""
+Packs reference contexts for the validator prompt.
+
+Windows around nearby keyword matches overlap, and extract_keywords can return any
+number of keywords, so joining every window let the judge's prompt (and the 1.5b
+model's prefill time) grow without bound. The packer caps the keywords, merges
+overlapping windows by character offset, ranks what is left by relevance and keeps
+the best contexts that fit together in CONTEXT_TOKEN_BUDGET. Each pack reports the
+prompt tokens it saved against the contexts the validator sent before it was packed.
+"""
+import os
+from typing import Dict, Iterable, List, Tuple
+
+from retrieval import DEFAULT_TOKEN_BUDGET, estimate_tokens
+
+MAX_KEYWORDS = int(os.environ.get("MAX_KEYWORDS", "8"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", str(DEFAULT_TOKEN_BUDGET)))
+# Keyword-window candidates per keyword when no parsed PDF was loaded
+MATCHES_PER_KEYWORD = int(os.environ.get("MATCHES_PER_KEYWORD", "3"))
+
+KEYWORD_TRIM = " \t\r\n.\"'`*-"
+
+
+def limit_keywords(keywords: Iterable[str], max_keywords: int = MAX_KEYWORDS) -> List[str]:
+    """The first max_keywords non-empty keywords, without case-insensitive duplicates"""
+    kept = []
+    seen = set()
+    for keyword in keywords:
+        keyword = (keyword or "").strip(KEYWORD_TRIM)
+        if not keyword or keyword.lower() in seen:
+            continue
+        seen.add(keyword.lower())
+        kept.append(keyword)
+        if len(kept) >= max_keywords:
+            break
+    return kept
+
+
+def merge_spans(spans: Iterable[Tuple[int, int, str]]) -> List[Dict]:
+    """
+    Merge (start, end, keyword) windows that overlap or touch into spans in text order,
+    each with the distinct keywords it covers and its number of matches.
+    """
+    merged: List[Dict] = []
+    for start, end, keyword in sorted(spans):
+        if merged and start <= merged[-1]["end"]:
+            span = merged[-1]
+            span["end"] = max(span["end"], end)
+            span["keywords"].add(keyword.lower())
+            span["hits"] += 1
+        else:
+            merged.append({"start": start, "end": end, "keywords": {keyword.lower()}, "hits": 1})
+    return merged
+
+
+def span_relevance(span: Dict) -> Tuple[int, int]:
+    """Spans covering more distinct keywords first, then more matches"""
+    return len(span["keywords"]), span["hits"]
+
+
+def pack_contexts(candidates: List[Tuple[str, object]], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  candidate_tokens: int = None) -> Dict:
+    """
+    Keep the most relevant distinct (text, relevance) candidates that fit together in
+    token_budget, most relevant first. Ties keep their candidate order. candidate_tokens
+    is what the contexts cost before packing, when that differs from joining every
+    candidate given; tokens_saved is measured against it.
+    """
+    contexts = []
+    seen = set()
+    used = 0
+    for text, _ in sorted(candidates, key=lambda candidate: candidate[1], reverse=True):
+        key = " ".join(text.split()).lower()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            continue
+        contexts.append(text)
+        used += tokens
+    if candidate_tokens is None:
+        candidate_tokens = sum(estimate_tokens(text) for text, _ in candidates)
+    return {
+        "contexts": contexts,
+        "tokens": used,
+        "candidate_tokens": candidate_tokens,
+        "tokens_saved": max(0, candidate_tokens - used),
+        "candidates": len(candidates),
+    }
+
+
+def empty_pack() -> Dict:
+    return pack_contexts([])
@@ -0,0 +1,260 @@
+import bisect
+import heapq
+import re
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+WORD_RE = re.compile(r'\w+')
+
+# Lookup modes for a keyword token, depending on whether the keyword continues past it
+EXACT = "exact"      # bounded on both sides, must be a whole corpus token
+PREFIX = "prefix"    # keyword ends inside a corpus token
+SUFFIX = "suffix"    # keyword starts inside a corpus token
+INFIX = "infix"      # single-token keyword, may sit anywhere inside a corpus token
+
+_TERM_CACHE_SIZE = 4096
+
+
+class CorpusIndex:
+    """
+    Case-folded inverted index over a reference text, built once.
+
+    Answers the same question as a case-insensitive substring search (where does this
+    keyword or phrase occur?) without scanning the text: keyword tokens are resolved
+    against the vocabulary (exact, prefix, suffix or trigram-backed infix lookups), their
+    postings give candidate token positions, and each candidate is verified against the
+    text so results are identical to re.finditer(re.escape(keyword), text, re.IGNORECASE).
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._lowered = text.lower()
+        # lower() can change the length of a few non-ASCII characters; offsets would drift
+        self._aligned = len(self._lowered) == len(text)
+
+        self._terms: List[str] = []
+        self._term_ids: Dict[str, int] = {}
+        self._postings: List[array] = []          # term id -> token positions
+        self._token_starts = array('I')           # token position -> character offset
+        self._token_terms = array('I')            # token position -> term id
+
+        for match in WORD_RE.finditer(self._lowered):
+            term = match.group()
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                term_id = len(self._terms)
+                self._term_ids[term] = term_id
+                self._terms.append(term)
+                self._postings.append(array('I'))
+            self._postings[term_id].append(len(self._token_starts))
+            self._token_starts.append(match.start())
+            self._token_terms.append(term_id)
+
+        # Sorted vocabularies for prefix and suffix lookups
+        self._by_prefix = sorted(self._terms)
+        self._by_suffix = sorted(term[::-1] for term in self._terms)
+
+        # Trigram -> term ids for infix lookups
+        trigrams: Dict[str, List[int]] = {}
+        for term_id, term in enumerate(self._terms):
+            for gram in {term[i:i + 3] for i in range(len(term) - 2)}:
+                trigrams.setdefault(gram, []).append(term_id)
+        self._trigrams = {gram: array('I', ids) for gram, ids in trigrams.items()}
+
+        self._term_cache: Dict[tuple, List[int]] = {}
+
+    def snapshot_sections(self):
+        """(metadata, {name: bytes-like}) for corpus_snapshot to write"""
+        offsets = array('q', [0])
+        for postings in self._postings:
+            offsets.append(offsets[-1] + len(postings))
+        positions = array('I')
+        for postings in self._postings:
+            positions.extend(postings)
+
+        prefix_order = array('I', (self._term_ids[term] for term in self._by_prefix))
+        suffix_order = array('I', (self._term_ids[term[::-1]] for term in self._by_suffix))
+
+        grams = list(self._trigrams)
+        gram_offsets = array('q', [0])
+        gram_ids = array('I')
+        for gram in grams:
+            gram_ids.extend(self._trigrams[gram])
+            gram_offsets.append(len(gram_ids))
+
+        metadata = {"terms": self._terms, "trigrams": grams, "aligned": self._aligned}
+        sections = {
+            "postings_offsets": offsets,
+            "postings": positions,
+            "token_starts": self._token_starts,
+            "token_terms": self._token_terms,
+            "prefix_order": prefix_order,
+            "suffix_order": suffix_order,
+            "trigram_offsets": gram_offsets,
+            "trigram_ids": gram_ids,
+        }
+        return metadata, sections
+
+    @classmethod
+    def from_snapshot(cls, text, lowered, metadata, sections) -> "CorpusIndex":
+        """
+        Rebuild an index around arrays loaded by corpus_snapshot. The arrays (and text, when
+        it is a MappedText) stay in the read-only mapping, so worker processes share them.
+        """
+        index = cls.__new__(cls)
+        index.text = text
+        index._lowered = lowered
+        index._aligned = metadata["aligned"]
+        index._terms = metadata["terms"]
+        index._term_ids = {term: term_id for term_id, term in enumerate(index._terms)}
+
+        offsets = sections["postings_offsets"]
+        positions = sections["postings"]
+        index._postings = [positions[offsets[i]:offsets[i + 1]] for i in range(len(index._terms))]
+        index._token_starts = sections["token_starts"]
+        index._token_terms = sections["token_terms"]
+        index._by_prefix = [index._terms[term_id] for term_id in sections["prefix_order"]]
+        index._by_suffix = [index._terms[term_id][::-1] for term_id in sections["suffix_order"]]
+
+        gram_offsets = sections["trigram_offsets"]
+        gram_ids = sections["trigram_ids"]
+        index._trigrams = {
+            gram: gram_ids[gram_offsets[i]:gram_offsets[i + 1]]
+            for i, gram in enumerate(metadata["trigrams"])
+        }
+        index._term_cache = {}
+        return index
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._terms)
+
+    @property
+    def token_count(self) -> int:
+        return len(self._token_starts)
+
+    def _matching_terms(self, fragment: str, mode: str) -> List[int]:
+        key = (fragment, mode)
+        cached = self._term_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if mode == EXACT:
+            term_id = self._term_ids.get(fragment)
+            term_ids = [term_id] if term_id is not None else []
+        elif mode == PREFIX:
+            start = bisect.bisect_left(self._by_prefix, fragment)
+            end = bisect.bisect_left(self._by_prefix, fragment + '\U0010ffff')
+            term_ids = [self._term_ids[term] for term in self._by_prefix[start:end]]
+        elif mode == SUFFIX:
+            reversed_fragment = fragment[::-1]
+            start = bisect.bisect_left(self._by_suffix, reversed_fragment)
+            end = bisect.bisect_left(self._by_suffix, reversed_fragment + '\U0010ffff')
+            term_ids = [self._term_ids[term[::-1]] for term in self._by_suffix[start:end]]
+        elif len(fragment) >= 3:
+            # Intersect the trigram lists, starting from the rarest, then confirm
+            grams = sorted({fragment[i:i + 3] for i in range(len(fragment) - 2)},
+                           key=lambda gram: len(self._trigrams.get(gram, ())))
+            candidates = set(self._trigrams.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(self._trigrams.get(gram, ()))
+            term_ids = [term_id for term_id in candidates if fragment in self._terms[term_id]]
+        else:
+            term_ids = [term_id for term_id, term in enumerate(self._terms) if fragment in term]
+
+        if len(self._term_cache) >= _TERM_CACHE_SIZE:
+            self._term_cache.clear()
+        self._term_cache[key] = term_ids
+        return term_ids
+
+    def _scan(self, keyword: str) -> Iterator[int]:
+        """Fallback for keywords without word characters or text that does not case-fold in place"""
+        lowered = keyword.lower()
+        if not self._aligned or len(lowered) != len(keyword):
+            for match in re.finditer(re.escape(keyword), str(self.text), re.IGNORECASE):
+                yield match.start()
+            return
+        position = self._lowered.find(lowered)
+        while position >= 0:
+            yield position
+            position = self._lowered.find(lowered, position + len(lowered))
+
+    def _candidates(self, term_id: int) -> Iterator[tuple]:
+        token_starts = self._token_starts
+        for position in self._postings[term_id]:
+            yield token_starts[position], position, term_id
+
+    def iter_matches(self, keyword: str) -> Iterator[int]:
+        """Character offsets of every case-insensitive occurrence of keyword, in text order"""
+        if not keyword:
+            return
+        lowered = keyword.lower()
+        tokens = list(WORD_RE.finditer(lowered))
+        if not tokens or not self._aligned or len(lowered) != len(keyword):
+            yield from self._scan(keyword)
+            return
+
+        count = len(tokens)
+        modes = []
+        for i, token in enumerate(tokens):
+            open_left = i == 0 and token.start() == 0
+            open_right = i == count - 1 and token.end() == len(lowered)
+            if open_left and open_right:
+                modes.append(INFIX)
+            elif open_left:
+                modes.append(SUFFIX)
+            elif open_right:
+                modes.append(PREFIX)
+            else:
+                modes.append(EXACT)
+
+        term_sets = [self._matching_terms(token.group(), mode) for token, mode in zip(tokens, modes)]
+        if not all(term_sets):
+            return
+        following = [set(term_ids) for term_ids in term_sets[1:]]
+
+        first = tokens[0]
+        lead = first.start()  # non-word characters before the first keyword token
+        token_terms = self._token_terms
+        token_count = len(token_terms)
+
+        # Postings are sorted, so merging them yields candidates in text order
+        merged = heapq.merge(*(self._candidates(term_id) for term_id in term_sets[0]))
+        # Like re.finditer, matches do not overlap
+        next_allowed = 0
+        for token_start, position, term_id in merged:
+            if position + count > token_count:
+                continue
+            if any(token_terms[position + i + 1] not in term_set for i, term_set in enumerate(following)):
+                continue
+
+            term = self._terms[term_id]
+            fragment = first.group()
+            offset = term.find(fragment) if modes[0] != SUFFIX else len(term) - len(fragment)
+            while offset >= 0:
+                start = token_start + offset - lead
+                if start >= next_allowed and self._lowered.startswith(lowered, start):
+                    next_allowed = start + len(lowered)
+                    yield start
+                if modes[0] != INFIX:
+                    break
+                offset = term.find(fragment, offset + 1)
+
+    def find(self, keyword: str, limit: Optional[int] = None) -> List[int]:
+        """Character offsets of the first `limit` (default: all) occurrences of keyword"""
+        matches = []
+        for start in self.iter_matches(keyword):
+            matches.append(start)
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
+
+    def is_whole_word(self, start: int, length: int) -> bool:
+        before = self.text[start - 1] if start > 0 else " "
+        after = self.text[start + length] if start + length < len(self.text) else " "
+        return not (before.isalnum() or before == "_") and not (after.isalnum() or after == "_")
+
+    def window(self, start: int, length: int, window_size: int) -> str:
+        return self.text[max(0, start - window_size):min(len(self.text), start + length + window_size)]
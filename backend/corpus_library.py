@@ -0,0 +1,346 @@
+"""
+Ingestion of a multi-document reference library for BM25 retrieval.
+
+A library is a directory of coaching documents: plain text (.txt, .md), parsed-PDF JSON
+(result.chunks[].blocks[], like data/<id>.json) and JSON lines with one block per line
+(.jsonl, {"content", "page", "bbox"}). Text and JSON-lines files are read a line at a
+time; a parsed-PDF JSON is parsed whole, one document at a time. Each document is
+normalized, cut into passages and tokenized by a process pool. The result is one
+segment file per document in the index directory, named by the document's content hash,
+plus a manifest of what is indexed.
+
+sync() only ingests documents that are new or changed since the manifest and drops the
+segments of deleted ones, so adding or removing a document never re-reads the rest of
+the library. retriever() merges the segments' term counts into one BM25 index without
+tokenizing again.
+
+    CORPUS_LIBRARY_DIR=./data/library python app.py
+    python corpus_library.py sync --library ./data/library
+    python corpus_library.py add path/to/new.pdf.json
+    python corpus_library.py remove new.pdf.json
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from retrieval import PASSAGE_WORDS, BM25Index, PassageRetriever, count_terms, split_passages
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(min(8, os.cpu_count() or 1))))
+TEXT_EXTENSIONS = (".txt", ".md")
+CHUNK_EXTENSIONS = (".json", ".jsonl")
+MANIFEST_VERSION = 1
+# A text file without blank lines is still cut into blocks of about this many words
+BLOCK_WORDS = 2000
+
+LINE_HYPHEN_RE = re.compile(r'(\w)-$')
+
+
+def normalize_text(text: str) -> str:
+    """NFKC (ligatures, full-width characters) and single spaces"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def iter_text_blocks(path: str) -> Iterator[Tuple[str, Optional[int], Optional[Dict]]]:
+    """Paragraphs of a text file, read a line at a time; a word hyphenated across lines is rejoined"""
+    lines: List[str] = []
+    words = 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and lines and LINE_HYPHEN_RE.search(lines[-1]) and line[0].islower():
+                lines[-1] = lines[-1][:-1] + line
+                continue
+            if line:
+                lines.append(line)
+                words += len(line.split())
+            if lines and (not line or words >= BLOCK_WORDS):
+                yield " ".join(lines), None, None
+                lines, words = [], 0
+    if lines:
+        yield " ".join(lines), None, None
+
+
+def iter_chunk_blocks(path: str) -> Iterator[Tuple[str, Optional[int], Optional[Dict]]]:
+    """Blocks of a parsed-PDF JSON, or of a JSON-lines file read a line at a time"""
+    if path.endswith(".jsonl"):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    block = json.loads(line)
+                except ValueError:
+                    print(f"Skipping malformed line in {path}")
+                    continue
+                bbox = block.get("bbox") or {}
+                yield block.get("content") or block.get("text") or "", block.get("page", bbox.get("page")), bbox
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    for chunk in document.get("result", {}).get("chunks", []):
+        for block in chunk.get("blocks", []):
+            bbox = block.get("bbox") or {}
+            yield block.get("content") or "", bbox.get("page"), bbox
+
+
+def iter_passages(path: str, max_words: int = PASSAGE_WORDS) -> Iterator[Dict]:
+    blocks = iter_chunk_blocks(path) if path.endswith(CHUNK_EXTENSIONS) else iter_text_blocks(path)
+    for content, page, bbox in blocks:
+        for text in split_passages(normalize_text(content), max_words):
+            yield {"text": text, "page": page, "bbox": bbox or {}}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: str, value):
+    """Write atomically, so readers see the old file or the complete new one"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def ingest_document(path: str, segments_dir: str, max_words: int = PASSAGE_WORDS) -> Dict:
+    """
+    Normalize, chunk and tokenize one document into its segment file. Runs in a worker
+    process; only a short summary travels back to the parent.
+    """
+    sha256 = file_sha256(path)
+    segment_path = os.path.join(segments_dir, f"{sha256}.json")
+    if os.path.exists(segment_path):
+        # Same content already indexed (touched, renamed or copied)
+        with open(segment_path, 'r') as f:
+            return {"sha256": sha256, "passages": len(json.load(f)["passages"])}
+    passages = []
+    terms = []
+    for passage in iter_passages(path, max_words):
+        passages.append(passage)
+        terms.append(count_terms(passage["text"]))
+    _write_json(segment_path, {"passages": passages, "terms": terms})
+    return {"sha256": sha256, "passages": len(passages)}
+
+
+class CorpusLibrary:
+    """A library directory and its incrementally maintained segment index"""
+
+    def __init__(self, library_dir: str, index_dir: str = None, workers: int = INGEST_WORKERS,
+                 max_words: int = PASSAGE_WORDS):
+        self.library_dir = os.path.abspath(library_dir)
+        self.index_dir = os.path.abspath(index_dir or os.path.join(self.library_dir, ".index"))
+        self.segments_dir = os.path.join(self.index_dir, "segments")
+        self.manifest_path = os.path.join(self.index_dir, "manifest.json")
+        self.workers = workers
+        self.max_words = max_words
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+        # Loaded segments by content hash, kept across syncs so only new documents are read
+        self._segments: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["CorpusLibrary"]:
+        """The library in CORPUS_LIBRARY_DIR (index in CORPUS_LIBRARY_INDEX), or None when it is not set"""
+        library_dir = os.environ.get("CORPUS_LIBRARY_DIR")
+        if not library_dir:
+            return None
+        return cls(library_dir, os.environ.get("CORPUS_LIBRARY_INDEX"))
+
+    def _load_manifest(self) -> Dict:
+        empty = {"version": MANIFEST_VERSION, "passage_words": self.max_words, "documents": {}}
+        if not os.path.exists(self.manifest_path):
+            return empty
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except ValueError:
+            print(f"Ignoring unreadable manifest {self.manifest_path}")
+            return empty
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("passage_words") != self.max_words:
+            # Chunked differently: every document is ingested again
+            shutil.rmtree(self.segments_dir)
+            os.makedirs(self.segments_dir)
+            return empty
+        return manifest
+
+    def scan(self) -> Dict[str, Dict]:
+        """Size and modification time of every document, by path relative to the library"""
+        documents = {}
+        for root, dirs, files in os.walk(self.library_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".")
+                             and os.path.join(root, d) != self.index_dir)
+            for name in sorted(files):
+                if name.startswith(".") or not name.lower().endswith(TEXT_EXTENSIONS + CHUNK_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                documents[os.path.relpath(path, self.library_dir)] = {
+                    "size": stat.st_size, "mtime_ns": stat.st_mtime_ns
+                }
+        return documents
+
+    def sync(self) -> Dict:
+        """Ingest new and changed documents and forget deleted ones"""
+        with self._lock:
+            start = time.perf_counter()
+            current = self.scan()
+            indexed = self.manifest["documents"]
+            changed = [
+                name for name, stat in current.items()
+                if name not in indexed or (indexed[name]["size"], indexed[name]["mtime_ns"]) != (stat["size"], stat["mtime_ns"])
+            ]
+            removed = [name for name in indexed if name not in current]
+            report = self._apply(current, changed, removed)
+            report["seconds"] = round(time.perf_counter() - start, 3)
+            return report
+
+    def add(self, paths: Iterable[str]) -> Dict:
+        """Copy documents into the library and ingest just those"""
+        names = []
+        for path in paths:
+            name = os.path.basename(path)
+            destination = os.path.join(self.library_dir, name)
+            if os.path.abspath(path) != destination:
+                shutil.copy2(path, destination)
+            names.append(name)
+        with self._lock:
+            current = {name: stat for name, stat in self.scan().items() if name in names}
+            return self._apply(current, list(current), [])
+
+    def remove(self, names: Iterable[str]) -> Dict:
+        """Delete documents (paths relative to the library) and drop them from the index"""
+        names = list(names)
+        for name in names:
+            path = os.path.join(self.library_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            return self._apply({}, [], [name for name in names if name in self.manifest["documents"]])
+
+    def _apply(self, current: Dict[str, Dict], changed: List[str], removed: List[str]) -> Dict:
+        documents = self.manifest["documents"]
+        added = [name for name in changed if name not in documents]
+        for name, summary in zip(changed, self._ingest(changed)):
+            if summary is None:
+                continue
+            documents[name] = dict(current[name], sha256=summary["sha256"], passages=summary["passages"])
+        for name in removed:
+            documents.pop(name, None)
+        self._collect_garbage()
+        _write_json(self.manifest_path, self.manifest)
+        return {
+            "added": added,
+            "updated": [name for name in changed if name not in added],
+            "removed": removed,
+            "documents": len(documents),
+            "passages": sum(document["passages"] for document in documents.values()),
+        }
+
+    def _ingest(self, names: List[str]) -> List[Optional[Dict]]:
+        paths = [os.path.join(self.library_dir, name) for name in names]
+        if self.workers <= 1 or len(paths) <= 1:
+            return [self._ingest_safely(path) for path in paths]
+        # spawn, not fork: the servers call this with request threads running
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(paths)), mp_context=context) as pool:
+            futures = [pool.submit(ingest_document, path, self.segments_dir, self.max_words) for path in paths]
+            results = []
+            for path, future in zip(paths, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"Error ingesting {path}: {str(e)}")
+                    results.append(None)
+            return results
+
+    def _ingest_safely(self, path: str) -> Optional[Dict]:
+        try:
+            return ingest_document(path, self.segments_dir, self.max_words)
+        except Exception as e:
+            print(f"Error ingesting {path}: {str(e)}")
+            return None
+
+    def _collect_garbage(self):
+        referenced = {document["sha256"] for document in self.manifest["documents"].values()}
+        for name in os.listdir(self.segments_dir):
+            sha256, extension = os.path.splitext(name)
+            if extension == ".json" and sha256 not in referenced:
+                os.remove(os.path.join(self.segments_dir, name))
+        for sha256 in list(self._segments):
+            if sha256 not in referenced:
+                del self._segments[sha256]
+
+    def _segment(self, sha256: str) -> Dict:
+        segment = self._segments.get(sha256)
+        if segment is None:
+            with open(os.path.join(self.segments_dir, f"{sha256}.json"), 'r') as f:
+                segment = self._segments[sha256] = json.load(f)
+        return segment
+
+    def retriever(self) -> Optional[PassageRetriever]:
+        """BM25 over every indexed document, or None when the library is empty"""
+        with self._lock:
+            passages = []
+            terms = []
+            for name, document in sorted(self.manifest["documents"].items()):
+                segment = self._segment(document["sha256"])
+                passages.extend(dict(passage, source=name) for passage in segment["passages"])
+                terms.extend(segment["terms"])
+        if not passages:
+            return None
+        return PassageRetriever(index=BM25Index(passages, term_frequencies=terms))
+
+    def refresh(self, validator) -> Dict:
+        """
+        sync(), then point a ResponseValidator at the updated index. An empty library
+        leaves the validator on its parsed-PDF passages.
+        """
+        report = self.sync()
+        validator.retriever = self.retriever() or validator.pdf_retriever
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a library of coaching documents for retrieval")
+    parser.add_argument("command", choices=["sync", "add", "remove", "list"])
+    parser.add_argument("paths", nargs="*", help="documents to add, or library paths to remove")
+    parser.add_argument("--library", default=os.environ.get("CORPUS_LIBRARY_DIR", "./data/library"))
+    parser.add_argument("--index", default=os.environ.get("CORPUS_LIBRARY_INDEX"))
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args()
+
+    os.makedirs(args.library, exist_ok=True)
+    library = CorpusLibrary(args.library, args.index, workers=args.workers)
+    if args.command == "sync":
+        print(json.dumps(library.sync(), indent=2))
+    elif args.command == "add":
+        print(json.dumps(library.add(args.paths), indent=2))
+    elif args.command == "remove":
+        print(json.dumps(library.remove(args.paths), indent=2))
+    else:
+        for name, document in sorted(library.manifest["documents"].items()):
+            print(f"{document['passages']:6d}  {name}")
+
+
+if __name__ == "__main__":
+    main()
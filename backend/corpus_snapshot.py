@@ -0,0 +1,302 @@
+"""
+On-disk, memory-mapped snapshot of the reference corpus and its indexes.
+
+The snapshot holds the reference text, the CorpusIndex postings and the BM25 passage
+index as flat arrays. Loading maps the file read-only, so worker processes share its
+pages instead of each reading data.txt and rebuilding the indexes. Content hashes of the
+source files are stored in the header; a snapshot whose sources changed, or that is
+truncated or corrupt, is ignored and rebuilt.
+
+    python corpus_snapshot.py build --data ./data/data.txt --chunks ./data/<id>.json --out ./data/corpus.snapshot
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from corpus_index import CorpusIndex
+from retrieval import PASSAGE_WORDS, BM25Index, PassageRetriever, load_parsed_pdf
+
+MAGIC = b"STACORP1"
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+HEADER_KEYS = ("version", "byteorder", "passage_words", "sources", "corpus", "bm25", "sections")
+
+_ENCODINGS = {1: "latin-1", 2: "utf-16-le", 4: "utf-32-le"}
+
+
+class MappedText:
+    """
+    Read-only text stored with a fixed width per character, so any slice can be decoded
+    by character offset without touching (or copying) the rest of the text.
+    """
+
+    def __init__(self, buffer: memoryview, width: int, length: int):
+        self._buffer = buffer
+        self._width = width
+        self._encoding = _ENCODINGS[width]
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key) -> str:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step != 1:
+                return str(self)[key]
+        else:
+            if key < 0:
+                key += self._length
+            if not 0 <= key < self._length:
+                raise IndexError("MappedText index out of range")
+            start, stop = key, key + 1
+        return bytes(self._buffer[start * self._width:max(start, stop) * self._width]).decode(self._encoding)
+
+    def __str__(self) -> str:
+        return bytes(self._buffer).decode(self._encoding)
+
+    def startswith(self, prefix: str, start: int = 0) -> bool:
+        return self[start:start + len(prefix)] == prefix
+
+    def find(self, sub: str, start: int = 0) -> int:
+        # Only used by CorpusIndex's rare fallback path, so decoding the whole text is fine
+        return str(self).find(sub, start)
+
+
+class MappedPassages:
+    """Sequence of passage dicts whose text lives in the snapshot"""
+
+    def __init__(self, text: MappedText, offsets: np.ndarray, metadata: list):
+        self._text = text
+        self._offsets = offsets
+        self._metadata = metadata
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    def __getitem__(self, i) -> Dict:
+        passage = dict(self._metadata[i])
+        passage["text"] = self._text[int(self._offsets[i]):int(self._offsets[i + 1])]
+        return passage
+
+
+def _char_width(text: str) -> int:
+    if not text or ord(max(text)) < 0x100:
+        return 1
+    try:
+        text.encode("utf-16-le")
+    except UnicodeEncodeError:
+        return 4
+    # Astral characters take two UTF-16 code units, which would break fixed-width slicing
+    return 2 if ord(max(text)) < 0x10000 else 4
+
+
+def _encode_text(text: str) -> Tuple[bytes, Dict]:
+    width = _char_width(text)
+    return text.encode(_ENCODINGS[width]), {"kind": "text", "width": width, "length": len(text)}
+
+
+def _fingerprint(path: str, with_hash: bool = True) -> Dict:
+    stat = os.stat(path)
+    fingerprint = {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def _is_fresh(recorded: Optional[Dict], path: Optional[str]) -> bool:
+    if recorded is None or path is None:
+        return recorded is None and path is None
+    if not os.path.exists(path):
+        return False
+    current = _fingerprint(path, with_hash=False)
+    if current["size"] != recorded["size"]:
+        return False
+    if current["mtime_ns"] == recorded["mtime_ns"]:
+        return True
+    # Touched but possibly unchanged: fall back to the content hash
+    return _fingerprint(path)["sha256"] == recorded["sha256"]
+
+
+def write_snapshot(snapshot_path: str, data_file_path: str, chunks_file_path: str = None) -> Dict:
+    """Build the indexes from the source files and write them atomically to snapshot_path"""
+    with open(data_file_path, 'r') as f:
+        text = f.read()
+    index = CorpusIndex(text)
+    corpus_metadata, corpus_arrays = index.snapshot_sections()
+
+    sections: Dict[str, Tuple[bytes, Dict]] = {
+        "text": _encode_text(text),
+        "lowered": _encode_text(text.lower()),
+    }
+    for name, values in corpus_arrays.items():
+        sections[name] = (values.tobytes(), {"kind": "array", "typecode": values.typecode})
+
+    header = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "passage_words": PASSAGE_WORDS,
+        "sources": {
+            "data": _fingerprint(data_file_path),
+            "chunks": _fingerprint(chunks_file_path) if chunks_file_path else None,
+        },
+        "corpus": corpus_metadata,
+        "bm25": None,
+    }
+
+    if chunks_file_path:
+        passages = load_parsed_pdf(chunks_file_path)
+        bm25_metadata, bm25_arrays = BM25Index(passages).snapshot_sections()
+        passage_text = "".join(passage["text"] for passage in passages)
+        passage_offsets = np.zeros(len(passages) + 1, dtype=np.int64)
+        passage_offsets[1:] = np.cumsum([len(passage["text"]) for passage in passages])
+        bm25_metadata["passages"] = [
+            {key: value for key, value in passage.items() if key != "text"} for passage in passages
+        ]
+        header["bm25"] = bm25_metadata
+        sections["passage_text"] = _encode_text(passage_text)
+        bm25_arrays["passage_offsets"] = passage_offsets
+        for name, values in bm25_arrays.items():
+            sections[name] = (values.tobytes(), {"kind": "numpy", "dtype": values.dtype.str})
+
+    # Lay the sections out back to back, each aligned for zero-copy typed views
+    offset = 0
+    layout = {}
+    for name, (data, description) in sections.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = dict(description, offset=offset, size=len(data))
+        offset += len(data)
+    header["sections"] = layout
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for name, (data, _) in sections.items():
+                f.seek(data_start + layout[name]["offset"])
+                f.write(data)
+        # Readers either see the old snapshot or the complete new one
+        os.replace(temp_path, snapshot_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return header
+
+
+def _read_header(mapping) -> Tuple[Dict, int]:
+    if mapping[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a corpus snapshot")
+    (header_length,) = struct.unpack_from("<Q", mapping, len(MAGIC))
+    start = len(MAGIC) + 8
+    if start + header_length > len(mapping):
+        raise ValueError("header runs past the end of the snapshot")
+    header = json.loads(bytes(mapping[start:start + header_length]).decode("utf-8"))
+    missing = [key for key in HEADER_KEYS if key not in header]
+    if missing:
+        raise ValueError(f"header is missing {', '.join(missing)}")
+    data_start = -(-(start + header_length) // ALIGNMENT) * ALIGNMENT
+    return header, data_start
+
+
+def _map_sections(mapping, header: Dict, data_start: int) -> Dict:
+    view = memoryview(mapping)
+    sections = {}
+    for name, description in header["sections"].items():
+        start = data_start + description["offset"]
+        size = description["size"]
+        if description["offset"] < 0 or size < 0 or start + size > len(mapping):
+            raise ValueError(f"section {name} runs past the end of the snapshot")
+        if description["kind"] == "text":
+            sections[name] = MappedText(view[start:start + size], description["width"], description["length"])
+        elif description["kind"] == "array":
+            sections[name] = view[start:start + size].cast(description["typecode"])
+        else:
+            dtype = np.dtype(description["dtype"])
+            sections[name] = np.frombuffer(mapping, dtype=dtype, count=size // dtype.itemsize, offset=start)
+    return sections
+
+
+def load_snapshot(snapshot_path: str, data_file_path: str, chunks_file_path: str = None):
+    """
+    Map a snapshot read-only and return (CorpusIndex, PassageRetriever or None), or None
+    when the snapshot is missing, from another format version, its sources changed, or
+    it is truncated or corrupt.
+    """
+    if not os.path.exists(snapshot_path):
+        return None
+
+    try:
+        with open(snapshot_path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header, data_start = _read_header(mapping)
+        if (header["version"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder
+                or header["passage_words"] != PASSAGE_WORDS
+                or not _is_fresh(header["sources"]["data"], data_file_path)
+                or not _is_fresh(header["sources"]["chunks"], chunks_file_path)):
+            return None
+
+        sections = _map_sections(mapping, header, data_start)
+        index = CorpusIndex.from_snapshot(sections["text"], sections["lowered"], header["corpus"], sections)
+        retriever = None
+        if header["bm25"] is not None:
+            passages = MappedPassages(sections["passage_text"], sections["passage_offsets"], header["bm25"]["passages"])
+            retriever = PassageRetriever(index=BM25Index.from_snapshot(passages, header["bm25"], sections))
+    except (OSError, ValueError, KeyError, TypeError, struct.error) as e:
+        print(f"Ignoring unreadable corpus snapshot {snapshot_path}: {str(e)}")
+        return None
+    return index, retriever
+
+
+def load_or_build(snapshot_path: str, data_file_path: str, chunks_file_path: str = None):
+    """Load a fresh snapshot, rebuilding it first if it is missing or stale"""
+    loaded = load_snapshot(snapshot_path, data_file_path, chunks_file_path)
+    if loaded is None:
+        write_snapshot(snapshot_path, data_file_path, chunks_file_path)
+        loaded = load_snapshot(snapshot_path, data_file_path, chunks_file_path)
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the memory-mapped corpus snapshot")
+    parser.add_argument("command", choices=["build", "check"])
+    parser.add_argument("--data", default="./data/data.txt")
+    parser.add_argument("--chunks", default=None, help="parsed-PDF JSON to index for BM25 retrieval")
+    parser.add_argument("--out", default="./data/corpus.snapshot")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        header = write_snapshot(args.out, args.data, args.chunks)
+        print(f"Wrote {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB, "
+              f"{len(header['corpus']['terms'])} terms) in {time.perf_counter() - start:.2f}s")
+    else:
+        start = time.perf_counter()
+        loaded = load_snapshot(args.out, args.data, args.chunks)
+        if loaded is None:
+            print(f"{args.out} is missing or stale")
+            sys.exit(1)
+        print(f"{args.out} is fresh, mapped in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
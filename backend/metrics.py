@@ -0,0 +1,300 @@
+"""
+Latency instrumentation for /api/tactics.
+
+Each request and each upstream generation gets a Trace that times its stages (queue
+wait, first token, thinking, answer, keyword extraction, context lookup, validation,
+serialization). When a trace finishes, its stage times go into the tactics_stage_seconds
+histogram and the trace is logged as one JSON line on the "tactics" logger. /api/metrics
+renders every metric in the Prometheus text format:
+
+    curl localhost:5000/api/metrics
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers a cache lookup up to a long 7b generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Structured per-request logs, one JSON object per line on stderr; TACTICS_LOG_LEVEL=WARNING silences them
+logger = logging.getLogger("tactics")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.environ.get("TACTICS_LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(tuple(labels.get(name, "") for name in self.labels))
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    labels = _format_labels(self.labels, key, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(round(total[0], 6))}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Called on every scrape for point-in-time values (cache sizes, queue lengths, ...)
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "tactics_stage_seconds", "Time spent in each stage of a tactics request or generation", ("stage",)
+)
+REQUESTS = REGISTRY.counter("tactics_requests_total", "Finished /api/tactics requests", ("cache", "status"))
+ERRORS = REGISTRY.counter("tactics_errors_total", "Errors by the stage they happened in", ("stage",))
+GENERATED_TOKENS = REGISTRY.counter("ollama_generated_tokens_total", "Tokens generated by Ollama (eval_count)", ("model",))
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "ollama_tokens_per_second", "Decode speed of each generation (eval_count / eval_duration)", ("model",), RATE_BUCKETS
+)
+CONTEXT_TOKENS = REGISTRY.counter("tactics_context_tokens_total", "Estimated reference-context tokens sent to the judge")
+CONTEXT_TOKENS_SAVED = REGISTRY.counter(
+    "tactics_context_tokens_saved_total", "Estimated prompt tokens the context packer left out"
+)
+CANCELLED_GENERATIONS = REGISTRY.counter(
+    "tactics_cancelled_generations_total", "Generations stopped early, by why they stopped", ("reason",)
+)
+TOKENS_AVOIDED = REGISTRY.counter(
+    "tactics_tokens_avoided_total", "Estimated tokens stopped generations did not generate", ("reason",)
+)
+
+
+class Trace:
+    """Stage timings of one request or generation, logged as one JSON line by finish()"""
+
+    def __init__(self, kind: str, **fields):
+        self.kind = kind
+        self.fields = dict(fields)
+        self.stages: Dict[str, float] = {}
+        self.start = time.perf_counter()
+        self._marks: Dict[str, float] = {}
+        self._finished = False
+        # Keyword lookups record their stages from a worker thread
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(name, e)
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark(self, name: str) -> bool:
+        """Remember when something first happened; True the first time"""
+        with self._lock:
+            if name in self._marks:
+                return False
+            self._marks[name] = time.perf_counter()
+            return True
+
+    def since(self, name: str) -> Optional[float]:
+        """Seconds since mark(name), or None if it was never marked"""
+        with self._lock:
+            marked = self._marks.get(name)
+        return time.perf_counter() - marked if marked is not None else None
+
+    def first(self, stage: str):
+        """Record the time from the start of the trace to the first time this is called for stage"""
+        if self.mark(stage):
+            self.record(stage, self.elapsed())
+
+    def error(self, stage: str, error):
+        ERRORS.inc(stage=stage)
+        with self._lock:
+            self.fields.setdefault("errors", []).append({"stage": stage, "message": str(error)})
+
+    def timed_out(self, name: str):
+        """A deadline that passed: noted on the log line as <name>_timeout, it is not an error"""
+        with self._lock:
+            self.fields[f"{name}_timeout"] = True
+
+    def generation_stats(self, model: str, done: Dict):
+        """Token counts and decode speed from the "done" chunk of OllamaLLM.generate_stream"""
+        tokens, duration = done.get("eval_count"), done.get("eval_duration")
+        if not tokens:
+            return
+        GENERATED_TOKENS.inc(tokens, model=model)
+        self.fields["eval_count"] = tokens
+        if duration:
+            rate = tokens / (duration / 1e9)
+            TOKENS_PER_SECOND.observe(rate, model=model)
+            self.fields["tokens_per_sec"] = round(rate, 2)
+
+    def context_stats(self, pack: Dict):
+        """Prompt tokens kept and saved by a context_packer pack"""
+        CONTEXT_TOKENS.inc(pack["tokens"])
+        CONTEXT_TOKENS_SAVED.inc(pack["tokens_saved"])
+        self.fields["context_tokens"] = pack["tokens"]
+        self.fields["context_tokens_saved"] = pack["tokens_saved"]
+
+    def stopped_early(self, reason: str, generated: int, avoided: int):
+        """A generation cancelled or capped after `generated` tokens, `avoided` more expected"""
+        CANCELLED_GENERATIONS.inc(reason=reason)
+        TOKENS_AVOIDED.inc(avoided, reason=reason)
+        self.fields["stopped"] = reason
+        self.fields["tokens_generated"] = generated
+        self.fields["tokens_avoided"] = avoided
+
+    def finish(self, **fields):
+        """Observe the stage times and log the trace; later calls do nothing"""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            self.fields.update(fields)
+            self.stages["total"] = self.elapsed()
+            stages = dict(self.stages)
+        for stage, seconds in stages.items():
+            STAGE_SECONDS.observe(seconds, stage=f"{self.kind}_{stage}" if stage == "total" else stage)
+        record = {"event": self.kind, **self.fields, "stages": {stage: round(s, 4) for stage, s in stages.items()}}
+        logger.info(json.dumps(record, default=str))
+
+
+def observe_chunk(trace: Trace, model: str, chunk: Dict):
+    """Generation stages from OllamaLLM.generate_stream chunks: first token (queue wait included), thinking, answer"""
+    trace.first("first_token")
+    if chunk["type"] == "thinking" and chunk.get("is_complete"):
+        trace.record("thinking", trace.since("first_token"))
+        trace.mark("thinking_complete")
+    elif chunk["type"] == "done":
+        answer_start = "thinking_complete" if trace.since("thinking_complete") is not None else "first_token"
+        trace.record("answer", trace.since(answer_start))
+        trace.generation_stats(model, chunk)
+
+
+def timed(trace: Optional[Trace], stage: str):
+    """trace.stage(stage), or a no-op when there is no trace"""
+    return trace.stage(stage) if trace is not None else nullcontext()
+
+
+def stats_lines(prefix: str, stats: Dict, **labels) -> List[str]:
+    """Numeric values of a stats() dict as untyped Prometheus samples"""
+    label_text = _format_labels(sorted(labels), [labels[name] for name in sorted(labels)])
+    return [
+        f"{prefix}_{name}{label_text} {_format_value(value)}"
+        for name, value in stats.items()
+        if isinstance(value, (int, float))
+    ]
@@ -0,0 +1,137 @@
+import os
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "10"))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "3.05"))
+# Generations can pause for a long time while the model loads or thinks
+DEFAULT_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "300"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "3"))
+DEFAULT_BACKOFF_FACTOR = float(os.environ.get("OLLAMA_BACKOFF_FACTOR", "0.25"))
+
+
+class CountingRetry(Retry):
+    """Retry that reports each retry it allows, including those of requests that end up failing"""
+
+    def __init__(self, *args, on_retry=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_retry = on_retry
+
+    def new(self, **kwargs) -> "CountingRetry":
+        # urllib3 makes a new Retry for every attempt
+        retry = super().new(**kwargs)
+        retry.on_retry = self.on_retry
+        return retry
+
+    def increment(self, *args, **kwargs) -> "CountingRetry":
+        # Raises MaxRetryError instead when no retry is left
+        retry = super().increment(*args, **kwargs)
+        if self.on_retry is not None:
+            self.on_retry()
+        return retry
+
+
+class OllamaSession:
+    """
+    Connection-pooled, keep-alive HTTP client shared by every call to an Ollama server.
+
+    Only connection errors are retried (with exponential backoff): at that point nothing
+    reached the server, so retrying a generate request cannot start a duplicate generation.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR
+    ):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+
+        retry = CountingRetry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=backoff_factor,
+            allowed_methods=None,  # Safe for POST because only connect errors are retried
+            raise_on_status=False,
+            on_retry=self._count_retry
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+
+    def _count_retry(self):
+        with self._lock:
+            self._retries += 1
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._requests += 1
+        try:
+            return self._session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict:
+        """Connection reuse metrics aggregated over all pooled hosts"""
+        connections = 0
+        pool_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            pool_requests += pool.num_requests
+
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "connections_opened": connections,
+                "connections_reused": max(0, pool_requests - connections),
+                "retries": self._retries,
+                "errors": self._errors,
+                "pool_size": self.pool_size
+            }
+
+    def close(self):
+        self._session.close()
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session() -> OllamaSession:
+    """The process-wide session used when a client is not given its own"""
+    global _default_session
+    if _default_session is None:
+        with _default_session_lock:
+            if _default_session is None:
+                _default_session = OllamaSession()
+    return _default_session
@@ -0,0 +1,232 @@
+"""
+Cache of finished /api/tactics responses, keyed on normalized prompts.
+
+"How do we beat a 4-4-2?" and "tactics vs 442" normalize to the same key, so the second
+question replays the first one's thinking, answer and validation instead of running a
+full generation. The key keeps the order of the words: "beat a 4-4-2 with a 3-5-2" and
+"beat a 3-5-2 with a 4-4-2" are different questions. Prompts that only normalize to
+nearly the same words in nearly the same order can also match; a small inverted index
+over the cached words finds the candidates.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, List, Optional, Set
+
+from retrieval import tokenize
+from tactics_stream import PENDING_KEYWORDS, PENDING_VALIDATION, TacticsStream
+
+CACHE_HEADER = "X-Cache"
+BYPASS_HEADER = "X-Cache-Bypass"
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "86400"))
+# Minimum similarity of the normalized word sequences for a near match; 0 turns near matches off
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.8"))
+# Seconds between replayed tokens; 0 sends a cached response as fast as the client reads it
+RESPONSE_CACHE_REPLAY_DELAY = float(os.environ.get("RESPONSE_CACHE_REPLAY_DELAY", "0"))
+
+FORMATION_RE = re.compile(r'(?<![\w-])([1-6])[\s-]?([1-6])[\s-]?([1-6])(?:[\s-]?([1-6]))?(?![\w-])')
+REPLAY_TOKEN_RE = re.compile(r'\s*\S+(?:\s+$)?')
+
+# Words that say how a question is phrased rather than what it is about
+QUESTION_WORDS = frozenset("""
+how what which why when best way ways tactic tactics tactical strategy strategies should
+can could would do does we i you our my me us please tell give good
+""".split())
+SYNONYMS = {
+    "vs": "against", "versus": "against", "beat": "against", "beating": "against",
+    "counter": "against", "countering": "against", "face": "against", "facing": "against",
+}
+
+
+def _formation(match) -> str:
+    digits = [d for d in match.groups() if d]
+    # Only digit groups that add up to ten outfield-plus-keeper lines are formations
+    if sum(int(d) for d in digits) != 10:
+        return match.group()
+    return " " + "_".join(digits) + " "
+
+
+def normalize_prompt(prompt: str) -> List[str]:
+    """Content words of a prompt in order, with formations written as 4_4_2"""
+    text = FORMATION_RE.sub(_formation, prompt or "")
+    words = (SYNONYMS.get(token, token) for token in tokenize(text))
+    return [word for word in words if word not in QUESTION_WORDS]
+
+
+def _has_digit(token: str) -> bool:
+    return any(c.isdigit() for c in token)
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU of response snapshots (StreamState.snapshot()) bounded by entry count,
+    total size and age. lookup() tries the exact normalized key first, then the most
+    similar cached word sequence above the similarity threshold. Shared words only pick
+    the candidates; formations and other numbers must match in the same order.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: float = RESPONSE_CACHE_TTL, similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._postings: Dict[str, Set[str]] = {}   # normalized word -> cache keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+        for word in entry["word_set"]:
+            keys = self._postings.get(word)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[word]
+
+    def _live(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires"] <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def _nearest(self, words: List[str]) -> Optional[str]:
+        if self.similarity <= 0 or not words:
+            return None
+        word_set = frozenset(words)
+        numbers = [word for word in words if _has_digit(word)]
+        candidates = set()
+        for word in word_set:
+            candidates.update(self._postings.get(word, ()))
+        best_key, best_score = None, self.similarity
+        for key in candidates:
+            entry = self._entries[key]
+            other = entry["words"]
+            # Set overlap is a cheap filter; it cannot tell "beat X with Y" from "beat Y with X"
+            if len(word_set & entry["word_set"]) / len(word_set | entry["word_set"]) < self.similarity:
+                continue
+            if [word for word in other if _has_digit(word)] != numbers:
+                continue
+            score = SequenceMatcher(None, words, other, autojunk=False).ratio()
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def lookup(self, prompt: str) -> Optional[Dict]:
+        """The cached snapshot for prompt, or None"""
+        words = normalize_prompt(prompt)
+        key = " ".join(words)
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                near = self._nearest(words)
+                entry = self._live(near) if near is not None else None
+                if entry is not None:
+                    self.near_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry["key"])
+            self.hits += 1
+            return entry["snapshot"]
+
+    def store(self, prompt: str, snapshot: Dict):
+        if not snapshot.get("answer") or self.max_entries <= 0:
+            return
+        words = normalize_prompt(prompt)
+        key = " ".join(words)
+        if not key:
+            return
+        size = len(json.dumps(snapshot))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "key": key,
+                "words": list(words),
+                "word_set": frozenset(words),
+                "snapshot": dict(snapshot),
+                "size": size,
+                "expires": time.monotonic() + self.ttl,
+            }
+            self._bytes += size
+            for word in set(words):
+                self._postings.setdefault(word, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def wants_bypass(headers) -> bool:
+    """True when the client asked to skip the response cache"""
+    value = headers.get(BYPASS_HEADER) or headers.get(BYPASS_HEADER.lower())
+    if value is not None and str(value).strip().lower() not in ("", "0", "false", "no"):
+        return True
+    cache_control = headers.get("Cache-Control") or headers.get("cache-control") or ""
+    return "no-cache" in cache_control.lower()
+
+
+def replay_chunks(snapshot: Dict) -> Iterator[Dict]:
+    """Re-create the OllamaLLM.generate_stream chunks of a cached response, a word at a time"""
+    thinking = snapshot.get("thinking") or ""
+    if thinking:
+        for token in REPLAY_TOKEN_RE.findall(thinking):
+            yield {"type": "thinking", "delta": token, "is_complete": False}
+        yield {"type": "thinking", "content": thinking, "is_complete": True}
+    answer = snapshot.get("answer") or ""
+    for token in REPLAY_TOKEN_RE.findall(answer):
+        yield {"type": "answer", "content": token}
+    yield {"type": "done", "content": answer, "is_complete": True}
+
+
+def replay_lines(snapshot: Dict, encoder) -> Iterator[List[str]]:
+    """
+    Encoded lines for a cached response, one list per replayed token, so the caller can
+    pace them (RESPONSE_CACHE_REPLAY_DELAY) between lists.
+    """
+    stream = TacticsStream(encoder)
+    validation_result = {
+        "accuracy_score": snapshot.get("accuracy_score", 0),
+        "validation": snapshot.get("validation_details", "")
+    }
+    for chunk in replay_chunks(snapshot):
+        lines = stream.feed(chunk)
+        if stream.pending == PENDING_KEYWORDS:
+            lines += stream.keywords_ready(snapshot.get("keywords") or [])
+        elif stream.pending == PENDING_VALIDATION:
+            lines += stream.validation_ready(validation_result)
+        if lines:
+            yield lines
@@ -0,0 +1,196 @@
+import json
+import math
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+WORD_RE = re.compile(r'\w+')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+PASSAGE_WORDS = 120
+DEFAULT_TOKEN_BUDGET = 512
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or that the their
+them they this to was were which will with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in WORD_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def count_terms(text: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for token in tokenize(text):
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token for English prose)"""
+    return max(1, len(text) // 4)
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> List[str]:
+    """Pack whole sentences into passages of at most max_words words"""
+    passages = []
+    current: List[str] = []
+    current_words = 0
+    for sentence in SENTENCE_RE.split(text):
+        words = len(sentence.split())
+        if not words:
+            continue
+        if current and current_words + words > max_words:
+            passages.append(" ".join(current))
+            current, current_words = [], 0
+        current.append(sentence.strip())
+        current_words += words
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def load_parsed_pdf(json_path: str, max_words: int = PASSAGE_WORDS) -> List[Dict]:
+    """
+    Load the parsed-PDF JSON (result.chunks[].blocks[]) into passages carrying
+    their page and bounding box for citations.
+    """
+    with open(json_path, 'r') as f:
+        document = json.load(f)
+
+    passages = []
+    for chunk in document.get("result", {}).get("chunks", []):
+        for block in chunk.get("blocks", []):
+            content = block.get("content") or ""
+            bbox = block.get("bbox") or {}
+            for text in split_passages(content, max_words):
+                passages.append({
+                    "text": text,
+                    "page": bbox.get("page"),
+                    "bbox": bbox,
+                    "source": json_path
+                })
+    return passages
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed set of passages.
+
+    Postings are stored per term as NumPy arrays of (passage id, term frequency), so a
+    query costs one vectorized update per query term rather than a loop over passages.
+    """
+
+    def __init__(self, passages: List[Dict], k1: float = 1.5, b: float = 0.75,
+                 term_frequencies: List[Dict[str, int]] = None):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+
+        # term_frequencies, one {term: count} per passage, skips tokenizing (see corpus_library)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(len(passages), dtype=np.float32)
+        for doc_id, passage in enumerate(passages):
+            if term_frequencies is not None:
+                counts = term_frequencies[doc_id]
+            else:
+                counts = count_terms(passage["text"])
+            lengths[doc_id] = sum(counts.values())
+            for token, tf in counts.items():
+                postings.setdefault(token, {})[doc_id] = tf
+
+        count = len(passages)
+        average = float(lengths.mean()) if count else 0.0
+        # Per-passage part of the BM25 denominator, computed once
+        self._length_norm = k1 * (1 - b + b * lengths / average) if average else np.full(count, k1, dtype=np.float32)
+        self._postings = {}
+        for term, frequencies in postings.items():
+            doc_ids = np.fromiter(frequencies.keys(), dtype=np.int32, count=len(frequencies))
+            tf = np.fromiter(frequencies.values(), dtype=np.float32, count=len(frequencies))
+            idf = math.log(1 + (count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            self._postings[term] = (doc_ids, tf, idf)
+
+    def snapshot_sections(self):
+        """(metadata, {name: array}) for corpus_snapshot to write; passages are stored separately"""
+        terms = list(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self._postings[term][0]) for term in terms])
+        empty_ids, empty_tf = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        sections = {
+            "bm25_offsets": offsets,
+            "bm25_doc_ids": np.concatenate([self._postings[term][0] for term in terms] or [empty_ids]),
+            "bm25_tf": np.concatenate([self._postings[term][1] for term in terms] or [empty_tf]),
+            "bm25_idf": np.array([self._postings[term][2] for term in terms], dtype=np.float32),
+            "bm25_length_norm": np.asarray(self._length_norm, dtype=np.float32),
+        }
+        return {"terms": terms, "k1": self.k1, "b": self.b}, sections
+
+    @classmethod
+    def from_snapshot(cls, passages, metadata, sections) -> "BM25Index":
+        """Rebuild the index around NumPy views into a corpus_snapshot mapping"""
+        index = cls.__new__(cls)
+        index.passages = passages
+        index.k1 = metadata["k1"]
+        index.b = metadata["b"]
+        index._length_norm = sections["bm25_length_norm"]
+        offsets = sections["bm25_offsets"]
+        doc_ids, tf, idf = sections["bm25_doc_ids"], sections["bm25_tf"], sections["bm25_idf"]
+        index._postings = {
+            term: (doc_ids[offsets[i]:offsets[i + 1]], tf[offsets[i]:offsets[i + 1]], float(idf[i]))
+            for i, term in enumerate(metadata["terms"])
+        }
+        return index
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            doc_ids, tf, idf = entry
+            scores[doc_ids] += idf * tf * (self.k1 + 1) / (tf + self._length_norm[doc_ids])
+        return scores
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+        """Top passages for a query, best first, each with its BM25 score"""
+        scores = self.scores(query)
+        if not len(scores):
+            return []
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            dict(self.passages[doc_id], score=float(scores[doc_id]))
+            for doc_id in ranked if scores[doc_id] > 0
+        ]
+
+
+class PassageRetriever:
+    """Relevance-ranked reference passages with page citations for the validator"""
+
+    def __init__(self, passages: List[Dict] = None, index: BM25Index = None):
+        self.index = index if index is not None else BM25Index(passages)
+
+    @classmethod
+    def from_parsed_pdf(cls, json_path: str) -> "PassageRetriever":
+        return cls(load_parsed_pdf(json_path))
+
+    def retrieve(self, query: str, token_budget: int = DEFAULT_TOKEN_BUDGET, top_k: int = 20) -> List[Dict]:
+        """Best-ranked passages that fit together into token_budget"""
+        selected = []
+        used = 0
+        for passage in self.index.search(query, top_k=top_k):
+            tokens = estimate_tokens(passage["text"])
+            if used + tokens > token_budget:
+                continue
+            selected.append(passage)
+            used += tokens
+        return selected
+
+
+def format_citation(passage: Dict) -> str:
+    page: Optional[int] = passage.get("page")
+    prefix = f"[p. {page}] " if page is not None else ""
+    return prefix + passage["text"]
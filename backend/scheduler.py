@@ -0,0 +1,274 @@
+"""
+Admission control and priority scheduling for calls to the local Ollama server.
+
+Each model gets a bounded number of concurrent upstream calls. Callers that find every
+slot busy wait in a per-model queue ordered by priority (interactive token streams
+before background keyword and validation jobs, first come first served within a
+priority) until a slot frees up or their deadline passes. When the queue itself is
+full, request() fails fast with Overloaded, which carries the caller's would-be queue
+position and a retry estimate for a 429 response.
+
+Waiters can block a thread (wait) or an asyncio task (wait_async), so one scheduler
+covers both the threaded calls and the coroutines of a process.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "4"))
+# Per-model overrides, e.g. "deepseek-r1:7b=2,deepseek-r1:1.5b=4"
+MODEL_CONCURRENCY = os.environ.get("OLLAMA_MODEL_CONCURRENCY", "")
+DEFAULT_MAX_QUEUE = int(os.environ.get("SCHEDULER_MAX_QUEUE", "32"))
+# How long a call may wait for a slot, by priority
+DEFAULT_QUEUE_TIMEOUTS = {
+    INTERACTIVE: float(os.environ.get("SCHEDULER_INTERACTIVE_TIMEOUT", "30")),
+    BACKGROUND: float(os.environ.get("SCHEDULER_BACKGROUND_TIMEOUT", "30")),
+}
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, limit = item.rsplit("=", 1)
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class Overloaded(Exception):
+    """The model's queue is full; nothing was queued"""
+
+    def __init__(self, model: str, position: int, queue_length: int, retry_after: float):
+        super().__init__(f"{model} is busy ({queue_length} requests queued)")
+        self.model = model
+        self.position = position
+        self.queue_length = queue_length
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict:
+        return {
+            "status": "error",
+            "message": "Server is busy, please try again shortly",
+            "queue_position": self.position,
+            "queue_length": self.queue_length,
+            "retry_after": self.retry_after,
+        }
+
+
+class QueueTimeout(Exception):
+    """A queued call did not get a slot before its deadline"""
+
+
+class Waiter:
+    """A place in a model's queue; once granted it holds one slot until release()"""
+
+    def __init__(self, scheduler: "Scheduler", model: str, priority: int, seq: int):
+        self.scheduler = scheduler
+        self.model = model
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+        self.abandoned = False
+        self.released = False
+        self.queued_at = time.monotonic()
+        self.granted_at = None
+        self._event = threading.Event()
+        self._loop = None
+        self._future = None
+
+    def __lt__(self, other: "Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def _grant(self):
+        # Called with the scheduler lock held
+        self.granted = True
+        self.granted_at = time.monotonic()
+        self._event.set()
+        if self._future is not None:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def position(self) -> int:
+        """1-based place in the queue, 0 once granted"""
+        return self.scheduler.position(self)
+
+    def wait(self, timeout: Optional[float] = None):
+        if not self._event.wait(self._timeout(timeout)):
+            self.scheduler.abandon(self)
+            if not self.granted:
+                raise QueueTimeout(f"No {self.model} slot within {self._timeout(timeout):.0f}s")
+
+    async def wait_async(self, timeout: Optional[float] = None):
+        if self.granted:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+        if self.granted:  # granted before the future existed
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), self._timeout(timeout))
+        except asyncio.TimeoutError:
+            self.scheduler.abandon(self)
+            if not self.granted:
+                raise QueueTimeout(f"No {self.model} slot within {self._timeout(timeout):.0f}s")
+        except asyncio.CancelledError:
+            self.scheduler.abandon(self)
+            raise
+
+    def _timeout(self, timeout: Optional[float]) -> float:
+        return self.scheduler.queue_timeouts.get(self.priority, 30.0) if timeout is None else timeout
+
+    def release(self):
+        self.scheduler.release(self)
+
+
+class Scheduler:
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, model_limits: Dict[str, int] = None,
+                 max_queue: int = DEFAULT_MAX_QUEUE, queue_timeouts: Dict[int, float] = None):
+        self.max_concurrency = max_concurrency
+        self.model_limits = dict(parse_model_limits(MODEL_CONCURRENCY) if model_limits is None else model_limits)
+        self.max_queue = max_queue
+        self.queue_timeouts = dict(DEFAULT_QUEUE_TIMEOUTS if queue_timeouts is None else queue_timeouts)
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._active: Dict[str, int] = {}
+        self._queues: Dict[str, List[Waiter]] = {}
+        self._hold_time: Dict[str, float] = {}   # moving average of how long a slot is held
+        self._counters = {"admitted": 0, "queued": 0, "rejected": 0, "abandoned": 0}
+
+    def limit(self, model: str) -> int:
+        return self.model_limits.get(model, self.max_concurrency)
+
+    def _queue_length(self, model: str) -> int:
+        return sum(1 for waiter in self._queues.get(model, ()) if not waiter.abandoned)
+
+    def _retry_after(self, model: str, position: int) -> float:
+        # Each of the model's slots frees up about once per average hold time
+        hold = self._hold_time.get(model, 1.0)
+        return round(max(1.0, hold * position / self.limit(model)), 1)
+
+    def request(self, model: str, priority: int = INTERACTIVE) -> Waiter:
+        """
+        Take a slot for model if one is free, otherwise join its queue. Raises Overloaded
+        when the queue is full. The returned waiter must be waited on (unless already
+        granted) and released.
+        """
+        with self._lock:
+            waiter = Waiter(self, model, priority, next(self._seq))
+            active = self._active.get(model, 0)
+            queue = self._queues.setdefault(model, [])
+            if active < self.limit(model) and not self._queue_length(model):
+                self._active[model] = active + 1
+                self._counters["admitted"] += 1
+                waiter._grant()
+                return waiter
+            queued = self._queue_length(model)
+            if queued >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise Overloaded(model, queued + 1, queued, self._retry_after(model, queued + 1))
+            heapq.heappush(queue, waiter)
+            self._counters["queued"] += 1
+            return waiter
+
+    def check(self, model: str):
+        """Raise Overloaded if a new call for model would be rejected, without queueing it"""
+        with self._lock:
+            queued = self._queue_length(model)
+            if self._active.get(model, 0) >= self.limit(model) and queued >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise Overloaded(model, queued + 1, queued, self._retry_after(model, queued + 1))
+
+    def position(self, waiter: Waiter) -> int:
+        with self._lock:
+            if waiter.granted:
+                return 0
+            return 1 + sum(
+                1 for other in self._queues.get(waiter.model, ())
+                if not other.abandoned and other < waiter
+            )
+
+    def abandon(self, waiter: Waiter):
+        """Give up a queued place after a timeout or cancellation; a no-op once granted"""
+        with self._lock:
+            if not waiter.granted and not waiter.abandoned:
+                waiter.abandoned = True
+                self._counters["abandoned"] += 1
+
+    def _grant_next(self, model: str):
+        queue = self._queues.get(model, [])
+        while queue and self._active.get(model, 0) < self.limit(model):
+            waiter = heapq.heappop(queue)
+            if waiter.abandoned:
+                continue
+            self._active[model] = self._active.get(model, 0) + 1
+            self._counters["admitted"] += 1
+            waiter._grant()
+
+    def release(self, waiter: Waiter):
+        with self._lock:
+            if not waiter.granted or waiter.released:
+                return
+            waiter.released = True
+            model = waiter.model
+            self._active[model] -= 1
+            held = time.monotonic() - waiter.granted_at
+            previous = self._hold_time.get(model)
+            self._hold_time[model] = held if previous is None else 0.8 * previous + 0.2 * held
+            self._grant_next(model)
+
+    @contextmanager
+    def slot(self, model: str, priority: int = BACKGROUND, timeout: Optional[float] = None):
+        waiter = self.request(model, priority)
+        try:
+            waiter.wait(timeout)
+            yield waiter
+        finally:
+            waiter.release()
+            self.abandon(waiter)
+
+    @asynccontextmanager
+    async def slot_async(self, model: str, priority: int = BACKGROUND, timeout: Optional[float] = None):
+        waiter = self.request(model, priority)
+        try:
+            await waiter.wait_async(timeout)
+            yield waiter
+        finally:
+            waiter.release()
+            self.abandon(waiter)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            models = set(self._active) | set(self._queues)
+            return dict(self._counters, models={
+                model: {
+                    "active": self._active.get(model, 0),
+                    "queued": self._queue_length(model),
+                    "limit": self.limit(model),
+                }
+                for model in sorted(models)
+            })
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler() -> Scheduler:
+    """The process-wide scheduler shared by every Ollama client in the process"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                _default_scheduler = Scheduler()
+    return _default_scheduler
@@ -0,0 +1,80 @@
+"""
+Conversation sessions for /api/tactics.
+
+A request that names a session (a "session_id" field in the body or the X-Session-Id
+header) continues that conversation. Ollama's final stream message carries a `context`
+token array: the conversation so far, as the model saw it. The store keeps it per
+session and sends it back with the next question, so follow-ups are answered in
+context. Ollama also reuses its KV cache for the prefix it already holds, instead of
+prefilling the whole conversation again, as long as the model stays loaded
+(keep_alive) and the session stays on the same backend.
+
+Sessions are kept in an LRU with a TTL: SESSION_MAX sessions at most, each holding
+its context as 4-byte ints. A conversation that grows past SESSION_MAX_CONTEXT tokens
+is reset: the context is Ollama's tokenization of the whole templated conversation, so
+cutting its start off would not leave a valid shorter one. The next question then
+starts a new conversation.
+"""
+import os
+import re
+from array import array
+from typing import Dict, List, Optional
+
+from Ollama import OLLAMA_KEEP_ALIVE, keep_alive_value
+from result_cache import TTLCache
+
+SESSION_HEADER = "X-Session-Id"
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "256"))
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "1800"))
+SESSION_MAX_CONTEXT = int(os.environ.get("SESSION_MAX_CONTEXT", "8192"))
+# Session calls keep the model loaded for follow-ups even when OLLAMA_KEEP_ALIVE is unset
+SESSION_KEEP_ALIVE = (OLLAMA_KEEP_ALIVE if OLLAMA_KEEP_ALIVE is not None
+                      else keep_alive_value(os.environ.get("SESSION_KEEP_ALIVE", "30m")))
+
+SESSION_ID_RE = re.compile(r'^[\w.:-]{1,128}$')
+
+
+def session_id_of(headers, body: Dict) -> Optional[str]:
+    """The session a request continues, if it names a valid one"""
+    # Flask headers are case-insensitive, raw ASGI headers arrive lower-cased
+    session_id = (body or {}).get("session_id") or headers.get(SESSION_HEADER) or headers.get(SESSION_HEADER.lower())
+    if not isinstance(session_id, str) or not SESSION_ID_RE.match(session_id):
+        return None
+    return session_id
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL,
+                 max_context: int = SESSION_MAX_CONTEXT):
+        self.max_context = max_context
+        self._sessions = TTLCache(max_entries=max_sessions, ttl=ttl)
+        self.resets = 0
+
+    def stream_options(self, session_id: Optional[str]) -> Dict:
+        """Keyword arguments for OllamaLLM.generate_stream that continue the session"""
+        if session_id is None:
+            return {}
+        session = self._sessions.get(session_id)
+        if session is None:
+            return {"context": [], "keep_alive": SESSION_KEEP_ALIVE}
+        return {"context": session["context"].tolist(), "keep_alive": SESSION_KEEP_ALIVE,
+                "prefer": session["base_url"]}
+
+    def update(self, session_id: Optional[str], done: Dict):
+        """Remember the conversation from a generation's "done" chunk"""
+        context: List[int] = done.get("context")
+        if session_id is None or not context:
+            return
+        if len(context) > self.max_context:
+            self._sessions.discard(session_id)
+            self.resets += 1
+            return
+        previous = self._sessions.get(session_id)
+        self._sessions.put(session_id, {
+            "context": array("i", context),
+            "base_url": done.get("base_url"),
+            "turns": previous["turns"] + 1 if previous else 1,
+        })
+
+    def stats(self) -> Dict:
+        return dict(self._sessions.stats(), resets=self.resets)
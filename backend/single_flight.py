@@ -0,0 +1,209 @@
+"""
+Single-flight coalescing of identical /api/tactics generations.
+
+Requests with the same prompt (ignoring case and whitespace) share one upstream Ollama
+generation; a request that bypasses the response cache gets a generation of its own.
+A producer runs the generation and publishes its chunks, keywords, provisional scores
+and validation result to a Flight. Every request, the first included, follows the
+flight's buffer: it replays the events published so far, then waits for live ones, and
+encodes them with its own TacticsStream (so clients on different wire protocols can
+share a flight). When the last follower leaves before the generation is finished, the
+flight is cancelled and the upstream response closed.
+"""
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Tuple
+
+from tactics_stream import TacticsStream
+
+# Flight event kinds
+CHUNK = "chunk"            # an OllamaLLM.generate_stream chunk
+KEYWORDS = "keywords"      # (keywords, contexts)
+VALIDATION = "validation"  # validation result dict, or None
+SCORE = "score"            # provisional score from answer_scoring.IncrementalScorer
+QUEUED = "queued"          # queue position while waiting for a model slot
+ERROR = "error"            # error message
+
+Event = Tuple[str, Any]
+
+
+def flight_key(prompt: str, session_id: str = None) -> str:
+    # Only exactly the same question shares a generation; unlike the response cache, no synonyms or word sets
+    key = " ".join((prompt or "").lower().split())
+    # A follow-up depends on its conversation, so it only coalesces within the same session
+    return f"{key}\x00session:{session_id}" if session_id else key
+
+
+def encode_event(stream: TacticsStream, event: Event) -> List[str]:
+    """Encoded lines for one flight event on a follower's stream"""
+    kind, value = event
+    if kind == CHUNK:
+        lines = stream.feed(value)
+        # The producer extracts keywords once for everyone and publishes them
+        stream.keywords_started()
+        return lines
+    if kind == KEYWORDS:
+        return stream.keywords_ready(*value)
+    if kind == VALIDATION:
+        return stream.validation_ready(value)
+    if kind == SCORE:
+        return stream.score_ready(value)
+    if kind == QUEUED:
+        return stream.queued(value)
+    return [stream.error(value)]
+
+
+class Flight(ABC):
+    """Append-only event buffer for one shared generation"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[Event] = []
+        self.finished = False
+        self.cancelled = False
+        self.cancel_reason = None
+        self.followers = 0
+
+    @abstractmethod
+    def _wake(self):
+        """Wake every follower waiting for an event"""
+
+    def publish(self, kind: str, value: Any = None):
+        self.events.append((kind, value))
+        self._wake()
+
+    def finish(self):
+        self.finished = True
+        self._wake()
+
+    def interrupt(self):
+        """Wake the followers, so one that was cancelled stops waiting"""
+        self._wake()
+
+    def cancel(self, reason: str = None):
+        self.cancel_reason = reason
+        self.cancelled = True
+
+
+class ThreadedFlight(Flight):
+    """Flight for the Flask server: the producer runs on its own thread"""
+
+    def __init__(self, key: str):
+        super().__init__(key)
+        self._condition = threading.Condition()
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def publish(self, kind: str, value: Any = None):
+        with self._condition:
+            self.events.append((kind, value))
+            self._condition.notify_all()
+
+    def follow(self, stop=None):
+        """Every event from the start of the flight, blocking for new ones until it finishes or stop() is true"""
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.events) and not self.finished and not (stop and stop()):
+                    self._condition.wait()
+                if stop and stop():
+                    return
+                batch = self.events[index:]
+            if not batch:
+                return
+            index += len(batch)
+            yield from batch
+
+
+class AsyncFlight(Flight):
+    """Flight for the ASGI server: the producer is a task on the event loop"""
+
+    def __init__(self, key: str):
+        super().__init__(key)
+        self.task: asyncio.Task = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def cancel(self, reason: str = None):
+        super().cancel(reason)
+        if self.task is not None:
+            self.task.cancel()
+
+    async def follow(self):
+        index = 0
+        while True:
+            changed = self._changed
+            if index < len(self.events):
+                batch = self.events[index:]
+                index += len(batch)
+                for event in batch:
+                    yield event
+            elif self.finished:
+                return
+            else:
+                await changed.wait()
+
+
+class FlightGroup:
+    """In-flight generations by key; join() returns whether the caller must start the producer"""
+
+    def __init__(self, flight_class=ThreadedFlight):
+        self.flight_class = flight_class
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: str, share: bool = True) -> Tuple[Flight, bool]:
+        """With share=False (a cache-bypass request) the caller always gets a flight nobody else can join"""
+        with self._lock:
+            if not share:
+                flight = self.flight_class(key)
+                flight.followers = 1
+                self.started += 1
+                return flight, True
+            flight = self._flights.get(key)
+            if flight is not None and not (flight.finished or flight.cancelled):
+                flight.followers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self.flight_class(key)
+            flight.followers = 1
+            self._flights[key] = flight
+            self.started += 1
+            return flight, True
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            flight = self._flights.get(key)
+            return flight is not None and not (flight.finished or flight.cancelled)
+
+    def leave(self, flight: Flight, reason: str = None):
+        """reason: why the follower left early (cancellation.DISCONNECT, ...), None when it read to the end"""
+        with self._lock:
+            flight.followers -= 1
+            abandoned = flight.followers <= 0 and not flight.finished
+            if abandoned:
+                self._forget(flight)
+        if abandoned:
+            flight.cancel(reason)
+
+    def complete(self, flight: Flight):
+        """Called by the producer when the generation ends, however it ends"""
+        with self._lock:
+            self._forget(flight)
+        flight.finish()
+
+    def _forget(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"in_flight": len(self._flights), "started": self.started, "coalesced": self.coalesced}
@@ -0,0 +1,239 @@
+import json
+from typing import Dict, List, Optional
+
+# Wire protocol versions for /api/tactics.
+# 1 = legacy: every line carries the full thinking/answer snapshot.
+# 2 = delta: lines carry only appended text, plus periodic checkpoints
+#     and a final full snapshot.
+LEGACY_PROTOCOL_VERSION = 1
+DELTA_PROTOCOL_VERSION = 2
+PROTOCOL_HEADER = "X-Stream-Protocol"
+
+DEFAULT_CHECKPOINT_INTERVAL = 64
+
+
+def _dumps(payload: dict, compact: bool = True) -> str:
+    if compact:
+        return json.dumps(payload, separators=(',', ':')) + '\n'
+    return json.dumps(payload) + '\n'
+
+
+def negotiate_protocol(headers, body: Optional[dict]) -> int:
+    """Pick the wire protocol for a request, defaulting to legacy for old clients"""
+    # Flask headers are case-insensitive, raw ASGI headers arrive lower-cased
+    requested = headers.get(PROTOCOL_HEADER) or headers.get(PROTOCOL_HEADER.lower())
+    if requested is None and body:
+        requested = body.get('protocol')
+    if requested is None:
+        return LEGACY_PROTOCOL_VERSION
+
+    requested = str(requested).strip().lower()
+    if requested in ("2", "delta", "delta/2", "v2"):
+        return DELTA_PROTOCOL_VERSION
+    return LEGACY_PROTOCOL_VERSION
+
+
+class StreamState:
+    """Running thinking/answer/validation state for a single tactics stream"""
+
+    def __init__(self):
+        self._thinking_parts: List[str] = []
+        self._answer_parts: List[str] = []
+        self._answer_length = 0
+        self.keywords: List[str] = []
+        # Set when a length cap ended the generation (cancellation.THINKING_CAP or ANSWER_CAP)
+        self.truncated: Optional[str] = None
+        self.validation_result = {
+            "accuracy_score": 0,
+            "validation": "No matching context found in reference data"
+        }
+
+    def append_thinking(self, delta: str):
+        self._thinking_parts.append(delta)
+
+    @property
+    def thinking(self) -> str:
+        if len(self._thinking_parts) > 1:
+            self._thinking_parts = ["".join(self._thinking_parts)]
+        return self._thinking_parts[0] if self._thinking_parts else ""
+
+    @thinking.setter
+    def thinking(self, value: str):
+        # The completed thinking replaces whatever partial text was streamed
+        self._thinking_parts = [value] if value else []
+
+    def append_answer(self, token: str):
+        self._answer_parts.append(token)
+        self._answer_length += len(token)
+
+    @property
+    def answer(self) -> str:
+        # Collapse the parts so repeated reads stay cheap
+        if len(self._answer_parts) > 1:
+            self._answer_parts = ["".join(self._answer_parts)]
+        return self._answer_parts[0] if self._answer_parts else ""
+
+    @property
+    def answer_length(self) -> int:
+        return self._answer_length
+
+    def snapshot(self) -> Dict:
+        data = {
+            "thinking": self.thinking,
+            "answer": self.answer,
+            "accuracy_score": self.validation_result["accuracy_score"],
+            "validation_details": self.validation_result["validation"],
+            "keywords": self.keywords,
+        }
+        if self.truncated:
+            data["truncated"] = self.truncated
+        return data
+
+
+class LegacyStreamEncoder:
+    """Version 1 encoder: full snapshot on every line (what the frontend expects today)"""
+
+    version = LEGACY_PROTOCOL_VERSION
+
+    def thinking(self, state: StreamState, delta: str, is_complete: bool) -> str:
+        data = state.snapshot()
+        data["update_type"] = "thinking"
+        data["thinking_complete"] = is_complete
+        return _dumps({"status": "success", "data": data}, compact=False)
+
+    def keywords(self, state: StreamState) -> str:
+        data = state.snapshot()
+        data["update_type"] = "keywords"
+        data["thinking_complete"] = True
+        return _dumps({"status": "success", "data": data}, compact=False)
+
+    def answer(self, state: StreamState, token: str, thinking_just_completed: bool) -> str:
+        data = state.snapshot()
+        data["token"] = token
+        data["update_type"] = "answer"
+        data["prioritize_render"] = thinking_just_completed
+        data["thinking_complete"] = thinking_just_completed
+        return _dumps({"status": "success", "data": data}, compact=False)
+
+    def final(self, state: StreamState) -> str:
+        data = state.snapshot()
+        data["update_type"] = "final"
+        return _dumps({"status": "success", "data": data}, compact=False)
+
+    def score(self, state: StreamState, score: Dict) -> str:
+        # accuracy_score stays the final score; the running one goes in provisional_score
+        data = state.snapshot()
+        data["update_type"] = "score"
+        data["provisional_score"] = score["accuracy_score"]
+        data["scored_paragraphs"] = score["paragraphs"]
+        return _dumps({"status": "success", "data": data}, compact=False)
+
+    def queued(self, position: int) -> str:
+        # Not a "success" line, so clients that only render snapshots skip it
+        return _dumps({"status": "queued", "queue_position": position}, compact=False)
+
+    def error(self, message: str) -> str:
+        return _dumps({"status": "error", "message": message}, compact=False)
+
+
+class DeltaStreamEncoder:
+    """
+    Version 2 encoder: only appended text goes on the wire.
+
+    Events (one JSON object per line, all carrying "v" and a sequence number):
+      thinking           {"append": str}
+      thinking_complete  {"thinking": str, "keywords": [...]}  canonical thinking, sent once
+      keywords           {"keywords": [...]}  sent once extraction finishes, possibly mid-answer
+      token              {"token": str}
+      score              {"accuracy_score": int, "paragraphs": int, "provisional": true}  running lexical score
+      checkpoint         {"thinking_length": int, "answer_length": int}
+      queued             {"queue_position": int}  waiting for a model slot before generation starts
+      final              full snapshot, same fields as the legacy "data" payload
+      error              {"message": str}
+    """
+
+    version = DELTA_PROTOCOL_VERSION
+
+    def __init__(self, checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL):
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self._seq = 0
+        self._since_checkpoint = 0
+        self._thinking_length = 0
+
+    def _event(self, event_type: str, **fields) -> str:
+        self._seq += 1
+        payload = {"v": self.version, "seq": self._seq, "type": event_type}
+        payload.update(fields)
+        return _dumps(payload)
+
+    def _maybe_checkpoint(self, state: StreamState) -> str:
+        self._since_checkpoint += 1
+        if self._since_checkpoint < self.checkpoint_interval:
+            return ""
+        self._since_checkpoint = 0
+        return self._event(
+            "checkpoint",
+            thinking_length=self._thinking_length,
+            answer_length=state.answer_length
+        )
+
+    def thinking(self, state: StreamState, delta: str, is_complete: bool) -> str:
+        if is_complete:
+            self._thinking_length = len(state.thinking)
+            return self._event("thinking_complete", thinking=state.thinking, keywords=state.keywords)
+        if not delta:
+            return ""
+        self._thinking_length += len(delta)
+        return self._event("thinking", append=delta) + self._maybe_checkpoint(state)
+
+    def keywords(self, state: StreamState) -> str:
+        return self._event("keywords", keywords=state.keywords)
+
+    def answer(self, state: StreamState, token: str, thinking_just_completed: bool) -> str:
+        return self._event("token", token=token) + self._maybe_checkpoint(state)
+
+    def final(self, state: StreamState) -> str:
+        return self._event("final", **state.snapshot())
+
+    def score(self, state: StreamState, score: Dict) -> str:
+        return self._event("score", accuracy_score=score["accuracy_score"], paragraphs=score["paragraphs"],
+                           provisional=True)
+
+    def queued(self, position: int) -> str:
+        return self._event("queued", queue_position=position)
+
+    def error(self, message: str) -> str:
+        return self._event("error", message=message)
+
+
+class NullStreamEncoder:
+    """Encodes nothing, for a stream kept only for its state (a coalesced generation's producer)"""
+
+    version = None
+
+    def thinking(self, state: StreamState, delta: str, is_complete: bool) -> str:
+        return ""
+
+    def keywords(self, state: StreamState) -> str:
+        return ""
+
+    def answer(self, state: StreamState, token: str, thinking_just_completed: bool) -> str:
+        return ""
+
+    def final(self, state: StreamState) -> str:
+        return ""
+
+    def score(self, state: StreamState, score: Dict) -> str:
+        return ""
+
+    def queued(self, position: int) -> str:
+        return ""
+
+    def error(self, message: str) -> str:
+        return ""
+
+
+def make_encoder(version: int, checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL):
+    if version == DELTA_PROTOCOL_VERSION:
+        return DeltaStreamEncoder(checkpoint_interval=checkpoint_interval)
+    return LegacyStreamEncoder()
@@ -0,0 +1,137 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from metrics import Trace, timed
+from stream_protocol import StreamState
+
+# What a TacticsStream needs from its caller before it can emit more lines
+PENDING_KEYWORDS = "keywords"
+PENDING_VALIDATION = "validation"
+
+# Keyword extraction and context retrieval run alongside the answer stream. Counted from
+# the end of the thinking section, this is how long the final event may wait for them.
+KEYWORD_DEADLINE = float(os.environ.get("KEYWORD_DEADLINE", "10"))
+KEYWORD_WORKERS = int(os.environ.get("KEYWORD_WORKERS", "8"))
+
+
+class TacticsStream:
+    """
+    Turns OllamaLLM.generate_stream chunks into encoded /api/tactics lines.
+
+    It does no I/O itself: when the thinking section completes it sets
+    pending = PENDING_KEYWORDS and the caller starts keyword extraction in the background,
+    calls keywords_started() and keeps feeding answer chunks, handing the result to
+    keywords_ready() whenever it arrives. On "done" it sets pending = PENDING_VALIDATION
+    and the caller validates and hands the result to validation_ready(). This lets the
+    Flask (threaded) and ASGI (asyncio) servers share the same stream logic.
+    """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.state = StreamState()
+        self.pending = None
+        self.contexts: Optional[List[str]] = None
+        self._thinking_just_completed = False  # Flag to track when thinking just completed
+
+    def feed(self, chunk: Dict) -> List[str]:
+        state = self.state
+        if chunk["type"] == "thinking":
+            if chunk.get("is_complete", False):
+                state.thinking = chunk["content"]
+                self._thinking_just_completed = True
+                # Keywords follow in their own update once the background lookup finishes
+                self.pending = PENDING_KEYWORDS
+                line = self.encoder.thinking(state, "", True)
+                return [line] if line else []
+            delta = chunk.get("delta", "")
+            state.append_thinking(delta)
+            line = self.encoder.thinking(state, delta, False)
+            return [line] if line else []
+
+        if chunk["type"] == "answer":
+            # The chunk content is the text added since the last update
+            token = chunk["content"]
+            state.append_answer(token)
+            line = self.encoder.answer(state, token, self._thinking_just_completed)
+            self._thinking_just_completed = False
+            return [line]
+
+        if chunk["type"] == "done":
+            if not state.answer and chunk.get("content"):
+                state.append_answer(chunk["content"])
+            state.truncated = chunk.get("truncated")
+            self.pending = PENDING_VALIDATION
+        return []
+
+    def keywords_started(self):
+        if self.pending == PENDING_KEYWORDS:
+            self.pending = None
+
+    def keywords_ready(self, keywords: List[str], contexts: List[str] = None) -> List[str]:
+        """Merge a finished keyword lookup into the stream; safe to call mid-answer"""
+        self.keywords_started()
+        self.state.keywords = keywords or []
+        self.contexts = contexts
+        if not self.state.keywords:
+            return []
+        return [self.encoder.keywords(self.state)]
+
+    def validation_inputs(self, validator) -> Tuple[str, List[str]]:
+        """The answer and reference contexts to validate; contexts is empty when there is nothing to check"""
+        answer = self.state.answer
+        if not (self.state.keywords and answer):
+            return answer, []
+        if self.contexts is not None:
+            return answer, self.contexts
+        return answer, validator.get_ranked_contexts(self.state.keywords)
+
+    def validation_ready(self, validation_result: Dict = None) -> List[str]:
+        self.pending = None
+        if validation_result:
+            self.state.validation_result = validation_result
+        # Send final update with validation results
+        return [self.encoder.final(self.state)]
+
+    def score_ready(self, score: Dict) -> List[str]:
+        """A provisional answer score from answer_scoring.IncrementalScorer"""
+        return [self.encoder.score(self.state, score)]
+
+    def queued(self, position: int) -> List[str]:
+        return [self.encoder.queued(position)]
+
+    def error(self, message: str) -> str:
+        return self.encoder.error(message)
+
+
+def extract_keywords_safely(validator, llm, thinking: str, trace: Trace = None) -> List[str]:
+    try:
+        with timed(trace, "extract_keywords"):
+            return validator.extract_keywords(llm, thinking)
+    except Exception as e:
+        print(f"Error extracting keywords: {str(e)}")
+        return []
+
+
+def lookup_references(validator, llm, thinking: str, trace: Trace = None) -> Tuple[List[str], List[str]]:
+    """Keywords for the thinking text and the reference contexts they retrieve, for a background worker"""
+    keywords = extract_keywords_safely(validator, llm, thinking, trace)
+    try:
+        with timed(trace, "context_lookup"):
+            pack = validator.pack_contexts(keywords)
+        if trace is not None:
+            trace.context_stats(pack)
+        return keywords, pack["contexts"]
+    except Exception as e:
+        print(f"Error retrieving contexts: {str(e)}")
+        return keywords, None
+
+
+def validate_safely(validator, answer: str, contexts: List[str], trace: Trace = None) -> Dict:
+    if not contexts:
+        return None
+    try:
+        with timed(trace, "validate"):
+            return validator.validate_response(answer, contexts)
+    except Exception as e:
+        print(f"Error validating response: {str(e)}")
+        return None
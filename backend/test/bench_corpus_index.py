@@ -0,0 +1,51 @@
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_index import CorpusIndex
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "data.txt")
+
+KEYWORDS = ["pressing", "counter attack", "zonal marking", "4-4-2", "defensive organization",
+            "transition", "width", "xyzzy"]
+
+
+def regex_first_match(text, keyword):
+    """What get_context_window did before: materialize every match, use the first"""
+    matches = list(re.finditer(re.escape(keyword), text, re.IGNORECASE))
+    return matches[0].start() if matches else None
+
+
+def time_per_lookup(lookup, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for keyword in KEYWORDS:
+            lookup(keyword)
+    return (time.perf_counter() - start) / (repeat * len(KEYWORDS))
+
+
+def main():
+    with open(DATA_FILE, 'r') as f:
+        base_text = f.read()
+
+    for scale in (1, 10, 100):
+        text = base_text * scale
+        start = time.perf_counter()
+        index = CorpusIndex(text)
+        build = time.perf_counter() - start
+
+        repeat = max(1, 20 // scale)
+        regex = time_per_lookup(lambda keyword: regex_first_match(text, keyword), repeat)
+        first = time_per_lookup(lambda keyword: index.find(keyword, limit=1), 200)
+        top10 = time_per_lookup(lambda keyword: index.find(keyword, limit=10), 200)
+        print(
+            f"{len(text) / 1e6:7.1f} MB  build={build:6.2f}s  tokens={index.token_count:>9,d}  "
+            f"regex={regex * 1000:8.2f} ms  index first={first * 1000:6.3f} ms  first 10={top10 * 1000:6.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import BM25Index, PassageRetriever, estimate_tokens, load_parsed_pdf
+from validation_utils import ResponseValidator
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+CHUNKS_FILE = os.path.join(DATA_DIR, "87a4d6cd-98c6-43a6-b504-0287c1223a4c.json")
+KEYWORD_SETS = [
+    ["4-4-2", "pressing", "midfield"],
+    ["counter attack", "transition", "full back"],
+    ["zonal marking", "set pieces"],
+    ["possession", "build-up play", "goalkeeper"],
+]
+
+
+def main():
+    start = time.perf_counter()
+    passages = load_parsed_pdf(CHUNKS_FILE)
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    BM25Index(passages)
+    build = time.perf_counter() - start
+    print(f"{len(passages)} passages  load={load * 1000:.1f} ms  index={build * 1000:.1f} ms")
+
+    # A 100x corpus to check scoring stays vectorized
+    large = PassageRetriever(passages * 100)
+    start = time.perf_counter()
+    for keywords in KEYWORD_SETS:
+        large.retrieve(" ".join(keywords))
+    print(f"{len(passages) * 100} passages  query={(time.perf_counter() - start) / len(KEYWORD_SETS) * 1000:.2f} ms\n")
+
+    validator = ResponseValidator(os.path.join(DATA_DIR, "data.txt"), CHUNKS_FILE)
+    for keywords in KEYWORD_SETS:
+        windows = [ctx for keyword in keywords if (ctx := validator.get_context_window(keyword))]
+        start = time.perf_counter()
+        ranked = validator.get_ranked_contexts(keywords)
+        elapsed = time.perf_counter() - start
+        print(f"{', '.join(keywords)}")
+        print(f"  first-match windows: {len(windows)} contexts, ~{sum(map(estimate_tokens, windows))} tokens")
+        print(f"  ranked passages:     {len(ranked)} contexts, ~{sum(map(estimate_tokens, ranked))} tokens "
+              f"in {elapsed * 1000:.2f} ms, top: {ranked[0][:70] if ranked else '-'}")
+
+
+if __name__ == "__main__":
+    main()
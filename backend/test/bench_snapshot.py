@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_snapshot import load_snapshot
+from validation_utils import ResponseValidator
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DATA_FILE = os.path.join(DATA_DIR, "data.txt")
+CHUNKS_FILE = os.path.join(DATA_DIR, "87a4d6cd-98c6-43a6-b504-0287c1223a4c.json")
+
+
+def scaled_sources(directory, scale):
+    """Copies of data.txt and the parsed-PDF JSON, repeated `scale` times"""
+    with open(DATA_FILE, 'r') as f:
+        text = f.read()
+    with open(CHUNKS_FILE, 'r') as f:
+        document = json.load(f)
+    data_path = os.path.join(directory, "data.txt")
+    chunks_path = os.path.join(directory, "chunks.json")
+    with open(data_path, 'w') as f:
+        f.write(text * scale)
+    for chunk in document["result"]["chunks"]:
+        chunk["blocks"] = chunk["blocks"] * scale
+    with open(chunks_path, 'w') as f:
+        json.dump(document, f)
+    return data_path, chunks_path
+
+
+def timed(build):
+    start = time.perf_counter()
+    build()
+    return time.perf_counter() - start
+
+
+def main():
+    for scale in (1, 10, 50):
+        directory = tempfile.mkdtemp()
+        try:
+            data_path, chunks_path = scaled_sources(directory, scale)
+            snapshot_path = os.path.join(directory, "corpus.snapshot")
+
+            in_memory = timed(lambda: ResponseValidator(data_path, chunks_path))
+            cold = timed(lambda: ResponseValidator(data_path, chunks_path, snapshot_path=snapshot_path))
+            warm = timed(lambda: ResponseValidator(data_path, chunks_path, snapshot_path=snapshot_path))
+
+            # Touching a source without changing it keeps the snapshot (content hash matches)
+            os.utime(data_path)
+            touched = timed(lambda: ResponseValidator(data_path, chunks_path, snapshot_path=snapshot_path))
+            # Changing it invalidates the snapshot
+            with open(data_path, 'a') as f:
+                f.write("\nNew tactical note about gegenpressing.")
+            assert load_snapshot(snapshot_path, data_path, chunks_path) is None
+
+            print(
+                f"{os.path.getsize(data_path) / 1e6:6.1f} MB corpus  snapshot={os.path.getsize(snapshot_path) / 1e6:6.1f} MB  "
+                f"in-memory={in_memory:6.2f}s  build+map={cold:6.2f}s  map={warm * 1000:7.1f} ms  "
+                f"map after touch={touched * 1000:7.1f} ms"
+            )
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_protocol import StreamState, LegacyStreamEncoder, DeltaStreamEncoder
+
+THINKING_TOKENS = 1000
+ANSWER_TOKENS = 2000
+
+
+def synthetic_chunks():
+    """Chunks shaped like OllamaLLM.generate_stream output for a long deepseek-r1 answer"""
+    thinking_parts = []
+    for i in range(THINKING_TOKENS):
+        delta = f" press{i % 17}"
+        thinking_parts.append(delta)
+        yield {"type": "thinking", "delta": delta, "is_complete": False}
+    yield {"type": "thinking", "content": "".join(thinking_parts).strip(), "is_complete": True}
+    for i in range(ANSWER_TOKENS):
+        yield {"type": "answer", "content": f" overload{i % 23}"}
+    yield {"type": "done", "content": ""}
+
+
+def run(encoder):
+    state = StreamState()
+    total_bytes = 0
+    lines = 0
+    start = time.process_time()
+    for chunk in synthetic_chunks():
+        if chunk["type"] == "thinking":
+            if chunk["is_complete"]:
+                state.thinking = chunk["content"]
+                state.keywords = ["pressing", "overload", "4-4-2"]
+            else:
+                state.append_thinking(chunk["delta"])
+            line = encoder.thinking(state, chunk.get("delta", ""), chunk["is_complete"])
+        elif chunk["type"] == "answer":
+            state.append_answer(chunk["content"])
+            line = encoder.answer(state, chunk["content"], False)
+        else:
+            line = encoder.final(state)
+        if line:
+            total_bytes += len(line.encode('utf-8'))
+            lines += line.count('\n')
+    cpu = time.process_time() - start
+    return total_bytes, lines, cpu
+
+
+def main():
+    print(f"Synthetic response: {THINKING_TOKENS} thinking tokens, {ANSWER_TOKENS} answer tokens\n")
+    for name, encoder in (("legacy (v1)", LegacyStreamEncoder()), ("delta (v2)", DeltaStreamEncoder())):
+        total_bytes, lines, cpu = run(encoder)
+        print(f"{name:12s} bytes={total_bytes:>12,d} lines={lines:>6d} cpu={cpu * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from think_parser import ThinkTagParser
+from test_think_parser import legacy_stream
+
+
+def synthetic_stream(total_tokens, thinking_share=0.7):
+    """Token list for a deepseek-r1 style response with the tags split across tokens"""
+    thinking_tokens = int(total_tokens * thinking_share)
+    tokens = ["<th", "ink>"]
+    tokens += [f" step{i % 97}" for i in range(thinking_tokens)]
+    tokens += ["</", "think", ">\n\n"]
+    tokens += [f" advice{i % 89}" for i in range(total_tokens - thinking_tokens)]
+    return tokens
+
+
+def time_parser(run, tokens, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = run(tokens)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def run_legacy(tokens):
+    return sum(1 for _ in legacy_stream(tokens))
+
+
+def run_incremental(tokens):
+    parser = ThinkTagParser()
+    count = 0
+    for token in tokens:
+        count += len(parser.feed(token))
+    return count + len(parser.finish())
+
+
+def main():
+    for total_tokens in (1000, 10000, 20000):
+        tokens = synthetic_stream(total_tokens)
+        legacy_time, legacy_chunks = time_parser(run_legacy, tokens)
+        new_time, new_chunks = time_parser(run_incremental, tokens)
+        assert legacy_chunks == new_chunks
+        print(
+            f"{total_tokens:>6d} tokens  legacy={legacy_time * 1000:9.1f} ms  "
+            f"incremental={new_time * 1000:7.1f} ms  "
+            f"per token={new_time / total_tokens * 1e6:5.2f} us  speedup={legacy_time / new_time:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Reproducible benchmarks against a deterministic fake Ollama (ollama_stub.py).
+
+No live Ollama is needed: the stub streams a fixed token list (or a captured recording)
+at a fixed rate and answers the validation judge, so the same workload runs on every
+commit. Results are written as JSON and can be compared with an earlier run:
+
+    python test/benchmark.py --out bench-before.json
+    python test/benchmark.py --out bench-after.json --compare bench-before.json
+    python test/benchmark.py --scenario concurrent --concurrency 32 --server asgi
+
+Scenarios:
+    parse          OllamaLLM.generate_stream parsing with no token delay
+    single_user    one client, sequential /api/tactics requests
+    concurrent     --concurrency clients at once
+    long_thinking  one request with a long thinking section
+    cache_mix      repeated prompts, so most requests are response cache hits
+    retrieval      ResponseValidator.get_ranked_contexts
+    validation     ResponseValidator.validate_response through the DSPy judge, cold and cached
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Per-request JSON logs would drown the report
+os.environ.setdefault("TACTICS_LOG_LEVEL", "WARNING")
+
+import httpx
+
+from bench_retrieval import KEYWORD_SETS
+from bench_think_parser import synthetic_stream
+from ollama_stub import OllamaStubServer, load_recording
+
+PROMPTS = [
+    "How do we beat a 4-4-2?",
+    "How should a 3-5-2 press a back four?",
+    "What are the weaknesses of a 4-3-3 without the ball?",
+    "How do we defend against a fast counter attack?",
+    "How can full backs support the build-up against a high press?",
+]
+# Keeps prompts distinct across runs in one process, so nothing is cached or coalesced by accident
+_run_ids = itertools.count()
+
+# Metric name endings where a bigger number is better; everything else is a latency
+HIGHER_IS_BETTER = ("_per_s", "hit_ratio")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else None
+
+
+def latency_summary(prefix, seconds):
+    return {
+        f"{prefix}_p50_ms": round(percentile(seconds, 0.5) * 1000, 2),
+        f"{prefix}_p95_ms": round(percentile(seconds, 0.95) * 1000, 2),
+    }
+
+
+def stream_tokens(config):
+    if config.recording:
+        return load_recording(config.recording)
+    return synthetic_stream(config.tokens)
+
+
+# --- parsing -------------------------------------------------------------------------
+
+def bench_parse(config):
+    from Ollama import OllamaLLM
+
+    tokens = synthetic_stream(5000)
+    with OllamaStubServer(tokens=tokens) as stub:
+        llm = OllamaLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+        runs = []
+        for _ in range(config.repeat):
+            start = time.perf_counter()
+            chunks = sum(1 for _ in llm.generate_stream("benchmark"))
+            runs.append(time.perf_counter() - start)
+    best = min(runs)
+    return {
+        "tokens": len(tokens),
+        "chunks": chunks,
+        "best_s": round(best, 4),
+        "tokens_per_s": round(len(tokens) / best, 1),
+        "per_token_us": round(best / len(tokens) * 1e6, 2),
+    }
+
+
+# --- /api/tactics end to end ---------------------------------------------------------
+
+class TacticsServer:
+    """The Flask or ASGI app on a local port, talking to the stub"""
+
+    def __init__(self, kind, stub):
+        from load_test_asgi import start_flask, start_uvicorn
+
+        self.kind = kind
+        if kind == "asgi":
+            import asgi_app as module
+            self.port = 5201
+            self._server = start_uvicorn(self.port)
+        else:
+            import app as module
+            self.port = 5202
+            self._server = start_flask(self.port)
+        module.llm.base_url = stub.base_url
+        # The DSPy judge talks to the stub as well
+        module.validator.validation_api_base = stub.base_url[:-len("/api")]
+        module.validator._lm = None
+        module.validator.validation_cache.clear()
+        module.response_cache.clear()
+        self.module = module
+        self.url = f"http://127.0.0.1:{self.port}/api/tactics"
+
+    def stop(self):
+        if self.kind == "asgi":
+            self._server.should_exit = True
+        else:
+            self._server.shutdown()
+
+
+async def timed_request(client, url, prompt, bypass=True):
+    """First byte, first answer token and final event times of one delta-protocol stream"""
+    headers = {"X-Cache-Bypass": "1"} if bypass else {}
+    start = time.perf_counter()
+    first_byte = first_answer = final = None
+    async with client.stream("POST", url, json={"prompt": prompt, "protocol": "delta"}, headers=headers) as response:
+        cache = response.headers.get("X-Cache")
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            now = time.perf_counter() - start
+            first_byte = now if first_byte is None else first_byte
+            event = json.loads(line)
+            if event["type"] == "token" and first_answer is None:
+                first_answer = now
+            elif event["type"] == "final":
+                final = now
+    return {"first_byte": first_byte, "first_answer": first_answer, "final": final, "cache": cache}
+
+
+def unique(prompt):
+    return f"{prompt} (benchmark run {next(_run_ids)})"
+
+
+async def run_requests(url, prompts, concurrency, bypass=True):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        async def one(prompt):
+            async with semaphore:
+                return await timed_request(client, url, prompt, bypass)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(prompt) for prompt in prompts))
+        return results, time.perf_counter() - start
+
+
+def summarize_requests(results, wall):
+    summary = {"requests": len(results), "wall_s": round(wall, 3), "requests_per_s": round(len(results) / wall, 2)}
+    summary.update(latency_summary("first_byte", [r["first_byte"] for r in results]))
+    answered = [r["first_answer"] for r in results if r["first_answer"] is not None]
+    if answered:
+        summary.update(latency_summary("first_answer", answered))
+    summary.update(latency_summary("final", [r["final"] for r in results if r["final"] is not None]))
+    summary["incomplete"] = sum(1 for r in results if r["final"] is None)
+    return summary
+
+
+def with_server(config, tokens, run):
+    with OllamaStubServer(tokens=tokens, token_delay=config.token_delay,
+                          first_token_delay=config.first_token_delay) as stub:
+        server = TacticsServer(config.server, stub)
+        try:
+            return run(server)
+        finally:
+            server.stop()
+
+
+def bench_single_user(config):
+    def run(server):
+        prompts = [unique(PROMPTS[i % len(PROMPTS)]) for i in range(config.requests)]
+        results, wall = asyncio.run(run_requests(server.url, prompts, concurrency=1))
+        return summarize_requests(results, wall)
+
+    return with_server(config, stream_tokens(config), run)
+
+
+def bench_concurrent(config):
+    def run(server):
+        prompts = [unique(PROMPTS[i % len(PROMPTS)]) for i in range(config.concurrency)]
+        results, wall = asyncio.run(run_requests(server.url, prompts, concurrency=config.concurrency))
+        return dict(summarize_requests(results, wall), concurrency=config.concurrency)
+
+    return with_server(config, stream_tokens(config), run)
+
+
+def bench_long_thinking(config):
+    tokens = synthetic_stream(config.tokens * 10, thinking_share=0.95)
+
+    def run(server):
+        results, wall = asyncio.run(run_requests(server.url, [unique(PROMPTS[0])], concurrency=1))
+        return dict(summarize_requests(results, wall), tokens=len(tokens))
+
+    return with_server(config, tokens, run)
+
+
+def bench_cache_mix(config):
+    def run(server):
+        # Each of the five prompts is asked requests / 5 times, one after another
+        run_id = next(_run_ids)
+        prompts = [f"{PROMPTS[i % len(PROMPTS)]} (benchmark run {run_id})" for i in range(max(config.requests, 10))]
+        results, wall = asyncio.run(run_requests(server.url, prompts, concurrency=1, bypass=False))
+        hits = [r for r in results if r["cache"] == "HIT"]
+        misses = [r for r in results if r["cache"] != "HIT"]
+        summary = {"requests": len(results), "wall_s": round(wall, 3), "hit_ratio": round(len(hits) / len(results), 2)}
+        summary.update(latency_summary("hit_final", [r["final"] for r in hits]))
+        summary.update(latency_summary("miss_final", [r["final"] for r in misses]))
+        return summary
+
+    return with_server(config, stream_tokens(config), run)
+
+
+# --- retrieval and validation --------------------------------------------------------
+
+def make_validator():
+    from validation_utils import ResponseValidator
+
+    return ResponseValidator(
+        "./data/data.txt",
+        "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json",
+        snapshot_path="./data/corpus.snapshot"
+    )
+
+
+def bench_retrieval(config):
+    validator = make_validator()
+    timings = []
+    for _ in range(config.repeat * 50):
+        for keywords in KEYWORD_SETS:
+            start = time.perf_counter()
+            validator.get_ranked_contexts(keywords)
+            timings.append(time.perf_counter() - start)
+    return {
+        "calls": len(timings),
+        "p50_us": round(percentile(timings, 0.5) * 1e6, 1),
+        "p95_us": round(percentile(timings, 0.95) * 1e6, 1),
+    }
+
+
+def bench_validation(config):
+    validator = make_validator()
+    # Otherwise the cold pass is served from DSPy's disk cache of earlier runs
+    validator.lm_cache = False
+    contexts = validator.get_ranked_contexts(KEYWORD_SETS[0])
+    answers = [f"Press their pivots and overload the half-spaces, variant {i}." for i in range(config.requests)]
+    with OllamaStubServer(chat_delay=config.first_token_delay) as stub:
+        validator.validation_api_base = stub.base_url[:-len("/api")]
+
+        def timed_pass():
+            timings = []
+            for answer in answers:
+                start = time.perf_counter()
+                validator.validate_response(answer, contexts)
+                timings.append(time.perf_counter() - start)
+            return timings
+
+        cold, cached = timed_pass(), timed_pass()
+    summary = {"calls": len(answers), "judge_delay_ms": config.first_token_delay * 1000}
+    summary.update(latency_summary("cold", cold))
+    summary.update(latency_summary("cached", cached))
+    return summary
+
+
+SCENARIOS = {
+    "parse": bench_parse,
+    "single_user": bench_single_user,
+    "concurrent": bench_concurrent,
+    "long_thinking": bench_long_thinking,
+    "cache_mix": bench_cache_mix,
+    "retrieval": bench_retrieval,
+    "validation": bench_validation,
+}
+
+
+# --- results -------------------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Print metric changes against a baseline run; returns the regressions beyond threshold"""
+    regressions = []
+    for scenario, metrics in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(scenario, {})
+        for name, value in metrics.items():
+            old = before.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+            flag = "  REGRESSION" if worse > threshold else ""
+            print(f"{scenario:14s} {name:22s} {old:>12} -> {value:<12} {change:+7.1%}{flag}")
+            if flag:
+                regressions.append((scenario, name, old, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks against a deterministic fake Ollama")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per generated response")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="seconds between streamed tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.05,
+                        help="seconds before the first token, and the judge's reply time")
+    parser.add_argument("--recording", help="replay this captured Ollama stream instead of synthetic tokens")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write the results here as JSON")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change reported as a regression")
+    config = parser.parse_args()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(config).items() if key not in ("out", "compare")},
+        "scenarios": {},
+    }
+    for name in config.scenario or SCENARIOS:
+        try:
+            results["scenarios"][name] = SCENARIOS[name](config)
+        except Exception as e:
+            print(f"Error in scenario {name}: {str(e)}")
+            results["scenarios"][name] = {"error": str(e)}
+        print(f"{name:14s} {json.dumps(results['scenarios'][name])}")
+
+    if config.out:
+        with open(config.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if config.compare:
+        with open(config.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline.get('commit')} ({baseline.get('created')}):")
+        if compare(baseline, results, config.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from werkzeug.serving import make_server
+
+import app as flask_app
+import asgi_app
+from ollama_stub import OllamaStubServer
+
+CONCURRENCY = [int(n) for n in os.environ.get("CONCURRENCY", "8,32,128").split(",")]
+TOKENS = int(os.environ.get("TOKENS", "100"))
+TOKEN_DELAY = float(os.environ.get("TOKEN_DELAY", "0.02"))
+STUB_PORT = 5100
+PROMPT = "How do we beat a 4-4-2?"
+# Distinct prompts, so streams are neither served from the response cache nor coalesced
+_prompt_ids = itertools.count()
+
+
+def unique_prompt() -> dict:
+    return {"prompt": f"{PROMPT} (load stream {next(_prompt_ids)})", "protocol": "delta"}
+
+
+def start_uvicorn(port):
+    server = uvicorn.Server(uvicorn.Config(asgi_app.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def start_flask(port):
+    server = make_server("127.0.0.1", port, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def one_stream(client, url):
+    start = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", url, json=unique_prompt()) as response:
+        async for _ in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    return first_byte, time.perf_counter() - start
+
+
+class ThreadSampler:
+    """Peak number of live threads while a load run is in flight"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def run_load(url, concurrency):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=concurrency)
+    baseline = threading.active_count()
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        with ThreadSampler() as sampler:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(one_stream(client, url) for _ in range(concurrency)))
+            wall = time.perf_counter() - start
+    first_bytes = sorted(r[0] for r in results)
+    return {
+        "streams": concurrency,
+        "wall_s": round(wall, 2),
+        "ttfb_p50_ms": round(statistics.median(first_bytes) * 1000, 1),
+        "ttfb_p95_ms": round(first_bytes[int(len(first_bytes) * 0.95) - 1] * 1000, 1),
+        "server_threads_peak": sampler.peak - baseline,
+    }
+
+
+async def abandoned_stream(url):
+    """Read a few lines and hang up; the upstream generation should be cancelled"""
+    async with httpx.AsyncClient(timeout=30) as client:
+        async with client.stream("POST", url, json=unique_prompt()) as response:
+            async for _ in response.aiter_lines():
+                break
+    await asyncio.sleep(TOKEN_DELAY * 10)
+
+
+def serve_stub(tokens, ready, counters):
+    """Run the fake Ollama in its own process so its threads do not count against the servers"""
+    with OllamaStubServer(tokens=tokens, token_delay=TOKEN_DELAY, port=STUB_PORT) as stub:
+        ready.set()
+        while True:
+            time.sleep(0.05)
+            counters["aborted_streams"] = stub.aborted_streams
+
+
+def run_servers(tokens, counters):
+    stub_url = f"http://127.0.0.1:{STUB_PORT}/api"
+    asgi_app.llm.base_url = stub_url
+    flask_app.llm.base_url = stub_url
+    uvicorn_server = start_uvicorn(5101)
+    flask_server = start_flask(5102)
+
+    print(f"Stub stream: {len(tokens)} tokens at {TOKEN_DELAY * 1000:.0f} ms/token "
+          f"(~{len(tokens) * TOKEN_DELAY:.1f}s per stream)\n")
+    for concurrency in CONCURRENCY:
+        for name, port in (("flask", 5102), ("asgi", 5101)):
+            result = asyncio.run(run_load(f"http://127.0.0.1:{port}/api/tactics", concurrency))
+            print(f"{name:6s} {result}")
+
+    before = counters["aborted_streams"]
+    asyncio.run(abandoned_stream("http://127.0.0.1:5101/api/tactics"))
+    time.sleep(0.2)
+    print(f"\nUpstream streams aborted after an ASGI client hung up: {counters['aborted_streams'] - before}")
+
+    uvicorn_server.should_exit = True
+    flask_server.shutdown()
+
+
+def main():
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    tokens = ["<think>"] + [f" idea{i}" for i in range(TOKENS // 2)] + ["</think>"] + [f" tip{i}" for i in range(TOKENS // 2)]
+    with multiprocessing.Manager() as manager:
+        counters = manager.dict(aborted_streams=0)
+        ready = manager.Event()
+        stub = multiprocessing.Process(target=serve_stub, args=(tokens, ready, counters), daemon=True)
+        stub.start()
+        ready.wait()
+        run_servers(tokens, counters)
+        stub.terminate()
+
+if __name__ == "__main__":
+    main()
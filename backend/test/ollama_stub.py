@@ -0,0 +1,259 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TOKENS = (
+    ["<think>", "The", " opponent", " plays", " a", " flat", " 4-4-2", ".", "</think>", "\n\n"]
+    + ["Overload", " the", " half-spaces", " and", " press", " their", " pivots", "."]
+)
+DEFAULT_MODELS = ["deepseek-r1:7b", "deepseek-r1:1.5b"]
+# /api/chat reply in the field format DSPy's ChatAdapter parses, for the validation judge
+DEFAULT_CHAT_REPLY = (
+    "[[ ## validation ## ]]\nThe advice matches the reference contexts.\n\n"
+    "[[ ## accuracy_score ## ]]\n80\n\n[[ ## completed ## ]]"
+)
+
+
+def load_recording(path: str) -> list:
+    """Tokens of a /api/generate stream captured with record_stream (raw Ollama NDJSON lines)"""
+    tokens = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                if data.get("response"):
+                    tokens.append(data["response"])
+    return tokens
+
+
+def record_stream(base_url: str, model: str, prompt: str, path: str):
+    """Capture a live Ollama /api/generate stream so the stub can replay it"""
+    import requests
+
+    with requests.post(f"{base_url}/generate", json={"model": model, "prompt": prompt, "stream": True}, stream=True) as response:
+        response.raise_for_status()
+        with open(path, "w") as f:
+            for line in response.iter_lines():
+                if line:
+                    f.write(line.decode("utf-8") + "\n")
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 1024  # Load tests open many connections at once
+
+
+class OllamaStubServer:
+    """
+    Minimal stand-in for an Ollama server: /api/generate (streaming and not) and /api/tags.
+
+    Speaks HTTP/1.1 with keep-alive so clients can reuse connections, and counts the TCP
+    connections it accepted so tests can check reuse from the server side. Streams are
+    deterministic: first_token_delay stands in for prompt evaluation, then one token
+    every token_delay seconds (or at tokens_per_second). /api/chat answers with
+    chat_reply after chat_delay, for the DSPy judge. With load_delay, the first request
+    for each model also waits that long, like Ollama loading the model; an empty prompt
+    only loads it. Each stream ends with a `context` (one fake id per prompt word and
+    response token, after the request's context). With prefill_delay, prompt evaluation
+    takes that long per word, except for a request context the model still holds from
+    the previous stream, like Ollama's KV cache.
+    """
+
+    def __init__(self, tokens=None, models=None, token_delay: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 tokens_per_second: float = None, first_token_delay: float = 0.0,
+                 chat_reply: str = DEFAULT_CHAT_REPLY, chat_delay: float = 0.0, load_delay: float = 0.0,
+                 prefill_delay: float = 0.0):
+        self.tokens = list(tokens or DEFAULT_TOKENS)
+        self.models = list(models or DEFAULT_MODELS)
+        self.token_delay = 1.0 / tokens_per_second if tokens_per_second else token_delay
+        self.first_token_delay = first_token_delay
+        self.chat_reply = chat_reply
+        self.chat_delay = chat_delay
+        self.load_delay = load_delay
+        self.loaded = set()
+        self.keep_alive = []  # keep_alive of every generate/chat request that set one
+        self.prefill_delay = prefill_delay
+        self.prefilled = []   # words evaluated before the first token, per stream
+        self._kv_cache = {}   # model -> context of its last stream
+        self.connections = 0
+        self.requests = 0
+        self.aborted_streams = 0  # client went away before the stream finished
+        self.broken_streams = 0   # set to make the next N streams drop the connection before any token
+        self._lock = threading.Lock()
+        self._server = _StubHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def _count(self, attribute: str):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub._count("connections")
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                stub._count("requests")
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": name} for name in stub.models]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                stub._count("requests")
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.endswith("/chat/completions"):
+                    self._chat_completion(body)
+                    return
+                if self.path not in ("/api/generate", "/api/chat"):
+                    self._send_json({"error": "not found"}, status=404)
+                    return
+                if body.get("model") not in stub.models:
+                    self._send_json({"error": f"model '{body.get('model')}' not found"}, status=404)
+                    return
+                if "keep_alive" in body:
+                    with stub._lock:
+                        stub.keep_alive.append(body["keep_alive"])
+                load_duration = self._load(body["model"])
+                if self.path == "/api/chat":
+                    self._chat(body)
+                    return
+                if self.path == "/api/generate" and not body.get("prompt"):
+                    self._send_json({"model": body["model"], "response": "", "done": True, "done_reason": "load",
+                                     "load_duration": load_duration})
+                    return
+
+                if not body.get("stream", True):
+                    self._send_json({"model": body["model"], "response": "".join(stub.tokens), "done": True})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                with stub._lock:
+                    broken = stub.broken_streams > 0
+                    stub.broken_streams -= broken
+                if broken:
+                    # Like a host that dies mid-request: the chunked body never completes
+                    self.wfile.write(b"5\r\nnot j")
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                context = list(body.get("context") or [])
+                prompt_ids = [hash(word) % 32000 for word in body.get("prompt", "").split()]
+                with stub._lock:
+                    cached = stub._kv_cache.get(body["model"])
+                    prefill = len(prompt_ids) + (0 if context and context == cached else len(context))
+                    stub.prefilled.append(prefill)
+                context += prompt_ids + [hash(token) % 32000 for token in stub.tokens]
+                try:
+                    if stub.first_token_delay or stub.prefill_delay:
+                        time.sleep(stub.first_token_delay + prefill * stub.prefill_delay)
+                    for token in stub.tokens:
+                        if stub.token_delay:
+                            time.sleep(stub.token_delay)
+                        self._write_chunk({"model": body["model"], "response": token, "done": False})
+                    self._write_chunk({
+                        "model": body["model"],
+                        "response": "",
+                        "done": True,
+                        "eval_count": len(stub.tokens),
+                        "eval_duration": int(len(stub.tokens) * stub.token_delay * 1e9),
+                        "context": context
+                    })
+                    with stub._lock:
+                        stub._kv_cache[body["model"]] = context
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # Ollama stops generating when the client closes the connection
+                    stub._count("aborted_streams")
+                    self.close_connection = True
+
+            def _load(self, model):
+                with stub._lock:
+                    cold = model not in stub.loaded
+                    stub.loaded.add(model)
+                if cold and stub.load_delay:
+                    time.sleep(stub.load_delay)
+                return int(stub.load_delay * 1e9) if cold else 0
+
+            def _chat(self, body):
+                if stub.chat_delay:
+                    time.sleep(stub.chat_delay)
+                message = {"role": "assistant", "content": stub.chat_reply}
+                reply = {"model": body["model"], "message": message, "done": True, "done_reason": "stop",
+                         "prompt_eval_count": 0, "eval_count": len(stub.chat_reply.split())}
+                if body.get("stream", False):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    self._write_chunk(reply)
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                else:
+                    self._send_json(reply)
+
+            def _chat_completion(self, body):
+                # Ollama's OpenAI-compatible endpoint, used by clients that do not speak /api/chat
+                if stub.chat_delay:
+                    time.sleep(stub.chat_delay)
+                self._send_json({
+                    "id": f"chatcmpl-{stub.requests}",
+                    "object": "chat.completion",
+                    "model": body.get("model"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": stub.chat_reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(stub.chat_reply.split()),
+                              "total_tokens": len(stub.chat_reply.split())},
+                })
+
+        return Handler
+
+    def start(self) -> "OllamaStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,87 @@
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_pool import BackendPool
+from Ollama import OllamaLLM
+from ollama_stub import OllamaStubServer
+
+STREAMS = 8
+
+
+def dead_url() -> str:
+    # A port nothing listens on: connections are refused
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/api"
+
+
+def answer(llm: OllamaLLM) -> str:
+    return list(llm.generate_stream("How do we beat a 4-4-2?"))[-1]["content"]
+
+
+def check_balancing(big, both):
+    pool = BackendPool([big.base_url, both.base_url, dead_url()])
+    pool.check_health()
+    healthy = [backend["healthy"] for backend in pool.stats()]
+    assert healthy == [True, True, False], pool.stats()
+    assert pool.available_models() == ["deepseek-r1:1.5b", "deepseek-r1:7b"]
+
+    llm = OllamaLLM(model_name="deepseek-r1:7b", pool=pool)
+    before = (big.requests, both.requests)
+    threads = [threading.Thread(target=answer, args=(llm,)) for _ in range(STREAMS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    spread = (big.requests - before[0], both.requests - before[1])
+    print(f"{STREAMS} concurrent streams spread as {spread}")
+    assert spread == (STREAMS // 2, STREAMS // 2)
+
+    # Only the second host has pulled the small model
+    small = OllamaLLM(model_name="deepseek-r1:1.5b", pool=pool)
+    before = (big.requests, both.requests)
+    for _ in range(3):
+        small.generate_response("Extract keywords")
+    assert (big.requests - before[0], both.requests - before[1]) == (0, 3)
+    assert all(backend["outstanding"] == 0 for backend in pool.stats())
+
+
+def check_failover(big, both):
+    # No probe yet: the dead host is only discovered when a call fails on it
+    pool = BackendPool([dead_url(), big.base_url, both.base_url])
+    llm = OllamaLLM(model_name="deepseek-r1:7b", pool=pool)
+    for _ in range(4):
+        assert answer(llm).startswith("\n\nOverload")
+    dead = pool.stats()[0]
+    assert not dead["healthy"] and dead["failures"] == 1, dead
+    print(f"Connection failures failed over: {pool.stats()[0]}")
+
+    # A stream that drops before its first token is restarted on another host
+    pool = BackendPool([big.base_url, both.base_url])
+    llm = OllamaLLM(model_name="deepseek-r1:7b", pool=pool)
+    big.broken_streams = 1
+    results = [answer(llm) for _ in range(2)]
+    assert all(result.startswith("\n\nOverload") for result in results)
+    assert big.broken_streams == 0 and pool.stats()[0]["failures"] == 1
+    print(f"Broken streams failed over: {[(b['requests'], b['failures']) for b in pool.stats()]}")
+
+    # "model not found" moves the call to a host that has the model
+    small = OllamaLLM(model_name="deepseek-r1:1.5b", pool=BackendPool([big.base_url, both.base_url]))
+    assert small.generate_response("Extract keywords")["answer"]
+    assert "deepseek-r1:1.5b" in small.pool.backends[0].missing
+
+
+def main():
+    with OllamaStubServer(models=["deepseek-r1:7b"], token_delay=0.01) as big, \
+            OllamaStubServer(token_delay=0.01) as both:
+        check_balancing(big, both)
+        check_failover(big, both)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dspy.utils import DummyLM
+
+from batch_tactics import completed_ids, run_file
+from Ollama import OllamaLLM
+from ollama_stub import OllamaStubServer
+from validation_utils import ResponseValidator
+
+PROMPTS = [f"How do we beat a {formation}?" for formation in ("4-4-2", "3-5-2", "4-3-3", "5-3-2", "4-2-3-1", "3-4-3")]
+CONCURRENCY = 2
+
+
+class CountingLLM(OllamaLLM):
+    """Records the most streams it had open at once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.open = 0
+        self.most_open = 0
+        self._lock = threading.Lock()
+
+    def generate_stream(self, prompt):
+        with self._lock:
+            self.open += 1
+            self.most_open = max(self.most_open, self.open)
+        try:
+            yield from super().generate_stream(prompt)
+        finally:
+            with self._lock:
+                self.open -= 1
+
+
+def make_validator() -> ResponseValidator:
+    validator = ResponseValidator("./data/data.txt", "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json")
+    # The real judge program, answering from a scripted LM instead of Ollama
+    validator._get_program()
+    validator._lm = DummyLM([{"validation": "Matches the reference", "accuracy_score": "80"}] * 2 * len(PROMPTS))
+    # Keyword extraction must be asked about the model's thinking, not an empty question
+    validator.questions = []
+    extract_keywords = validator.extract_keywords
+    validator.extract_keywords = lambda llm, question: validator.questions.append(question) or extract_keywords(llm, question)
+    return validator
+
+
+def check_resume(stub, validator, workdir):
+    input_path = os.path.join(workdir, "prompts.jsonl")
+    output_path = os.path.join(workdir, "results.jsonl")
+    with open(input_path, "w") as f:
+        for prompt in PROMPTS:
+            f.write(json.dumps({"prompt": prompt, "opponent": prompt.split()[-1]}) + "\n")
+
+    # A previous run finished two prompts, failed one and was killed while writing a fourth
+    with open(output_path, "w") as f:
+        f.write(json.dumps({"id": "1", "prompt": PROMPTS[0], "latency_s": 1.0}) + "\n")
+        f.write(json.dumps({"id": "2", "prompt": PROMPTS[1], "latency_s": 1.0}) + "\n")
+        f.write(json.dumps({"id": "3", "prompt": PROMPTS[2], "error": "connection refused"}) + "\n")
+        f.write('{"id": "4", "prom')
+
+    llm = CountingLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+    summary = run_file(llm, validator, input_path, output_path, concurrency=CONCURRENCY)
+    print(f"Summary: {summary}")
+    assert summary["prompts"] == 4 and summary["succeeded"] == 4, summary
+    assert summary["mean_accuracy_score"] == 80.0 and summary["mean_tokens_per_sec"] > 0
+    assert llm.most_open <= CONCURRENCY, llm.most_open
+    assert completed_ids(output_path) == {str(number) for number in range(1, len(PROMPTS) + 1)}
+
+    with open(output_path) as f:
+        result = json.loads(f.readlines()[-1])
+    assert result["opponent"] in result["prompt"] and "Overload" in result["answer"]
+    assert result["tokens"] == len(stub.tokens) and result["first_token_s"] <= result["generation_s"]
+    assert result["thinking"] == "The opponent plays a flat 4-4-2." and result["keywords"], result
+    assert result["accuracy_score"] == 80.0 and result["validation"]["validation"] == "Matches the reference"
+    assert validator.questions and all(validator.questions), validator.questions
+
+    # Nothing left to do on a second run
+    assert run_file(llm, validator, input_path, output_path)["prompts"] == 0
+
+
+def check_api(stub, validator):
+    import app as tactics_app
+
+    tactics_app.llm = OllamaLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+    tactics_app.validator = validator
+    client = tactics_app.app.test_client()
+    body = "\n".join(json.dumps({"id": f"q{i}", "prompt": prompt}) for i, prompt in enumerate(PROMPTS[:3]))
+    response = client.post("/api/tactics/batch?concurrency=2", data=body, content_type="application/x-ndjson")
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line["id"] for line in lines[:-1]) == ["q0", "q1", "q2"]
+    assert lines[-1]["summary"]["succeeded"] == 3, lines[-1]
+    print(f"Batch endpoint: {lines[-1]}")
+
+    for prompts in ([{"id": "x"}], ["a", "b"], [{"prompt": 3}], "abc",
+                    [{"id": "x", "prompt": "a"}, {"id": "x", "prompt": "b"}]):
+        response = client.post("/api/tactics/batch", json={"prompts": prompts})
+        assert response.status_code == 400, (prompts, response.status_code)
+
+
+def main():
+    validator = make_validator()
+    with OllamaStubServer(token_delay=0.01) as stub, tempfile.TemporaryDirectory() as workdir:
+        check_resume(stub, validator, workdir)
+        check_api(stub, validator)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cancellation
+from cancellation import ANSWER_CAP, THINKING_CAP, GenerationBudget, GenerationLengths, capped_chunks
+from ollama_stub import DEFAULT_TOKENS, OllamaStubServer
+
+TOKENS = DEFAULT_TOKENS + [" Keep", " the", " lines", " compact."] * 25
+TOKEN_DELAY = 0.01
+NO_CACHE = {"X-Cache-Bypass": "1"}
+
+
+def check_budget():
+    closed = []
+
+    def chunks():
+        try:
+            yield {"type": "thinking", "delta": "Press", "is_complete": False}
+            yield {"type": "thinking", "delta": " high", "is_complete": False}
+            yield {"type": "thinking", "delta": " early", "is_complete": False}
+            yield {"type": "thinking", "content": "Press high early", "is_complete": True}
+            for token in ["Overload", " the", " wings", "."]:
+                yield {"type": "answer", "content": token}
+            yield {"type": "done", "content": ""}
+        finally:
+            closed.append(True)
+
+    uncapped = list(capped_chunks(chunks(), GenerationBudget(0, 0)))
+    assert uncapped[-1] == {"type": "done", "content": ""} and closed == [True]
+
+    answer_capped = list(capped_chunks(chunks(), GenerationBudget(0, 2)))
+    assert [chunk["content"] for chunk in answer_capped if chunk["type"] == "answer"] == ["Overload", " the"]
+    assert answer_capped[-1]["truncated"] == ANSWER_CAP and len(closed) == 2
+
+    budget = GenerationBudget(2, 0)
+    thinking_capped = list(capped_chunks(chunks(), budget))
+    # The thinking so far is completed, so keyword extraction still gets it
+    assert thinking_capped[-2] == {"type": "thinking", "content": "Press high early", "is_complete": True}
+    assert thinking_capped[-1]["truncated"] == THINKING_CAP and budget.tokens == 3 and len(closed) == 3
+
+    lengths = GenerationLengths()
+    assert lengths.avoided(10) == 0  # nothing to estimate from yet
+    lengths.observe(100)
+    lengths.observe(200)
+    assert lengths.avoided(40) == 110 and lengths.avoided(400) == 0
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def start(client, prompt, request_id, session_id=None):
+    body = {"prompt": prompt, "protocol": "delta"}
+    if session_id:
+        body["session_id"] = session_id
+    response = client.post("/api/tactics", json=body, headers=dict(NO_CACHE, **{"X-Request-Id": request_id}))
+    assert response.headers["X-Request-Id"] == request_id
+    lines = iter(response.response)
+    next(lines)
+    return response, lines
+
+
+def read_rest(lines):
+    events = []
+    for line in lines:
+        events.extend(json.loads(part) for part in line.decode("utf-8").splitlines())
+    return events
+
+
+def check_api(stub):
+    import app as tactics_app
+    from metrics import CANCELLED_GENERATIONS, TOKENS_AVOIDED
+
+    client = tactics_app.app.test_client()
+    # One generation that runs to the end, so cancelled ones have something to compare with
+    read_rest(client.post("/api/tactics", json={"prompt": "How do we press a 4-4-2?"}, headers=NO_CACHE).response)
+
+    aborted = stub.aborted_streams
+    response, lines = start(client, "How do we beat a low block?", "req-1")
+    cancelled = client.post("/api/tactics/req-1/cancel")
+    assert cancelled.status_code == 200 and cancelled.get_json()["request_id"] == "req-1"
+    assert not any(event.get("type") == "final" for event in read_rest(lines))
+    response.close()
+    assert wait_for(lambda: stub.aborted_streams == aborted + 1), "cancelled generation kept running"
+    assert client.post("/api/tactics/req-1/cancel").status_code == 404
+    assert wait_for(lambda: CANCELLED_GENERATIONS.value(reason="client") == 1)
+    assert TOKENS_AVOIDED.value(reason="client") > 0
+
+    # Re-asking in the same conversation stops the previous answer
+    first, first_lines = start(client, "How do we beat a low block?", "req-2", session_id="match-prep")
+    second, second_lines = start(client, "What if they play a back five?", "req-3", session_id="match-prep")
+    assert not any(event.get("type") == "final" for event in read_rest(first_lines))
+    first.close()
+    assert read_rest(second_lines)[-1]["type"] == "final"
+    second.close()
+    assert wait_for(lambda: stub.aborted_streams == aborted + 2)
+    assert CANCELLED_GENERATIONS.value(reason="superseded") == 1
+
+    cancellation.ANSWER_MAX_TOKENS = 5
+    try:
+        start_time = time.perf_counter()
+        events = read_rest(client.post("/api/tactics", json={"prompt": "How do we defend corners?",
+                                                              "protocol": "delta"}, headers=NO_CACHE).response)
+        capped_seconds = time.perf_counter() - start_time
+    finally:
+        cancellation.ANSWER_MAX_TOKENS = 0
+    final = events[-1]
+    assert final["type"] == "final" and final["truncated"] == ANSWER_CAP, final
+    assert sum(1 for event in events if event["type"] == "token") == 5
+    assert wait_for(lambda: stub.aborted_streams == aborted + 3)
+    assert capped_seconds < len(TOKENS) * TOKEN_DELAY, capped_seconds
+    assert tactics_app.active_requests.stats()["active"] == 0
+
+    metrics = client.get("/api/metrics").get_data(as_text=True)
+    assert 'tactics_tokens_avoided_total{reason="answer_cap"}' in metrics
+    print(f"Tokens avoided: {TOKENS_AVOIDED.value(reason='client'):.0f} by cancelling, "
+          f"{TOKENS_AVOIDED.value(reason='superseded'):.0f} by a re-ask, "
+          f"{TOKENS_AVOIDED.value(reason='answer_cap'):.0f} by the answer cap")
+
+
+async def call_asgi(app, prompt, request_id, on_send):
+    """POST /api/tactics straight to the ASGI app; on_send runs as each message is sent"""
+    scope = {"type": "http", "method": "POST", "path": "/api/tactics",
+             "headers": [(b"x-request-id", request_id.encode()), (b"x-cache-bypass", b"1")]}
+    requested = asyncio.Event()
+    sent = []
+
+    async def receive():
+        if not requested.is_set():
+            requested.set()
+            return {"type": "http.request", "body": json.dumps({"prompt": prompt}).encode(), "more_body": False}
+        await asyncio.Event().wait()  # the client stays connected
+
+    async def send(message):
+        sent.append(message)
+        await on_send(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+def ends(sent):
+    return sum(1 for message in sent if message["type"] == "http.response.body" and not message.get("more_body"))
+
+
+def check_asgi(stub):
+    import asgi_app
+    from async_ollama import AsyncOllamaLLM
+
+    asgi_app.llm = AsyncOllamaLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+    asgi_app.validator.validate_response = lambda answer, contexts: {"accuracy_score": 80, "validation": "ok"}
+
+    async def cancel_while_ending(message):
+        # The cancel lands while the stream sends its final message
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            asgi_app.active_requests.cancel("asgi-1")
+            await asyncio.sleep(0)
+
+    sent = asyncio.run(call_asgi(asgi_app.app, "How do we beat a low block?", "asgi-1", cancel_while_ending))
+    assert ends(sent) == 1, sent[-3:]
+
+    async def server_gave_up(message):
+        # Servers other than uvicorn can raise RuntimeError once the client is gone
+        if message["type"] == "http.response.body":
+            raise RuntimeError("Unexpected ASGI message 'http.response.body' sent, after response already completed.")
+
+    sent = asyncio.run(call_asgi(asgi_app.app, "How do we beat a low block?", "asgi-2", server_gave_up))
+    assert ends(sent) == 0 and asgi_app.active_requests.stats()["active"] == 0
+    print("ASGI: one end of body when cancelled while ending, a failed send ends the request as cancelled")
+
+
+def main():
+    check_budget()
+    with OllamaStubServer(tokens=TOKENS, token_delay=TOKEN_DELAY) as stub:
+        import app as tactics_app
+        from Ollama import OllamaLLM
+
+        tactics_app.llm = OllamaLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+        tactics_app.validator.validate_response = lambda answer, contexts: {"accuracy_score": 80, "validation": "ok"}
+        check_api(stub)
+        check_asgi(stub)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_packer import limit_keywords, merge_spans, pack_contexts, span_relevance
+from retrieval import estimate_tokens
+from validation_utils import ResponseValidator
+
+KEYWORDS = ["pressing", "Pressing", "midfield", "", " counter-attack.", "possession", "transition",
+            "defensive line", "width", "overload", "pivot", "compactness", "zonal marking"]
+
+
+def check_keywords():
+    keywords = limit_keywords(KEYWORDS, max_keywords=5)
+    assert keywords == ["pressing", "midfield", "counter-attack", "possession", "transition"], keywords
+    print(f"Keywords: {len(KEYWORDS)} -> {keywords}")
+
+
+def check_merge():
+    spans = merge_spans([(50, 90, "press"), (0, 40, "midfield"), (30, 60, "Press"), (200, 240, "width")])
+    assert [(span["start"], span["end"]) for span in spans] == [(0, 90), (200, 240)], spans
+    assert spans[0]["keywords"] == {"midfield", "press"} and spans[0]["hits"] == 3
+    assert span_relevance(spans[0]) > span_relevance(spans[1])
+
+
+def check_pack():
+    candidates = [("a " * 100, 1.0), ("b " * 100, 3.0), ("B  " * 100, 0.5), ("c " * 300, 2.0), ("d " * 40, 2.0)]
+    pack = pack_contexts(candidates, token_budget=100)
+    # Most relevant first; the duplicate is dropped and the passage that does not fit is skipped
+    assert pack["contexts"] == ["b " * 100, "d " * 40], pack["contexts"]
+    assert pack["tokens"] == 70 and pack["tokens"] <= 100
+    assert pack["tokens_saved"] == sum(estimate_tokens(text) for text, _ in candidates) - 70
+
+
+def check_validator():
+    validator = ResponseValidator("./data/data.txt")
+    keywords = ["pressing", "press", "defensive", "attack", "space", "ball", "players", "team", "game", "zone"]
+    naive = "\n".join(ctx for keyword in keywords if (ctx := validator.get_context_window(keyword)))
+    pack = validator.pack_contexts(keywords, token_budget=300)
+    contexts = pack["contexts"]
+    assert contexts and pack["tokens"] <= 300, pack
+    assert len({" ".join(ctx.split()) for ctx in contexts}) == len(contexts)
+    # Saved against the one window per keyword the judge got before packing
+    windows = [ctx for keyword in keywords if (ctx := validator.get_context_window(keyword))]
+    assert pack["candidate_tokens"] == sum(estimate_tokens(ctx) for ctx in windows), pack
+    assert pack["tokens_saved"] > 0 and pack["candidate_tokens"] == pack["tokens"] + pack["tokens_saved"]
+    assert estimate_tokens("\n".join(contexts)) < estimate_tokens(naive)
+    assert validator.get_ranked_contexts(keywords, token_budget=300) == contexts
+    assert validator.pack_contexts(["", "  "])["contexts"] == []
+    print(f"Validator contexts: {pack['candidates']} candidates, {pack['tokens']} tokens kept, "
+          f"{pack['tokens_saved']} saved (one window per keyword: {estimate_tokens(naive)} tokens)")
+
+    with_pdf = ResponseValidator("./data/data.txt", "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json")
+    pack = with_pdf.pack_contexts(keywords, token_budget=300)
+    assert pack["contexts"] and pack["tokens"] <= 300 and pack["contexts"][0].startswith("[p. ")
+    # The unpacked prompt was already capped at 512 tokens, so a 512-token pack saves little
+    assert pack["candidate_tokens"] <= 512 + 10 * pack["candidates"], pack
+    assert with_pdf.pack_contexts(keywords)["tokens_saved"] < pack["tokens_saved"]
+    print(f"PDF passages: {pack['candidates']} candidates, {pack['tokens']} tokens kept, {pack['tokens_saved']} saved")
+
+
+def main():
+    check_keywords()
+    check_merge()
+    check_pack()
+    check_validator()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_index import CorpusIndex
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "data.txt")
+
+KEYWORDS = [
+    "pressing", "4-4-2", "counter attack", "Zonal Marking", "the", "e", "ss", "high press",
+    " ball ", "player's", "(", ")", "tactical, ", "xyzzy", "ation of", "aa", "",
+]
+
+
+def expected_matches(text, keyword):
+    """Reference: the regex search get_context_window used before the index"""
+    return [match.start() for match in re.finditer(re.escape(keyword), text, re.IGNORECASE)] if keyword else []
+
+
+def check_keywords(index, text, keywords):
+    for keyword in keywords:
+        expected = expected_matches(text, keyword)
+        actual = index.find(keyword)
+        assert actual == expected, f"{keyword!r}: expected {expected[:5]} got {actual[:5]}"
+        first = index.find(keyword, limit=1)
+        assert first == expected[:1], f"{keyword!r}: first match {first} != {expected[:1]}"
+
+
+def random_substrings(rng, text, count):
+    keywords = []
+    for _ in range(count):
+        start = rng.randrange(len(text) - 30)
+        keywords.append(text[start:start + rng.randint(1, 25)])
+    return keywords
+
+
+def main():
+    rng = random.Random(int(os.environ.get("SEED", "1234")))
+    runs = int(os.environ.get("RUNS", "3000"))
+
+    with open(DATA_FILE, 'r') as f:
+        text = f.read()
+    index = CorpusIndex(text)
+    check_keywords(index, text, KEYWORDS)
+    check_keywords(index, text, random_substrings(rng, text, runs))
+
+    # Mixed case and non-ASCII text that does not lower() in place falls back to a scan
+    odd_text = "İstanbul PRESSING vs Pressing; Gegenpressing 4-4-2 and 4-4-2!"
+    check_keywords(CorpusIndex(odd_text), odd_text, ["pressing", "4-4-2", "İstanbul", "stan", "!"])
+    print(f"CorpusIndex matches the regex search on {runs + len(KEYWORDS)} keywords")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from corpus_library import CorpusLibrary, iter_passages
+from retrieval import BM25Index, count_terms, load_parsed_pdf
+from validation_utils import ResponseValidator
+
+CHUNKS_FILE = "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json"
+PRESSING = """Gegenpressing means winning the ball back immediately after losing it.
+The nearest players close the ball carrier while the rest cut the passing lanes.
+
+A high defen-
+sive line keeps the team compact behind the press.
+"""
+BUILD_UP = "Build-up play starts with the goalkeeper.\nThe pivot drops between the centre-backs to create a back three.\n"
+WIDTH = [{"content": "Wingers hold the width so the full-backs can underlap.", "page": 3},
+         {"content": "Switching play quickly stretches a compact block.", "bbox": {"page": 4}}]
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def check_term_frequencies():
+    passages = load_parsed_pdf(CHUNKS_FILE)
+    built = BM25Index(passages)
+    merged = BM25Index(passages, term_frequencies=[count_terms(passage["text"]) for passage in passages])
+    assert np.allclose(built.scores("pressing defensive line"), merged.scores("pressing defensive line"))
+
+
+def check_library(workers):
+    library_dir = tempfile.mkdtemp()
+    try:
+        write(os.path.join(library_dir, "pressing.txt"), PRESSING)
+        write(os.path.join(library_dir, "build_up.md"), BUILD_UP)
+        write(os.path.join(library_dir, "width.jsonl"), "\n".join(json.dumps(block) for block in WIDTH) + "\n")
+        shutil.copy(CHUNKS_FILE, os.path.join(library_dir, "soccer_tactics.json"))
+
+        passages = list(iter_passages(os.path.join(library_dir, "pressing.txt")))
+        assert len(passages) == 2 and "high defensive line" in passages[1]["text"], passages
+
+        library = CorpusLibrary(library_dir, workers=workers)
+        start = time.perf_counter()
+        report = library.sync()
+        assert sorted(report["added"]) == ["build_up.md", "pressing.txt", "soccer_tactics.json", "width.jsonl"], report
+        pdf_passages = len(load_parsed_pdf(CHUNKS_FILE))
+        assert report["passages"] == pdf_passages + 2 + 1 + 2, report
+        print(f"Ingested {report['documents']} documents ({report['passages']} passages) with {workers} worker(s) "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        retriever = library.retriever()
+        best = retriever.index.search("gegenpressing ball carrier", top_k=1)[0]
+        assert best["source"] == "pressing.txt", best
+        wide = retriever.index.search("wingers width underlap", top_k=1)[0]
+        assert wide["source"] == "width.jsonl" and wide["page"] == 3, wide
+
+        # Nothing changed: nothing is read again, even after a touch
+        os.utime(os.path.join(library_dir, "build_up.md"))
+        report = library.sync()
+        assert report["added"] == [] and report["removed"] == [] and report["updated"] == ["build_up.md"], report
+
+        # Change one document and delete another; only they are touched
+        write(os.path.join(library_dir, "pressing.txt"), PRESSING + "\nPressing traps steer play to the touchline.\n")
+        os.remove(os.path.join(library_dir, "width.jsonl"))
+        report = library.sync()
+        assert report["updated"] == ["pressing.txt"] and report["removed"] == ["width.jsonl"], report
+        assert len(os.listdir(library.segments_dir)) == 3
+        retriever = library.retriever()
+        assert retriever.index.search("pressing traps touchline", top_k=1)[0]["source"] == "pressing.txt"
+        assert all(p["source"] != "width.jsonl" for p in retriever.index.search("wingers width underlap"))
+
+        # add()/remove() ingest or drop just the named documents
+        extra = os.path.join(tempfile.mkdtemp(), "set_pieces.txt")
+        write(extra, "Zonal marking at corners protects the six-yard box.\n")
+        report = library.add([extra])
+        assert report["added"] == ["set_pieces.txt"] and report["documents"] == 4, report
+        report = CorpusLibrary(library_dir, workers=workers).sync()
+        assert not (report["added"] or report["updated"] or report["removed"]), report
+        report = library.remove(["build_up.md"])
+        assert report["removed"] == ["build_up.md"] and report["documents"] == 3, report
+        assert library.retriever().index.search("zonal marking corners", top_k=1)[0]["source"] == "set_pieces.txt"
+        shutil.rmtree(os.path.dirname(extra))
+    finally:
+        shutil.rmtree(library_dir)
+
+
+def check_refresh():
+    library_dir = tempfile.mkdtemp()
+    try:
+        validator = ResponseValidator("./data/data.txt", CHUNKS_FILE)
+        pdf_retriever = validator.retriever
+        library = CorpusLibrary(library_dir)
+        # An empty library keeps the parsed-PDF passages instead of dropping to keyword windows
+        assert library.refresh(validator)["documents"] == 0 and validator.retriever is pdf_retriever
+
+        write(os.path.join(library_dir, "pressing.txt"), PRESSING)
+        library.refresh(validator)
+        assert validator.retriever is not pdf_retriever
+        assert validator.retriever.index.search("gegenpressing", top_k=1)[0]["source"] == "pressing.txt"
+
+        os.remove(os.path.join(library_dir, "pressing.txt"))
+        library.refresh(validator)
+        assert validator.retriever is pdf_retriever
+    finally:
+        shutil.rmtree(library_dir)
+
+
+def main():
+    check_term_frequencies()
+    check_refresh()
+    check_library(workers=1)
+    check_library(workers=4)
+
+
+if __name__ == "__main__":
+    main()
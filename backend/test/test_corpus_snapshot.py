@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_snapshot import MAGIC, load_or_build, load_snapshot, write_snapshot
+
+DATA_FILE = "./data/data.txt"
+CHUNKS_FILE = "./data/87a4d6cd-98c6-43a6-b504-0287c1223a4c.json"
+
+
+def corrupt(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def check_corrupt_snapshots():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "corpus.snapshot")
+        write_snapshot(path, DATA_FILE, CHUNKS_FILE)
+        with open(path, 'rb') as f:
+            snapshot = f.read()
+        index, retriever = load_snapshot(path, DATA_FILE, CHUNKS_FILE)
+        expected = index.find("pressing", limit=3)
+        assert expected and retriever is not None
+
+        header_length = struct.unpack_from("<Q", snapshot, len(MAGIC))[0]
+        header = json.loads(snapshot[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+        del header["corpus"]
+        missing_key = json.dumps(header).encode("utf-8")
+        cases = {
+            "empty": b"",
+            "magic only": MAGIC,
+            "truncated header": snapshot[:len(MAGIC) + 8 + header_length // 2],
+            "truncated sections": snapshot[:len(snapshot) // 2],
+            "header without corpus": MAGIC + struct.pack("<Q", len(missing_key)) + missing_key,
+        }
+        for name, data in cases.items():
+            corrupt(path, data)
+            assert load_snapshot(path, DATA_FILE, CHUNKS_FILE) is None, name
+            # load_or_build replaces it instead of failing at startup
+            index, retriever = load_or_build(path, DATA_FILE, CHUNKS_FILE)
+            assert index.find("pressing", limit=3) == expected and retriever is not None, name
+        print(f"Rebuilt {len(cases)} corrupt snapshots: {', '.join(cases)}")
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    check_corrupt_snapshots()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_scoring import INCREMENTAL, JUDGE, LEXICAL, IncrementalScorer
+from metrics import ERRORS, STAGE_SECONDS
+
+CONTEXTS = ["[p. 4] Pressing in midfield forces the opponent's pivots to play backwards."]
+TOKENS = (
+    ["<think>", "They", " play", " a", " flat", " 4-4-2", ".", "</think>", "\n\n"]
+    + ["Press", " their", " pivots", " in", " midfield", ".", "\n", "\n"]
+    + ["Then", " attack", " the", " wide", " channels", " quickly", ".", "\n\n"]
+    + ["Keep", " the", " pressing", " compact", "."]
+)
+TOKEN_DELAY = 0.02
+JUDGE_DELAY = 1.0
+
+
+def check_scorer():
+    scorer = IncrementalScorer()
+    answer = "".join(TOKENS[TOKENS.index("</think>") + 1:])
+    # Paragraphs that complete before the contexts arrive are scored when they do
+    scores = [scorer.feed(token) for token in answer[:60]]
+    assert not any(scores)
+    first = scorer.set_contexts(CONTEXTS)
+    assert first["paragraphs"] == 1 and first["accuracy_score"] == 100, first
+    scores = [score for score in (scorer.feed(token) for token in answer[60:]) if score]
+    assert [score["paragraphs"] for score in scores] == [2], scores
+    final = scorer.finish()
+    assert final["paragraphs"] == 3 and 0 < final["accuracy_score"] < first["accuracy_score"], final
+    print(f"Provisional scores: {first} -> {scores} -> {final}")
+
+    # A paragraph break split across tokens
+    split = IncrementalScorer()
+    split.set_contexts(CONTEXTS)
+    assert not any(split.feed(token) for token in ["Press their pivots.", "\n", "  "])
+    assert split.feed("\nThen") == {"accuracy_score": 100, "paragraphs": 1, "method": LEXICAL}
+
+    # Each token is searched on its own, so a long paragraph costs linear time
+    long = IncrementalScorer()
+    start = time.perf_counter()
+    for token in "press their pivots " * 8000:
+        long.feed(token)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 1.0, elapsed
+    print(f"Fed a {len('press their pivots ') * 8000}-character paragraph in {elapsed * 1000:.0f} ms")
+
+
+def run(client, mode):
+    import app as tactics_app
+
+    tactics_app.validation_mode = mode
+    start = time.perf_counter()
+    response = client.post("/api/tactics", json={"prompt": f"How do we press a 4-4-2? ({mode})", "protocol": "delta"},
+                           headers={"X-Cache-Bypass": "1"})
+    events = []
+    for line in response.response:
+        for part in line.decode("utf-8").splitlines():
+            events.append((time.perf_counter() - start, json.loads(part)))
+    return events
+
+
+def check_api():
+    import app as tactics_app
+    from Ollama import OllamaLLM
+    from ollama_stub import OllamaStubServer
+
+    class KeywordLLM(OllamaLLM):
+        def generate_response(self, prompt, priority=None):
+            return {"thinking": "", "answer": "pressing, midfield"}
+
+    def slow_judge(answer, contexts):
+        time.sleep(JUDGE_DELAY)
+        return {"accuracy_score": 90, "validation": "Matches the reference"}
+
+    with OllamaStubServer(tokens=TOKENS, token_delay=TOKEN_DELAY) as stub:
+        tactics_app.llm = KeywordLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+        tactics_app.validator.pack_contexts = lambda keywords, token_budget=None: {
+            "contexts": CONTEXTS, "tokens": 20, "tokens_saved": 0
+        }
+        tactics_app.validator.validate_response = slow_judge
+        tactics_app.VALIDATION_REFINE_DEADLINE = 0.2
+        client = tactics_app.app.test_client()
+
+        for mode in (JUDGE, INCREMENTAL, LEXICAL):
+            events = run(client, mode)
+            last_token = max(at for at, event in events if event["type"] == "token")
+            final_at, final = events[-1]
+            scores = [event for _, event in events if event["type"] == "score"]
+            wait = final_at - last_token
+            print(f"{mode:12s} scores={[s['accuracy_score'] for s in scores]} final={final['accuracy_score']} "
+                  f"after last token={wait * 1000:.0f} ms")
+            if mode == JUDGE:
+                assert not scores and final["accuracy_score"] == 90 and wait >= JUDGE_DELAY
+            else:
+                # Provisional scores arrive while the answer streams, and the final does not wait for the judge
+                assert scores and scores[0]["provisional"] and wait < JUDGE_DELAY / 2
+                assert min(at for at, event in events if event["type"] == "score") < last_token
+                assert final["accuracy_score"] == scores[-1]["accuracy_score"]
+                assert "not checked by the judge" in final["validation_details"]
+        # The missed judge deadline was timed, but it is not an error
+        assert STAGE_SECONDS.count(stage="judge_wait") >= 1 and ERRORS.value(stage="judge_wait") == 0
+
+        # A judge that answers within the deadline refines the final score
+        tactics_app.validator.validate_response = lambda answer, contexts: {"accuracy_score": 90, "validation": "ok"}
+        final = run(client, INCREMENTAL)[-1][1]
+        assert final["accuracy_score"] == 90, final
+
+
+def main():
+    check_scorer()
+    check_api()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as tactics_app
+from Ollama import OllamaLLM
+from ollama_stub import DEFAULT_TOKENS, OllamaStubServer
+
+TOKEN_DELAY = 0.02
+ANSWER_TOKENS = DEFAULT_TOKENS + [" Then", " switch", " play", " quickly"] * 10
+
+
+class SlowKeywordLLM(OllamaLLM):
+    """Streams from the stub, but the keyword round-trip takes extraction_delay seconds"""
+
+    extraction_delay = 0.0
+
+    def generate_response(self, prompt):
+        time.sleep(self.extraction_delay)
+        return {"thinking": "", "answer": "pressing, half-spaces"}
+
+
+def run(extraction_delay: float):
+    tactics_app.llm.extraction_delay = extraction_delay
+    client = tactics_app.app.test_client()
+    start = time.perf_counter()
+    response = client.post("/api/tactics", json={"prompt": "How do we beat a 4-4-2?", "protocol": "delta"},
+                           headers={"X-Cache-Bypass": "1"})
+    events = []
+    for line in response.response:
+        for part in line.decode("utf-8").splitlines():
+            events.append((time.perf_counter() - start, json.loads(part)))
+    return events
+
+
+def main():
+    with OllamaStubServer(tokens=ANSWER_TOKENS, token_delay=TOKEN_DELAY) as stub:
+        tactics_app.llm = SlowKeywordLLM(model_name="deepseek-r1:7b")
+        tactics_app.llm.base_url = stub.base_url
+        tactics_app.validator.validate_response = lambda answer, contexts: {
+            "accuracy_score": 80, "validation": f"{len(contexts)} contexts"
+        }
+        stream_time = len(ANSWER_TOKENS) * TOKEN_DELAY
+
+        # Extraction finishes mid-answer: tokens keep flowing and keywords arrive between them
+        events = run(extraction_delay=stream_time / 3)
+        kinds = [event["type"] for _, event in events]
+        print(f"Event order: {' '.join(dict.fromkeys(kinds))}")
+        first_token = kinds.index("token")
+        keywords_at = kinds.index("keywords")
+        assert first_token < keywords_at < len(kinds) - 1, "keywords did not overlap the answer"
+        final = events[-1][1]
+        assert final["type"] == "final" and final["keywords"] == ["pressing", "half-spaces"]
+        assert final["accuracy_score"] == 80
+        gap = max(b[0] - a[0] for a, b in zip(events, events[1:]))
+        print(f"Keywords merged after {keywords_at - first_token} answer tokens, largest gap {gap * 1000:.0f} ms")
+
+        # Extraction outlives the deadline: the final event is not held up waiting for it
+        tactics_app.KEYWORD_DEADLINE = 0.1
+        events = run(extraction_delay=5.0)
+        elapsed, final = events[-1]
+        print(f"Slow extraction: final after {elapsed:.2f}s (stream alone {stream_time:.2f}s)")
+        assert final["type"] == "final" and final["keywords"] == []
+        assert elapsed < stream_time + 1.0, "final event waited for keyword extraction"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import ERRORS, GENERATED_TOKENS, STAGE_SECONDS, Registry, Trace, observe_chunk, stats_lines
+
+
+def check_histogram():
+    registry = Registry()
+    histogram = registry.histogram("stage_seconds", "Stage times", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, stage="validate")
+    registry.add_collector(lambda: stats_lines("cache", {"hits": 3, "hit_rate": 0.75, "models": ["x"]}, model="a"))
+    text = registry.render()
+    for line in (
+        'stage_seconds_bucket{stage="validate",le="0.1"} 1',
+        'stage_seconds_bucket{stage="validate",le="1"} 3',
+        'stage_seconds_bucket{stage="validate",le="+Inf"} 4',
+        'stage_seconds_sum{stage="validate"} 6.05',
+        'stage_seconds_count{stage="validate"} 4',
+        'cache_hits{model="a"} 3',
+        'cache_hit_rate{model="a"} 0.75',
+    ):
+        assert line in text, (line, text)
+    assert "cache_models" not in text
+    print(text)
+
+
+def check_trace():
+    trace = Trace("generation", model="deepseek-r1:7b")
+    chunks = [
+        {"type": "thinking", "delta": "The", "is_complete": False},
+        {"type": "thinking", "content": "The opponent", "is_complete": True},
+        {"type": "answer", "content": "Press"},
+        {"type": "done", "content": "Press", "eval_count": 40, "eval_duration": 2_000_000_000},
+    ]
+    for chunk in chunks:
+        observe_chunk(trace, "deepseek-r1:7b", chunk)
+    try:
+        with trace.stage("validate"):
+            raise ValueError("judge timed out")
+    except ValueError:
+        pass
+    trace.finish(status="ok")
+    assert {"first_token", "thinking", "answer", "validate", "total"} <= set(trace.stages), trace.stages
+    assert trace.fields["tokens_per_sec"] == 20.0
+    assert trace.fields["errors"] == [{"stage": "validate", "message": "judge timed out"}]
+
+
+def check_api():
+    import app as tactics_app
+    from Ollama import OllamaLLM
+    from ollama_stub import OllamaStubServer
+
+    with OllamaStubServer(token_delay=0.01) as stub:
+        tactics_app.llm = OllamaLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+        tactics_app.validator.validate_response = lambda answer, contexts: {"accuracy_score": 75, "validation": "ok"}
+        client = tactics_app.app.test_client()
+        for _ in range(2):
+            response = client.post("/api/tactics", json={"prompt": "How do we beat a 4-4-2?", "protocol": "delta"})
+            assert json.loads(response.get_data(as_text=True).splitlines()[-1])["type"] == "final"
+
+        text = client.get("/api/metrics").get_data(as_text=True)
+        for line in (
+            'tactics_requests_total{cache="MISS",status="ok"} 1',
+            'tactics_requests_total{cache="HIT",status="ok"} 1',
+            'tactics_stage_seconds_count{stage="request_total"} 2',
+            'tactics_response_cache_hits 1',
+        ):
+            assert line in text, (line, text)
+        # check_trace already counted 40 tokens
+        assert GENERATED_TOKENS.value(model="deepseek-r1:7b") == 40 + len(stub.tokens)
+        print("Metrics endpoint reports request, token and stage metrics")
+
+        # Keyword extraction missing its deadline is timed, but it is not an error
+        extract_keywords = tactics_app.validator.extract_keywords
+        tactics_app.validator.extract_keywords = lambda llm, thinking: time.sleep(0.5) or ["press"]
+        deadline, tactics_app.KEYWORD_DEADLINE = tactics_app.KEYWORD_DEADLINE, 0
+        try:
+            response = client.post("/api/tactics", json={"prompt": "How do we press a back three?", "protocol": "delta"})
+            assert json.loads(response.get_data(as_text=True).splitlines()[-1])["type"] == "final"
+        finally:
+            tactics_app.validator.extract_keywords = extract_keywords
+            tactics_app.KEYWORD_DEADLINE = deadline
+        assert STAGE_SECONDS.count(stage="keyword_wait") >= 1
+        assert ERRORS.value(stage="keyword_wait") == 0
+
+
+def main():
+    check_histogram()
+    check_trace()
+    check_api()
+
+
+if __name__ == "__main__":
+    main()
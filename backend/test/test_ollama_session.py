@@ -0,0 +1,47 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Ollama import OllamaLLM
+from ollama_session import OllamaSession
+from ollama_stub import OllamaStubServer
+
+CALLS = 20
+
+
+def main():
+    with OllamaStubServer() as stub:
+        session = OllamaSession(pool_size=2, connect_timeout=1, read_timeout=5)
+        llm = OllamaLLM(model_name="deepseek-r1:7b", session=session)
+        llm.base_url = stub.base_url
+
+        print(f"Available models: {llm.list_available_models()}")
+        for _ in range(CALLS):
+            chunks = list(llm.generate_stream("How do we beat a 4-4-2?"))
+            assert chunks[-1]["type"] == "done" and chunks[-1]["content"]
+            assert llm.generate_response("Extract keywords")["answer"]
+
+        stats = session.stats()
+        print(f"Client stats: {stats}")
+        print(f"Stub accepted {stub.connections} connections for {stub.requests} requests")
+        assert stats["requests"] == stub.requests == 2 * CALLS + 1
+        assert stub.connections == stats["connections_opened"] == 1, "connections were not reused"
+
+    # Nothing listening any more: connection errors are retried with backoff, then raised
+    session = OllamaSession(max_retries=2, backoff_factor=0.01, connect_timeout=0.5)
+    llm = OllamaLLM(session=session)
+    llm.base_url = stub.base_url
+    try:
+        llm.list_available_models()
+    except Exception as e:
+        print(f"Unreachable server raised after retries: {type(e).__name__}")
+    else:
+        raise AssertionError("unreachable server did not raise")
+    stats = session.stats()
+    print(f"Client stats: {stats}")
+    assert (stats["requests"], stats["retries"], stats["errors"]) == (1, 2, 1), stats
+
+
+if __name__ == "__main__":
+    main()
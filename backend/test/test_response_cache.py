@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache, normalize_prompt
+
+SNAPSHOT = {
+    "thinking": "They sit deep in two banks of four.",
+    "answer": "Overload the half-spaces and press their pivots.\n",
+    "accuracy_score": 85,
+    "validation_details": "Matches the reference",
+    "keywords": ["half-spaces", "pressing"],
+}
+
+
+def check_normalization():
+    same = ["How do we beat a 4-4-2?", "tactics vs 442", "Best way to counter the 4 4 2", "beating 4-4-2"]
+    keys = {" ".join(normalize_prompt(prompt)) for prompt in same}
+    assert keys == {"against 4_4_2"}, keys
+    assert normalize_prompt("how to beat a 4-3-3") != normalize_prompt("how to beat a 4-4-2")
+    assert normalize_prompt("what happened in 2024") == ["happened", "2024"]
+    # Word order is part of the question
+    assert normalize_prompt("How do we beat a 4-4-2 with a 3-5-2?") != normalize_prompt(
+        "How do we beat a 3-5-2 with a 4-4-2?")
+    print(f"Normalized {len(same)} phrasings to one key: {keys.pop()!r}")
+
+
+def check_cache():
+    cache = ResponseCache(max_entries=3, max_bytes=10_000, ttl=60, similarity=0.75)
+    cache.store("How do we beat a 4-4-2 with a high press and quick wingers?", SNAPSHOT)
+    assert cache.lookup("tactics vs 442 with a high press and quick wingers") == SNAPSHOT
+    # Near match: one extra word out of five
+    assert cache.lookup("beat 4-4-2 with high press, quick wingers, overlapping") == SNAPSHOT
+    # Formations must match exactly even when the other words agree
+    assert cache.lookup("beat 4-3-3 with a high press and quick wingers") is None
+
+    # The same words in another order ask the opposite question
+    cache.store("How do we beat a 4-4-2 with a 3-5-2?", SNAPSHOT)
+    assert cache.lookup("How do we beat a 3-5-2 with a 4-4-2?") is None
+    cache.store("Should we press high or sit deep?", SNAPSHOT)
+    assert cache.lookup("Should we sit high or press deep?") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (2, 1, 3), stats
+    cache.clear()
+
+    for i in range(4):
+        cache.store(f"question number {i}", SNAPSHOT)
+    assert cache.stats()["entries"] == 3 and cache.lookup("question number 0") is None
+
+    small = ResponseCache(max_entries=10, max_bytes=2 * len(json.dumps(SNAPSHOT)) + 1)
+    for i in range(3):
+        small.store(f"question number {i}", SNAPSHOT)
+    assert small.stats()["entries"] == 2 and small.stats()["evictions"] == 1
+
+    expired = ResponseCache(ttl=0)
+    expired.store("tactics vs 442", SNAPSHOT)
+    assert expired.lookup("tactics vs 442") is None
+    print(f"Cache: {cache.stats()}")
+
+
+def check_api():
+    import app as tactics_app
+    from Ollama import OllamaLLM
+    from ollama_stub import OllamaStubServer
+
+    with OllamaStubServer() as stub:
+        tactics_app.llm = OllamaLLM(model_name="deepseek-r1:7b")
+        tactics_app.llm.base_url = stub.base_url
+        tactics_app.validator.validate_response = lambda answer, contexts: {
+            "accuracy_score": 90, "validation": "Matches the reference"
+        }
+        client = tactics_app.app.test_client()
+
+        def ask(prompt, headers=None):
+            response = client.post("/api/tactics", json={"prompt": prompt}, headers=headers or {})
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            return response.headers["X-Cache"], lines
+
+        status, live = ask("How do we beat a 4-4-2?")
+        assert status == "MISS"
+        generations = stub.requests
+
+        status, replayed = ask("tactics vs 442")
+        assert status == "HIT" and stub.requests == generations, "cached prompt reached Ollama"
+        assert replayed[-1]["data"] == live[-1]["data"], (replayed[-1], live[-1])
+        assert [line["data"]["update_type"] for line in replayed][:2] == ["thinking", "thinking"]
+
+        status, _ = ask("tactics vs 442", headers={"X-Cache-Bypass": "1"})
+        assert status == "BYPASS" and stub.requests > generations
+        print(f"API: live {len(live)} lines, replay {len(replayed)} lines, {tactics_app.response_cache.stats()}")
+
+
+def main():
+    check_normalization()
+    check_cache()
+    check_api()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import BACKGROUND, INTERACTIVE, Overloaded, QueueTimeout, Scheduler
+
+MODEL = "deepseek-r1:7b"
+
+
+def check_priority_and_limits():
+    scheduler = Scheduler(max_concurrency=1, max_queue=2)
+    running = scheduler.request(MODEL, INTERACTIVE)
+    assert running.granted
+
+    background = scheduler.request(MODEL, BACKGROUND)
+    interactive = scheduler.request(MODEL, INTERACTIVE)
+    # The interactive stream jumps ahead of the background job queued before it
+    assert (interactive.position(), background.position()) == (1, 2)
+    try:
+        scheduler.request(MODEL, INTERACTIVE)
+        raise AssertionError("full queue accepted a request")
+    except Overloaded as e:
+        assert (e.position, e.queue_length) == (3, 2) and e.retry_after >= 1
+        print(f"Overloaded: {e.to_dict()}")
+
+    # Other models have their own slots
+    assert scheduler.request("deepseek-r1:1.5b", BACKGROUND).granted
+
+    running.release()
+    assert interactive.granted and not background.granted
+    interactive.release()
+    assert background.granted
+    background.release()
+    print(f"Stats: {scheduler.stats()}")
+
+
+def check_deadline():
+    scheduler = Scheduler(max_concurrency=1, queue_timeouts={INTERACTIVE: 0.1, BACKGROUND: 0.1})
+    running = scheduler.request(MODEL)
+    late = scheduler.request(MODEL, BACKGROUND)
+    start = time.perf_counter()
+    try:
+        late.wait()
+        raise AssertionError("waiter was granted a busy slot")
+    except QueueTimeout:
+        pass
+    assert time.perf_counter() - start < 1
+    running.release()
+    # The abandoned waiter is skipped, so the slot stays free for the next caller
+    assert not late.granted and scheduler.request(MODEL).granted
+    print("Queued call gave up at its deadline")
+
+
+def check_async():
+    scheduler = Scheduler(max_concurrency=1)
+
+    async def main():
+        running = scheduler.request(MODEL)
+        order = []
+
+        async def job(name, priority):
+            async with scheduler.slot_async(MODEL, priority):
+                order.append(name)
+
+        tasks = [asyncio.create_task(job("background", BACKGROUND)), asyncio.create_task(job("interactive", INTERACTIVE))]
+        await asyncio.sleep(0.05)
+        # Released from another thread, as when a Flask-style worker finishes
+        threading.Thread(target=running.release).start()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(main())
+    assert order == ["interactive", "background"], order
+    print(f"Async grant order: {order}")
+
+
+def check_api():
+    import app as tactics_app
+    from Ollama import OllamaLLM
+    from ollama_stub import OllamaStubServer
+
+    with OllamaStubServer(token_delay=0.05) as stub:
+        tactics_app.scheduler = Scheduler(max_concurrency=1, max_queue=1)
+        tactics_app.llm = OllamaLLM(model_name=MODEL, scheduler=tactics_app.scheduler)
+        tactics_app.llm.base_url = stub.base_url
+        tactics_app.validator.validate_response = lambda answer, contexts: {
+            "accuracy_score": 75, "validation": "Matches the reference"
+        }
+        client = tactics_app.app.test_client()
+        headers = {"X-Cache-Bypass": "1"}
+
+        def post(prompt):
+            return client.post("/api/tactics", json={"prompt": prompt, "protocol": "delta"}, headers=headers)
+
+        first = post("How do we beat a 4-4-2?")
+        first_lines = iter(first.response)
+        next(first_lines)  # the first stream now holds the only slot
+
+        second = post("How do we beat a 3-5-2?")
+        second_lines = iter(second.response)
+        queued = json.loads(next(second_lines))
+        assert queued["type"] == "queued" and queued["queue_position"] == 1, queued
+
+        rejected = post("How do we beat a 4-3-3?")
+        print(f"Rejected: {rejected.status_code} Retry-After={rejected.headers['Retry-After']} {rejected.get_json()}")
+        assert rejected.status_code == 429 and rejected.get_json()["queue_position"] == 2
+
+        rest = [json.loads(line) for line in list(first_lines) + list(second_lines)]
+        assert sum(1 for event in rest if event["type"] == "final") == 2
+
+
+def main():
+    check_priority_and_limits()
+    check_deadline()
+    check_async()
+    check_api()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_pool import BackendPool
+from Ollama import STREAM_PROMPT_PREFIX
+from sessions import SESSION_KEEP_ALIVE, SessionStore, session_id_of
+
+PREFILL_DELAY = 0.002
+QUESTION = "How do we beat a 4-4-2 that defends deep with two banks of four and counters quickly?"
+FOLLOW_UP = "And if they switch to a back five?"
+SHARED_QUESTION = "How do we play through a compact 5-3-2 mid block?"
+
+
+def check_store():
+    store = SessionStore(max_sessions=2, max_context=5)
+    assert store.stream_options(None) == {}
+    assert store.stream_options("a") == {"context": [], "keep_alive": SESSION_KEEP_ALIVE}
+    store.update("a", {"context": list(range(5)), "base_url": "http://gpu1:11434/api"})
+    store.update("a", {"eval_count": 3})  # no context (cancelled or failed): the session is kept as is
+    options = store.stream_options("a")
+    assert options["context"] == [0, 1, 2, 3, 4] and options["prefer"] == "http://gpu1:11434/api", options
+    # Past max_context the conversation starts over rather than sending a cut-off context
+    store.update("a", {"context": list(range(10)), "base_url": "http://gpu1:11434/api"})
+    assert store.stream_options("a") == {"context": [], "keep_alive": SESSION_KEEP_ALIVE}
+    assert store.stats()["resets"] == 1
+    store.update("a", {"context": [7], "base_url": "http://gpu1:11434/api"})
+    store.update("b", {"context": [1]})
+    store.update("c", {"context": [2]})
+    assert store.stream_options("a")["context"] == []  # least recently used, evicted
+    assert store.stats()["evictions"] == 1
+
+    assert session_id_of({}, {"session_id": "chat-1"}) == "chat-1"
+    assert session_id_of({"x-session-id": "chat-2"}, {}) == "chat-2"
+    assert session_id_of({}, {"session_id": "../../etc"}) is None and session_id_of({}, {}) is None
+
+    pool = BackendPool(["http://gpu1:11434/api", "http://gpu2:11434/api"])
+    busy = pool.acquire("deepseek-r1:7b", prefer="http://gpu2:11434/api")
+    # The session's backend wins even when it is the busier one
+    assert pool.acquire("deepseek-r1:7b", prefer="http://gpu2:11434/api") is busy
+    assert pool.acquire("deepseek-r1:7b").base_url == "http://gpu1:11434/api"
+
+
+def ask(client, prompt, session_id=None):
+    body = {"prompt": prompt, "protocol": "delta"}
+    if session_id:
+        body["session_id"] = session_id
+    start = time.perf_counter()
+    response = client.post("/api/tactics", json=body)
+    first_token = None
+    answer = ""
+    for line in response.response:
+        for part in line.decode("utf-8").splitlines():
+            event = json.loads(part)
+            if event["type"] in ("thinking", "token") and first_token is None:
+                first_token = time.perf_counter() - start
+            if event["type"] == "final":
+                answer = event["answer"]
+    return response.headers["X-Cache"], first_token, answer
+
+
+def check_api():
+    import app as tactics_app
+    from Ollama import OllamaLLM
+    from ollama_stub import OllamaStubServer
+
+    words = lambda text: len((STREAM_PROMPT_PREFIX + text).split())
+    with OllamaStubServer(prefill_delay=PREFILL_DELAY) as stub:
+        tactics_app.llm = OllamaLLM(model_name="deepseek-r1:7b", base_url=stub.base_url)
+        tactics_app.validator.validate_response = lambda answer, contexts: {"accuracy_score": 80, "validation": "ok"}
+        client = tactics_app.app.test_client()
+
+        # A session's first question is cached like any other
+        cache, _, answer = ask(client, QUESTION, "match-prep")
+        assert cache == "MISS" and stub.prefilled[-1] == words(QUESTION), stub.prefilled
+        assert stub.keep_alive[-1] == SESSION_KEEP_ALIVE
+        first_context = tactics_app.sessions.stream_options("match-prep")["context"]
+
+        # The follow-up sends the conversation as Ollama's context, which Ollama still holds
+        cache, session_ttft, _ = ask(client, FOLLOW_UP, "match-prep")
+        assert cache == "BYPASS" and stub.prefilled[-1] == words(FOLLOW_UP), stub.prefilled
+        assert len(tactics_app.sessions.stream_options("match-prep")["context"]) > words(QUESTION) + words(FOLLOW_UP)
+
+        # Without a session the client has to resend the conversation as text
+        _, resend_ttft, _ = ask(client, f"{QUESTION}\n{answer}\n{FOLLOW_UP}")
+        assert stub.prefilled[-1] == words(f"{QUESTION}\n{answer}\n{FOLLOW_UP}")
+        assert session_ttft < resend_ttft, (session_ttft, resend_ttft)
+
+        # Another conversation does not share the first one's context
+        ask(client, FOLLOW_UP, "other-match")
+        assert stub.prefilled[-1] == words(FOLLOW_UP)
+        assert tactics_app.sessions.stats()["entries"] == 2
+
+        # A cached first answer still starts the conversation its follow-ups continue
+        generations = len(stub.prefilled)
+        cache, _, _ = ask(client, QUESTION, "rematch")
+        assert cache == "HIT" and len(stub.prefilled) == generations
+        assert tactics_app.sessions.stream_options("rematch")["context"] == first_context
+        cache, _, _ = ask(client, FOLLOW_UP, "rematch")
+        assert cache == "BYPASS" and stub.prefilled[-1] == len(first_context) + words(FOLLOW_UP), stub.prefilled
+
+        # An answer first generated without a session can still start one
+        cache, _, _ = ask(client, SHARED_QUESTION)
+        assert cache == "MISS"
+        cache, _, _ = ask(client, SHARED_QUESTION, "late-joiner")
+        shared_context = tactics_app.sessions.stream_options("late-joiner")["context"]
+        assert cache == "HIT" and len(shared_context) > words(SHARED_QUESTION), shared_context
+        # Ollama still holds that context from the shared generation, so only the follow-up is evaluated
+        cache, _, _ = ask(client, FOLLOW_UP, "late-joiner")
+        assert cache == "BYPASS" and stub.prefilled[-1] == words(FOLLOW_UP), stub.prefilled
+    print(f"Follow-up first token: {session_ttft * 1000:.0f} ms in a session, "
+          f"{resend_ttft * 1000:.0f} ms resending the conversation")
+
+
+def main():
+    check_store()
+    check_api()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as tactics_app
+from Ollama import OllamaLLM
+from ollama_stub import DEFAULT_TOKENS, OllamaStubServer
+from single_flight import flight_key
+
+FOLLOWERS = 8
+TOKENS = DEFAULT_TOKENS + [" Keep", " the", " lines", " compact."] * 10
+TOKEN_DELAY = 0.02
+NO_CACHE = {"X-Cache-Bypass": "1"}
+
+
+class CountingLLM(OllamaLLM):
+    streams = 0
+
+    def generate_stream(self, prompt):
+        CountingLLM.streams += 1
+        return super().generate_stream(prompt)
+
+
+def ask(prompt, protocol, results, index, delay=0.0, headers=None):
+    time.sleep(delay)
+    client = tactics_app.app.test_client()
+    response = client.post("/api/tactics", json={"prompt": prompt, "protocol": protocol}, headers=headers or {})
+    results[index] = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def check_coalescing():
+    results = [None] * FOLLOWERS
+    threads = [
+        # Mixed protocols share a flight; the last ones join after the stream has started
+        threading.Thread(target=ask, args=("How do we beat a 4-4-2?", "delta" if i % 2 else None, results, i,
+                                           0.3 if i >= FOLLOWERS - 2 else 0.0))
+        for i in range(FOLLOWERS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    finals = [lines[-1].get("data", lines[-1]) for lines in results]
+    answers = {final["answer"] for final in finals}
+    thinking = {final["thinking"] for final in finals}
+    print(f"{FOLLOWERS} requests, {CountingLLM.streams} upstream generation(s), flights {tactics_app.flights.stats()}")
+    assert CountingLLM.streams == 1, "identical requests were not coalesced"
+    assert len(answers) == 1 and len(thinking) == 1 and answers.pop().endswith("compact.")
+    # Late joiners replayed what they missed: their streams are as long as everyone else's
+    delta_tokens = [sum(1 for line in lines if line.get("type") == "token") for lines in results[1::2]]
+    assert len(set(delta_tokens)) == 1, delta_tokens
+
+
+def check_cleanup(stub):
+    aborted = stub.aborted_streams
+    client = tactics_app.app.test_client()
+    responses = [client.post("/api/tactics", json={"prompt": "How do we press a back three?"}) for _ in range(2)]
+    iterators = [iter(response.response) for response in responses]
+    for iterator in iterators:
+        next(iterator)
+    # The first follower leaving keeps the generation alive for the second
+    responses[0].close()
+    next(iterators[1])
+    assert tactics_app.flights.stats()["in_flight"] == 1
+    responses[1].close()
+
+    deadline = time.monotonic() + 5
+    while (stub.aborted_streams == aborted or tactics_app.flights.stats()["in_flight"]) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    print(f"After every follower left: flights {tactics_app.flights.stats()}, "
+          f"upstream aborted {stub.aborted_streams - aborted}")
+    assert tactics_app.flights.stats()["in_flight"] == 0
+    assert stub.aborted_streams == aborted + 1, "abandoned generation was not cancelled"
+
+
+def check_keys_and_bypass():
+    # Only the same question shares a generation, not the same words in another order
+    assert flight_key("How do we beat a 4-4-2?") == flight_key("  how do we BEAT a 4-4-2? ")
+    assert flight_key("Beat a 4-4-2 with a 3-5-2?") != flight_key("Beat a 3-5-2 with a 4-4-2?")
+
+    # Requests that bypass the cache do not join a generation in flight
+    streams = CountingLLM.streams
+    results = [None] * 2
+    threads = [threading.Thread(target=ask, args=("How do we defend a long throw?", "delta", results, i, 0.0, NO_CACHE))
+               for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert CountingLLM.streams == streams + 2, CountingLLM.streams - streams
+
+
+def main():
+    with OllamaStubServer(tokens=TOKENS, token_delay=TOKEN_DELAY) as stub:
+        tactics_app.llm = CountingLLM(model_name="deepseek-r1:7b")
+        tactics_app.llm.base_url = stub.base_url
+        tactics_app.validator.validate_response = lambda answer, contexts: {
+            "accuracy_score": 75, "validation": "Matches the reference"
+        }
+        check_coalescing()
+        check_cleanup(stub)
+        check_keys_and_bypass()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from think_parser import ThinkTagParser, split_thinking
+
+# Fragments chosen so random streams hit split tags, stray closing tags and empty sections
+FRAGMENTS = [
+    "<think>", "</think>", "<", "</", "<th", "ink>", "think", ">", "/think>",
+    "press", " high", " line", "\n", "  ", "4-4-2", " overload", " the", " wings",
+    "<thin", "k>", "</thi", "nk>", "", "Answer:", " Use", " a", " back", " three.",
+]
+WORDS = ["press", " high", " line", "\n", "4-4-2", " overload", " the", " wings", " three."]
+
+
+def legacy_stream(tokens):
+    """Reference: the buffer-rescanning loop OllamaLLM.generate_stream used before ThinkTagParser"""
+    accumulated_buffer = ""
+    thinking_complete = False
+    answer_text = ""
+    thinking_start = -1
+    thinking_sent = 0
+
+    for token in tokens:
+        accumulated_buffer += token
+
+        if not thinking_complete and "</think>" in accumulated_buffer:
+            think_match = re.search(r'<think>(.*?)</think>', accumulated_buffer, re.DOTALL)
+            if think_match:
+                thinking = think_match.group(1).strip()
+                remaining = accumulated_buffer.split('</think>', 1)[-1].strip()
+                thinking_complete = True
+                yield {"type": "thinking", "content": thinking, "is_complete": True}
+                if remaining:
+                    answer_text = remaining
+                    yield {"type": "answer", "content": remaining}
+                accumulated_buffer = ""
+        elif not thinking_complete and "<think>" in accumulated_buffer:
+            if thinking_start < 0:
+                thinking_start = accumulated_buffer.index("<think>") + 7
+            delta = accumulated_buffer[thinking_start + thinking_sent:]
+            thinking_sent += len(delta)
+            yield {"type": "thinking", "delta": delta, "is_complete": False}
+        elif thinking_complete:
+            answer_text += token
+            yield {"type": "answer", "content": token}
+        elif len(accumulated_buffer) > 15 and "<think>" not in accumulated_buffer:
+            answer_text += accumulated_buffer
+            yield {"type": "answer", "content": accumulated_buffer}
+            accumulated_buffer = ""
+
+    if accumulated_buffer and not thinking_complete:
+        if "<think>" in accumulated_buffer:
+            if thinking_start < 0:
+                thinking_start = accumulated_buffer.index("<think>") + 7
+            yield {"type": "thinking", "delta": accumulated_buffer[thinking_start + thinking_sent:], "is_complete": False}
+        else:
+            answer_text += accumulated_buffer
+            yield {"type": "answer", "content": accumulated_buffer}
+
+    yield {"type": "done", "content": answer_text, "is_complete": True}
+
+
+def legacy_split(raw_response):
+    """Reference: the regex parsing OllamaLLM.generate_response used before split_thinking"""
+    thinking = ""
+    answer = raw_response
+    think_match = re.search(r'<think>(.*?)</think>', raw_response, re.DOTALL)
+    if think_match:
+        thinking = think_match.group(1).strip()
+        answer = raw_response.split('</think>')[-1].strip()
+    return thinking, answer
+
+
+def parser_stream(tokens):
+    parser = ThinkTagParser()
+    chunks = []
+    for token in tokens:
+        chunks.extend(parser.feed(token))
+    chunks.extend(parser.finish())
+    return chunks
+
+
+def random_tokens(rng):
+    return [rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 60))]
+
+
+def check_stream_matches_legacy(rng, runs):
+    for _ in range(runs):
+        tokens = random_tokens(rng)
+        expected = list(legacy_stream(tokens))
+        actual = parser_stream(tokens)
+        assert actual == expected, f"stream mismatch for {tokens!r}\nexpected {expected!r}\nactual   {actual!r}"
+
+
+def check_split_matches_legacy(rng, runs):
+    for _ in range(runs):
+        text = "".join(random_tokens(rng))
+        assert split_thinking(text) == legacy_split(text), f"split mismatch for {text!r}"
+
+
+def check_token_boundaries_do_not_matter(rng, runs):
+    """Re-splitting the same text at random points must not change the reconstructed output"""
+    for _ in range(runs):
+        text = "<think>" + "".join(rng.choice(WORDS) for _ in range(40)) + "</think>final answer text"
+        cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, min(30, len(text) - 1))))
+        tokens = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        chunks = parser_stream(tokens)
+        thinking = [c["content"] for c in chunks if c["type"] == "thinking" and c["is_complete"]]
+        assert thinking == [split_thinking(text)[0]], f"thinking differs for {tokens!r}"
+        assert chunks[-1]["content"].replace(" ", "") == "finalanswertext", f"answer differs for {tokens!r}"
+
+
+def main():
+    rng = random.Random(int(os.environ.get("SEED", "1234")))
+    runs = int(os.environ.get("RUNS", "5000"))
+    check_stream_matches_legacy(rng, runs)
+    check_split_matches_legacy(rng, runs)
+    check_token_boundaries_do_not_matter(rng, runs // 10)
+    print(f"ThinkTagParser matches the legacy parser on {runs} random streams")
+
+
+if __name__ == "__main__":
+    main()
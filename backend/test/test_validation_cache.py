@@ -0,0 +1,67 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dspy.utils import DummyLM
+
+from result_cache import TTLCache
+from validation_utils import ResponseValidator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def check_ttl_cache():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=2, ttl=10, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1          # "a" is now most recently used
+    cache.put("c", 3)                   # so "b" is evicted
+    assert cache.get("b") is None and cache.get("c") == 3
+    clock.now = 11
+    assert cache.get("a") is None       # expired
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]) == (2, 2, 1, 1), stats
+    print(f"TTLCache: {stats}")
+
+
+def check_validator():
+    validator = ResponseValidator("./data/data.txt")
+    program = validator._get_program()
+    answers = [{"validation": f"Matches reference {i}", "accuracy_score": str(60 + i)} for i in range(8)]
+    validator._lm = DummyLM(answers)
+
+    contexts = ["[p. 3] A compact 4-4-2 leaves the half-spaces open."]
+    prompts = [f"Overload the half-spaces, variant {i}." for i in range(8)]
+
+    # Concurrent first calls: each runs the shared program under its own LM context
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        first = list(pool.map(lambda answer: validator.validate_response(answer, contexts), prompts))
+    assert all(result["validation"].startswith("Matches reference") for result in first)
+    assert validator._program is program
+
+    # Repeats are served from the cache without calling the LM again
+    calls = len(validator._lm.history)
+    second = [validator.validate_response(answer, contexts) for answer in prompts]
+    assert second == first and len(validator._lm.history) == calls
+    stats = validator.validation_cache.stats()
+    assert stats["hits"] == len(prompts) and stats["misses"] == len(prompts), stats
+    print(f"Validator cache: {stats}")
+
+
+def main():
+    check_ttl_cache()
+    check_validator()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Ollama
+from Ollama import OllamaLLM, keep_alive_value
+from ollama_stub import OllamaStubServer
+from warmup import DONE, FAILED, PENDING, WarmStart
+
+LOAD_DELAY = 0.5
+MODELS = ("deepseek-r1:7b", "deepseek-r1:1.5b")
+
+
+def first_token_seconds(stub) -> float:
+    llm = OllamaLLM(model_name=MODELS[0], base_url=stub.base_url)
+    start = time.perf_counter()
+    chunks = llm.generate_stream("How do we press a 4-4-2?")
+    next(chunks)
+    elapsed = time.perf_counter() - start
+    chunks.close()
+    return elapsed
+
+
+def check_lazy_import():
+    # Importing the server must not import DSPy; the judge loads it on first use
+    code = "import sys, app; print('dspy' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=300,
+                            env=dict(os.environ, TACTICS_LOG_LEVEL="WARNING"))
+    assert result.stdout.strip().splitlines()[-1] == "False", result.stdout + result.stderr
+
+
+def check_warm_start():
+    with OllamaStubServer(load_delay=LOAD_DELAY) as stub:
+        cold = first_token_seconds(stub)
+    assert cold >= LOAD_DELAY, cold
+
+    Ollama.OLLAMA_KEEP_ALIVE = "30m"
+    try:
+        with OllamaStubServer(load_delay=LOAD_DELAY) as stub:
+            preloaded = []
+            warm_start = WarmStart([(stub.base_url, model) for model in MODELS], enabled=True,
+                                   preload=lambda: preloaded.append(True))
+            ready, report = warm_start.status()
+            assert not ready and report["warmup"] == PENDING, report
+            warm_start.start().join()
+            ready, report = warm_start.status()
+            assert ready and report["warmup"] == DONE and preloaded, report
+            assert all(model["loaded"] and model["load_seconds"] == LOAD_DELAY for model in report["models"].values())
+            assert "warmup" in report["cold_start_seconds"]
+            warm = first_token_seconds(stub)
+            assert warm < LOAD_DELAY / 2, warm
+            # The warm-up and the generation both ask Ollama to keep the model loaded
+            assert stub.keep_alive == ["30m"] * 3, stub.keep_alive
+    finally:
+        Ollama.OLLAMA_KEEP_ALIVE = None
+    print(f"First token: {cold * 1000:.0f} ms cold, {warm * 1000:.0f} ms after warm-up")
+
+
+def check_keep_alive():
+    assert keep_alive_value("30m") == "30m" and keep_alive_value(" 1h ") == "1h"
+    # Seconds must reach Ollama as numbers; it rejects "-1" as a duration string
+    assert keep_alive_value("-1") == -1 and isinstance(keep_alive_value("-1"), int)
+    assert keep_alive_value("300") == 300 and keep_alive_value("0.5") == 0.5
+    assert keep_alive_value("") is None and keep_alive_value(None) is None
+
+    Ollama.OLLAMA_KEEP_ALIVE = keep_alive_value("-1")
+    try:
+        with OllamaStubServer() as stub:
+            first_token_seconds(stub)
+            assert stub.keep_alive == [-1], stub.keep_alive
+    finally:
+        Ollama.OLLAMA_KEEP_ALIVE = None
+
+
+def check_not_ready():
+    # The judge model is not pulled: the warm-up fails and the server never reports ready
+    with OllamaStubServer(models=[MODELS[0]]) as stub:
+        warm_start = WarmStart([(stub.base_url, model) for model in MODELS], enabled=True)
+        warm_start.warm_up()
+        ready, report = warm_start.status()
+        assert not ready and report["warmup"] == FAILED, report
+        assert report["ollama"] == {f"{MODELS[0]}@{stub.base_url}": True, f"{MODELS[1]}@{stub.base_url}": False}
+
+
+def check_api():
+    import app as tactics_app
+
+    with OllamaStubServer() as stub:
+        tactics_app.warm_start = WarmStart([(stub.base_url, model) for model in MODELS], enabled=False)
+        client = tactics_app.app.test_client()
+        response = client.get("/api/ready")
+        assert response.status_code == 200 and response.get_json()["status"] == "ready", response.get_json()
+        assert 'tactics_cold_start_seconds{phase="import"}' in client.get("/api/metrics").get_data(as_text=True)
+    tactics_app.warm_start = WarmStart([("http://127.0.0.1:9/api", MODELS[0])], enabled=False)
+    response = tactics_app.app.test_client().get("/api/ready")
+    assert response.status_code == 503 and response.get_json()["status"] == "starting"
+
+
+def main():
+    check_lazy_import()
+    check_warm_start()
+    check_keep_alive()
+    check_not_ready()
+    check_api()
+
+
+if __name__ == "__main__":
+    main()
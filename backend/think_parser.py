@@ -0,0 +1,179 @@
+from typing import Dict, List, Tuple
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+
+# Text without any tags is flushed as answer once the buffer grows past this
+ANSWER_FLUSH_THRESHOLD = 15
+
+
+class _TagScanner:
+    """
+    Finds <think>/</think> positions in a growing buffer without rescanning it.
+
+    Only the last len(CLOSE_TAG) - 1 characters are kept between feeds so tags split
+    across token boundaries are still found; the work per feed is proportional to the
+    size of the new token.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.length = 0
+        self.open_pos = -1        # first <think>
+        self.first_close = -1     # first </think> anywhere
+        self.close_pos = -1       # first </think> after the first <think>
+        self.last_close = -1      # last </think> anywhere
+        self._tail = ""
+
+    def feed(self, token: str):
+        base = self.length - len(self._tail)
+        window = self._tail + token
+        self.length += len(token)
+
+        if self.open_pos < 0:
+            i = window.find(OPEN_TAG)
+            if i >= 0:
+                self.open_pos = base + i
+
+        # Only occurrences that end inside the new token are new
+        i = window.find(CLOSE_TAG)
+        while i >= 0:
+            pos = base + i
+            if self.first_close < 0:
+                self.first_close = pos
+            if self.close_pos < 0 and 0 <= self.open_pos and pos >= self.open_pos + len(OPEN_TAG):
+                self.close_pos = pos
+            self.last_close = pos
+            i = window.find(CLOSE_TAG, i + 1)
+
+        self._tail = window[-(len(CLOSE_TAG) - 1):]
+
+    @property
+    def thinking_start(self) -> int:
+        return self.open_pos + len(OPEN_TAG) if self.open_pos >= 0 else -1
+
+
+class ThinkTagParser:
+    """
+    Incremental parser for deepseek-r1 style "<think>...</think>answer" streams.
+
+    feed() takes one token and returns the chunks OllamaLLM.generate_stream yields for it;
+    finish() returns the trailing chunks including "done". Each token costs work
+    proportional to its own length; the buffer is only joined when the thinking section
+    closes or the stream ends.
+    """
+
+    def __init__(self):
+        self._scanner = _TagScanner()
+        self._parts: List[str] = []
+        self._thinking_sent = -1     # absolute offset up to which thinking deltas were sent
+        self._answer_parts: List[str] = []
+        self.thinking_complete = False
+        self.thinking = ""
+
+    def _buffer(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def _reset_buffer(self):
+        self._parts = []
+        self._scanner.reset()
+        self._thinking_sent = -1
+
+    def _answer(self, text: str) -> Dict:
+        self._answer_parts.append(text)
+        return {
+            "type": "answer",
+            "content": text
+        }
+
+    @property
+    def answer(self) -> str:
+        if len(self._answer_parts) > 1:
+            self._answer_parts = ["".join(self._answer_parts)]
+        return self._answer_parts[0] if self._answer_parts else ""
+
+    def feed(self, token: str) -> List[Dict]:
+        if self.thinking_complete:
+            return [self._answer(token)]
+
+        previous_length = self._scanner.length
+        self._parts.append(token)
+        self._scanner.feed(token)
+        scanner = self._scanner
+
+        if scanner.first_close >= 0:
+            # A closing tag without an opening one before it is not a thinking section yet
+            if scanner.close_pos < 0:
+                return []
+            buffer = self._buffer()
+            self.thinking = buffer[scanner.thinking_start:scanner.close_pos].strip()
+            remaining = buffer[scanner.first_close + len(CLOSE_TAG):].strip()
+            self.thinking_complete = True
+            self._reset_buffer()
+
+            chunks = [{
+                "type": "thinking",
+                "content": self.thinking,
+                "is_complete": True
+            }]
+            if remaining:
+                # Whatever answer text was flushed before the thinking section is superseded
+                self._answer_parts = []
+                chunks.append(self._answer(remaining))
+            return chunks
+
+        if scanner.open_pos >= 0:
+            if self._thinking_sent < 0:
+                self._thinking_sent = scanner.thinking_start
+            start = max(0, self._thinking_sent - previous_length)
+            self._thinking_sent = scanner.length
+            return [{
+                "type": "thinking",
+                "delta": token[start:],
+                "is_complete": False
+            }]
+
+        if scanner.length > ANSWER_FLUSH_THRESHOLD:
+            text = self._buffer()
+            self._reset_buffer()
+            return [self._answer(text)]
+
+        return []
+
+    def finish(self) -> List[Dict]:
+        chunks = []
+        if self._scanner.length and not self.thinking_complete:
+            buffer = self._buffer()
+            if self._scanner.open_pos >= 0:
+                start = self._thinking_sent if self._thinking_sent >= 0 else self._scanner.thinking_start
+                chunks.append({
+                    "type": "thinking",
+                    "delta": buffer[start:],
+                    "is_complete": False
+                })
+            else:
+                chunks.append(self._answer(buffer))
+            self._reset_buffer()
+
+        chunks.append({
+            "type": "done",
+            "content": self.answer,
+            "is_complete": True
+        })
+        return chunks
+
+
+def split_thinking(text: str) -> Tuple[str, str]:
+    """Split a complete response into (thinking, answer) in a single linear pass"""
+    scanner = _TagScanner()
+    scanner.feed(text)
+    if scanner.close_pos < 0:
+        return "", text
+    thinking = text[scanner.thinking_start:scanner.close_pos].strip()
+    # Everything after the last closing tag is the answer
+    answer = text[scanner.last_close + len(CLOSE_TAG):].strip()
+    return thinking, answer
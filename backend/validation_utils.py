@@ -1,73 +1,209 @@
-import re
 from typing import List, Dict
-import dspy
+import contextlib
+import functools
 import os
+import threading
+from ollama_session import get_default_session
+from Ollama import OLLAMA_KEEP_ALIVE
+from result_cache import TTLCache, content_hash
+from scheduler import BACKGROUND, Scheduler
+from corpus_index import CorpusIndex
+from retrieval import DEFAULT_TOKEN_BUDGET, PassageRetriever, estimate_tokens, format_citation
+from context_packer import (
+    CONTEXT_TOKEN_BUDGET, MATCHES_PER_KEYWORD, empty_pack, limit_keywords, merge_spans, pack_contexts, span_relevance
+)
+from corpus_snapshot import load_or_build
+
+KEYWORD_PROMPT = "Extract key tactical terms from this question: {question}\nReturn only the keywords separated by commas."
+
+VALIDATION_MODEL = 'ollama_chat/deepseek-r1:1.5b'
+VALIDATION_API_BASE = os.environ.get("VALIDATION_API_BASE", "http://localhost:11434")
+VALIDATION_CACHE_SIZE = int(os.environ.get("VALIDATION_CACHE_SIZE", "256"))
+VALIDATION_CACHE_TTL = float(os.environ.get("VALIDATION_CACHE_TTL", "3600"))
+
+
+@functools.lru_cache(maxsize=None)
+def validate_response_signature():
+    """The judge's DSPy signature, defined on first use: importing dspy is most of the server's import time"""
+    import dspy
+
+    class ValidateResponse(dspy.Signature):
+        """Validate if the tactical advice matches reference contexts."""
+        context = dspy.InputField(desc="Reference tactical contexts from database")
+        answer = dspy.InputField(desc="LLM generated tactical advice")
+        validation = dspy.OutputField(desc="Validation result with explanation")
+        accuracy_score = dspy.OutputField(desc="Score from 0-100")
+
+    return ValidateResponse
 
-# Add this helper function to escape regex special characters
-def escape_regex_special_chars(text):
-    """Escape special regex characters in a string to use it safely in regex patterns"""
-    special_chars = r'[\^$.|?*+(){}[]'
-    for char in special_chars:
-        text = text.replace(char, '\\' + char)
-    return text
 
 class ResponseValidator:
-    def __init__(self, data_file_path: str):
+    def __init__(self, data_file_path: str, chunks_file_path: str = None, snapshot_path: str = None,
+                 scheduler: Scheduler = None):
         self.data_file_path = data_file_path
-        with open(data_file_path, 'r') as f:
-            self.reference_text = f.read()
+        if snapshot_path:
+            # Memory-mapped indexes shared by every worker process; rebuilt if the sources changed
+            self.index, self.retriever = load_or_build(snapshot_path, data_file_path, chunks_file_path)
+        else:
+            with open(data_file_path, 'r') as f:
+                text = f.read()
+            # Built once so keyword lookups never scan the whole reference text
+            self.index = CorpusIndex(text)
+            # BM25 over the parsed PDF passages, when available, for page-cited ranked context
+            self.retriever = PassageRetriever.from_parsed_pdf(chunks_file_path) if chunks_file_path else None
+        # Kept for when a corpus library that replaced it is emptied again
+        self.pdf_retriever = self.retriever
+        # A str, or a MappedText slicing the snapshot when one is used
+        self.reference_text = self.index.text
+        self.validation_model = VALIDATION_MODEL
+        self.validation_api_base = VALIDATION_API_BASE
+        # Built on first use and shared by every request; the LM is passed per call, not configured globally
+        self._program = None
+        self._lm = None
+        self._lm_lock = threading.Lock()
+        # DSPy's own memory and disk cache (~/.dspy_cache); benchmarks turn it off so runs do not depend on earlier ones
+        self.lm_cache = True
+        self.validation_cache = TTLCache(max_entries=VALIDATION_CACHE_SIZE, ttl=VALIDATION_CACHE_TTL)
+        # Judge calls are background work: they queue behind interactive streams
+        self.scheduler = scheduler
         
     def extract_keywords(self, lm,  question: str) -> List[str]:
         """Extract keywords using local LLM"""
-        prompt = f"Extract key tactical terms from this question: {question}\nReturn only the keywords separated by commas."
-        response = lm.generate_response(prompt)
+        response = lm.generate_response(KEYWORD_PROMPT.format(question=question))
         keywords = [k.strip() for k in response['answer'].split(',')]
         return keywords
+
+    async def extract_keywords_async(self, lm, question: str) -> List[str]:
+        """Extract keywords using an async LLM client (AsyncOllamaLLM)"""
+        response = await lm.generate_response(KEYWORD_PROMPT.format(question=question))
+        return [k.strip() for k in response['answer'].split(',')]
     
     def get_context_window(self, keyword, window_size=200):
-        """Get the text surrounding a keyword for context"""
+        """Get the text surrounding the first occurrence of a keyword for context"""
         if not keyword or not self.reference_text:
             return None
         
-        # Escape special regex characters in keyword before using in regex
-        escaped_keyword = escape_regex_special_chars(keyword)
-        
         try:
-            matches = list(re.finditer(escaped_keyword, self.reference_text, re.IGNORECASE))
+            matches = self.index.find(keyword, limit=1)
             if not matches:
                 return None
-            
-            # Get the first match
-            match = matches[0]
-            start_pos = max(0, match.start() - window_size)
-            end_pos = min(len(self.reference_text), match.end() + window_size)
-            
-            return self.reference_text[start_pos:end_pos]
+            return self.index.window(matches[0], len(keyword), window_size)
         except Exception as e:
             print(f"Error finding keyword context: {str(e)}")
             return None
+
+    def get_context_windows(self, keyword, window_size=200, top_k=None) -> List[str]:
+        """
+        Get the text surrounding every occurrence of a keyword, in text order.
+        With top_k, return the best top_k instead: whole-word matches before matches
+        inside longer words, earlier before later.
+        """
+        if not keyword or not self.reference_text:
+            return []
+        
+        matches = self.index.find(keyword)
+        if top_k is not None:
+            matches = sorted(matches, key=lambda start: not self.index.is_whole_word(start, len(keyword)))[:top_k]
+        return [self.index.window(start, len(keyword), window_size) for start in matches]
     
+    def get_ranked_contexts(self, keywords: List[str], token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[str]:
+        """Reference passages for validation, most relevant first, within token_budget"""
+        return self.pack_contexts(keywords, token_budget)["contexts"]
+
+    def pack_contexts(self, keywords: List[str], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                      window_size: int = 200) -> Dict:
+        """
+        get_ranked_contexts with its context_packer report (tokens kept and saved).
+        Ranks BM25 passages when a parsed PDF was loaded; otherwise keyword windows,
+        merged where they overlap and ranked by the keywords they cover. Savings are
+        measured against the contexts sent before packing: the passages that fit in
+        DEFAULT_TOKEN_BUDGET, or the first window of every keyword.
+        """
+        all_keywords = keywords
+        keywords = limit_keywords(keywords)
+        if not keywords:
+            return empty_pack()
+        retriever = self.retriever  # swapped whole when a corpus_library sync finishes
+        if retriever is not None:
+            passages = retriever.index.search(" ".join(keywords), top_k=20)
+            previous_tokens = 0
+            used = 0
+            for passage in passages:
+                tokens = estimate_tokens(passage["text"])
+                if used + tokens <= DEFAULT_TOKEN_BUDGET:
+                    used += tokens
+                    previous_tokens += estimate_tokens(format_citation(passage))
+            return pack_contexts([(format_citation(passage), passage["score"]) for passage in passages],
+                                 token_budget, previous_tokens)
+
+        spans = []
+        for keyword in keywords:
+            for start in self.index.find(keyword, limit=MATCHES_PER_KEYWORD):
+                spans.append((max(0, start - window_size),
+                              min(len(self.reference_text), start + len(keyword) + window_size), keyword))
+        previous_tokens = sum(estimate_tokens(ctx) for keyword in all_keywords
+                              if (ctx := self.get_context_window(keyword, window_size)))
+        candidates = [(self.reference_text[span["start"]:span["end"]], span_relevance(span))
+                      for span in merge_spans(spans)]
+        return pack_contexts(candidates, token_budget, previous_tokens)
+
+    def _get_program(self):
+        with self._lm_lock:
+            if self._program is None:
+                import dspy
+                self._program = dspy.Predict(validate_response_signature())
+            return self._program
+
+    def _get_lm(self):
+        # Reuse one LM client (and its connection pool) across requests
+        with self._lm_lock:
+            if self._lm is None:
+                import dspy
+                session = get_default_session()
+                # Forwarded to Ollama by litellm, so the judge model stays loaded like the answer model
+                options = {"keep_alive": OLLAMA_KEEP_ALIVE} if OLLAMA_KEEP_ALIVE is not None else {}
+                self._lm = dspy.LM(
+                    self.validation_model,
+                    api_base=self.validation_api_base,
+                    api_key='ollama',
+                    timeout=session.timeout[1],
+                    num_retries=session.max_retries,
+                    cache=self.lm_cache,
+                    **options
+                )
+            return self._lm
+
+    def load_judge(self):
+        """Import DSPy and build the judge ahead of the first validation (see warmup)"""
+        self._get_program()
+        self._get_lm()
+
+    def _judge_slot(self):
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        # Ollama knows the model without the litellm provider prefix
+        return self.scheduler.slot(self.validation_model.split('/', 1)[-1], BACKGROUND)
+
     def validate_response(self, answer: str, contexts: List[str]) -> Dict:
-        """Validate response using DSPy"""
-        # Update OpenAI configuration
-        lm = dspy.LM('ollama_chat/deepseek-r1:1.5b', api_base='http://localhost:11434', api_key='')
-        dspy.configure(lm=lm)
-        
-        class ValidateResponse(dspy.Signature):
-            """Validate if the tactical advice matches reference contexts."""
-            context = dspy.InputField(desc="Reference tactical contexts from database")
-            answer = dspy.InputField(desc="LLM generated tactical advice")
-            validation = dspy.OutputField(desc="Validation result with explanation")
-            accuracy_score = dspy.OutputField(desc="Score from 0-100")
-        
-        validator = dspy.Predict(ValidateResponse)
-        
-        result = validator(
-            context='\n'.join(contexts),
-            answer=answer
-        )
+        """Validate response using DSPy, reusing a cached result for the same answer and contexts"""
+        context = '\n'.join(contexts)
+        key = (content_hash(answer), content_hash(context), self.validation_model)
+        cached = self.validation_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+        import dspy
+        program = self._get_program()
+        # dspy.context scopes the LM to this thread, so concurrent requests do not race on global settings
+        with dspy.context(lm=self._get_lm()), self._judge_slot():
+            result = program(
+                context=context,
+                answer=answer
+            )
         
-        return {
+        validation_result = {
             "validation": result.validation,
             "accuracy_score": result.accuracy_score
-        }
\ No newline at end of file
+        }
+        self.validation_cache.put(key, validation_result)
+        return dict(validation_result)
@@ -0,0 +1,142 @@
+"""
+Cold start: readiness reporting and an optional warm-up of the Ollama models.
+
+Ollama loads a model into memory on its first request, so without a warm-up the first
+user pays that load before seeing a token. With OLLAMA_WARMUP=1 the servers preload the
+answer model (7b) and the judge model (1.5b) at startup by sending each an empty
+prompt, which makes Ollama load it. The load uses OLLAMA_KEEP_ALIVE when it is set,
+and so does every other call, so the models stay loaded between requests. /api/ready
+answers 503 until the warm-up is done and Ollama serves both models. /api/test stays
+a plain liveness check.
+
+The time from process start to the first streamed token is measured in phases
+(import, warmup, first_token). It is reported by /api/ready and as
+tactics_cold_start_seconds on /api/metrics.
+"""
+import time
+
+# Taken before any other import here; the servers import this module first
+PROCESS_START = time.perf_counter()
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from metrics import stats_lines
+from Ollama import with_keep_alive
+from ollama_session import get_default_session
+
+OLLAMA_WARMUP = os.environ.get("OLLAMA_WARMUP", "0").strip().lower() in ("1", "true", "yes")
+READY_TIMEOUT = (1.0, 2.0)
+# Loading a 7b model from a cold disk can take a while
+WARMUP_TIMEOUT = (3.05, float(os.environ.get("OLLAMA_WARMUP_TIMEOUT", "300")))
+
+DISABLED = "disabled"
+PENDING = "pending"
+WARMING = "warming"
+DONE = "done"
+FAILED = "failed"
+
+
+def warmup_targets(llm, validator) -> List[Tuple[str, str]]:
+    """(Ollama API base URL, model) for the answer model on every backend and for the judge model"""
+    if llm.pool is not None:
+        targets = [(backend.base_url, llm.model_name) for backend in llm.pool.backends]
+    else:
+        targets = [(llm.base_url.rstrip("/"), llm.model_name)]
+    # The judge is addressed through litellm: provider prefix on the model, no /api on the base
+    judge_model = validator.validation_model.split("/", 1)[-1]
+    targets.append((validator.validation_api_base.rstrip("/") + "/api", judge_model))
+    return targets
+
+
+class WarmStart:
+    """Warm-up state and cold-start timings of one server process"""
+
+    def __init__(self, targets: List[Tuple[str, str]], session=None, enabled: bool = OLLAMA_WARMUP,
+                 preload: Callable[[], None] = None):
+        self.targets = targets
+        # In-process work to do ahead of the first request too (ResponseValidator.load_judge)
+        self.preload = preload
+        self.session = session or get_default_session()
+        self.state = PENDING if enabled else DISABLED
+        self.models: Dict[str, Dict] = {}
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str):
+        """Record the seconds from process start to the first time phase happens"""
+        with self._lock:
+            self.phases.setdefault(phase, round(time.perf_counter() - PROCESS_START, 4))
+
+    def start(self) -> Optional[threading.Thread]:
+        """Warm up in a background thread, if enabled"""
+        if self.state != PENDING:
+            return None
+        thread = threading.Thread(target=self.warm_up, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def warm_up(self):
+        self.state = WARMING
+        failed = False
+        if self.preload is not None:
+            try:
+                self.preload()
+            except Exception as e:
+                print(f"Error preloading: {str(e)}")
+                failed = True
+        for base_url, model in self.targets:
+            key = f"{model}@{base_url}"
+            start = time.perf_counter()
+            try:
+                response = self.session.post(f"{base_url}/generate", json=with_keep_alive({
+                    "model": model,
+                    "prompt": "",
+                    "stream": False
+                }), timeout=WARMUP_TIMEOUT)
+                response.raise_for_status()
+                load_duration = response.json().get("load_duration")
+                self.models[key] = {
+                    "loaded": True,
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "load_seconds": round(load_duration / 1e9, 3) if load_duration else None,
+                }
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error warming up {model} on {base_url}: {str(e)}")
+                self.models[key] = {"loaded": False, "error": str(e)}
+                failed = True
+        self.mark("warmup")
+        self.state = FAILED if failed else DONE
+
+    def _serves(self, base_url: str, model: str) -> bool:
+        try:
+            response = self.session.get(f"{base_url}/tags", timeout=READY_TIMEOUT)
+            response.raise_for_status()
+            return any(entry.get("name") == model for entry in response.json().get("models", []))
+        except (requests.RequestException, ValueError):
+            return False
+
+    def status(self) -> Tuple[bool, Dict]:
+        """(ready, report): ready once any warm-up is over and Ollama serves every model"""
+        ollama = {f"{model}@{base_url}": self._serves(base_url, model) for base_url, model in self.targets}
+        ready = self.state in (DISABLED, DONE, FAILED) and all(ollama.values())
+        with self._lock:
+            phases = dict(self.phases)
+        return ready, {
+            "status": "ready" if ready else "starting",
+            "warmup": self.state,
+            "ollama": ollama,
+            "models": self.models,
+            "cold_start_seconds": phases,
+        }
+
+    def collect_stats(self) -> List[str]:
+        with self._lock:
+            phases = dict(self.phases)
+        lines = []
+        for phase, seconds in phases.items():
+            lines.extend(stats_lines("tactics_cold_start", {"seconds": seconds}, phase=phase))
+        return lines
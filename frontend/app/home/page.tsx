@@ -25,6 +25,14 @@ export default function Home() {
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const userScrollingRef = useRef(false);
   const scrollContainerRef = useRef<HTMLDivElement>(null);
+  // Follow-up questions continue this conversation on the server
+  const sessionIdRef = useRef<string | null>(null);
+  // The stream in progress; aborting it makes the server stop the generation
+  const abortControllerRef = useRef<AbortController | null>(null);
+
+  useEffect(() => {
+    return () => abortControllerRef.current?.abort();
+  }, []);
 
   // Modified auto-scroll to respect user scrolling
   useEffect(() => {
@@ -116,14 +124,20 @@ export default function Home() {
     };
     setMessages(prev => [...prev, tempMessage]);
 
-    let abortController = new AbortController();
+    if (!sessionIdRef.current) {
+      sessionIdRef.current = crypto.randomUUID();
+    }
+
+    abortControllerRef.current?.abort();
+    const abortController = new AbortController();
+    abortControllerRef.current = abortController;
     try {
       const response = await fetch('http://127.0.0.1:5000/api/tactics', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ prompt: input }),
+        body: JSON.stringify({ prompt: input, session_id: sessionIdRef.current }),
         signal: abortController.signal
       });
 
@@ -178,8 +192,10 @@ export default function Home() {
                     : newMessages[lastIdx].content,
                   thinking: data.data.thinking || newMessages[lastIdx].thinking || '',
                   confidenceScore: data.data.update_type === 'final'
-                    ? data.data.accuracy_score 
-                    : newMessages[lastIdx].confidenceScore
+                    ? data.data.accuracy_score
+                    : data.data.update_type === 'score'
+                      ? data.data.provisional_score
+                      : newMessages[lastIdx].confidenceScore
                 };
                 
                 newMessages[lastIdx] = update;
@@ -225,10 +241,25 @@ export default function Home() {
         setMessages(prev => [...prev.slice(0, -1), errorMessage]);
       }
     } finally {
-      setIsLoading(false);
+      if (abortControllerRef.current === abortController) {
+        abortControllerRef.current = null;
+        setIsLoading(false);
+      }
     }
   };
 
+  const startNewConversation = () => {
+    // Stop the answer in progress and forget the server-side conversation
+    abortControllerRef.current?.abort();
+    abortControllerRef.current = null;
+    sessionIdRef.current = null;
+    setIsLoading(false);
+    setMessages([{
+      role: 'assistant',
+      content: "Hello! I'm your tactical soccer assistant. How can I help you today?"
+    }]);
+  };
+
   return (
     <div className="flex flex-col min-h-screen bg-gray-50">
       <nav className="bg-green-700 p-4 shadow-md sticky top-0 z-10">
@@ -254,10 +285,7 @@ export default function Home() {
               Home
             </Link>
             <button 
-              onClick={() => setMessages([{
-                role: 'assistant',
-                content: "Hello! I'm your tactical soccer assistant. How can I help you today?"
-              }])}
+              onClick={startNewConversation}
               className="bg-green-600 hover:bg-green-800 text-white px-3 py-2 rounded-md transition-colors"
               title="Start New Conversation"
             >